@@ -7,6 +7,7 @@ import os.path
 
 import pandas as pd
 
+from analysis_code.proteins import get_residue_position_array
 from quantiative_plot_utilities import create_plots_from_peptide_lists
 
 """
@@ -22,7 +23,7 @@ MODIFICATIONS: dict = {
     79.957: "SSulfonic",
     91.957: "SO3"
 }
-POSITIONS = [105, 137, 163]
+POSITIONS = get_residue_position_array("CRT", "C").tolist()
 
 
 def _combine_and_clean_modifications(raw_df: pd.DataFrame) -> pd.DataFrame:
@@ -4,8 +4,12 @@ Description: Find the methionine and proline and plot them in a bar chart.
 
 # Import packages
 import os.path
+from typing import List, Tuple, Union
 
-from quantiative_plot_utilities import create_plots_from_peptide_lists
+from analysis_code.proteins import get_protein_sequence, get_residue_position_array, get_signal_peptide_length
+from analysis_code.residue_count_store import ResidueCountStore
+from quantiative_plot_utilities import add_peptide_lists_to_count_store, create_plots_from_count_store, \
+    create_plots_from_peptide_lists
 
 """
 The modification dictionary and the cysteine positions, which are specific for CRT.
@@ -13,12 +17,40 @@ The modification dictionary and the cysteine positions, which are specific for C
 MODIFICATIONS: dict = {
     15.995: "Oxidation"
 }
-POSITIONS = [19, 83, 114, 122, 131, 134, 139, 178, 204, 205, 211, 216, 228, 233, 239, 243, 245, 250, 257, 263, 264, 269,
-             277, 283, 292, 297, 301, 303, 357, 410]
+POSITIONS = (get_residue_position_array("CRT", "MP", mature=True) + get_signal_peptide_length("CRT")).tolist()
+
+
+def create_plots(file_data: List[Tuple[str, str, None]], experiment: str, count_store_directory: Union[str, None]):
+    """
+    Create the plots of the peptide lists, possibly through a residue count store.
+
+    :param file_data: The list of tuples with the name of the peptide list, the condition and the sheet name.
+    :param experiment: The experiment name in the residue count store.
+    :param count_store_directory: The residue count store directory. If None, the plots are created from the peptide
+        lists; Otherwise, the lists which are not in the store yet are counted into it and the plots are created from
+        the store, so the lists are only read once.
+    """
+    if count_store_directory is None:
+        create_plots_from_peptide_lists(peptide_lists=file_data, modifications=MODIFICATIONS,
+                                        modification_position=POSITIONS, combine_function=None, labels=None)
+        return
+
+    # The lists are in the precursor numbering like the positions
+    store: ResidueCountStore = ResidueCountStore.open_or_create(count_store_directory,
+                                                                length=len(get_protein_sequence("CRT")),
+                                                                modifications=MODIFICATIONS, protein="CRT")
+    add_peptide_lists_to_count_store(store=store, peptide_lists=file_data, experiment=experiment)
+    conditions: List[str] = [condition for _, condition, _ in file_data]
+    create_plots_from_count_store(store=store, conditions=[f"{experiment}/{condition}" for condition in conditions],
+                                  titles=conditions, modification_position=POSITIONS, combine_function=None,
+                                  labels=None)
+
 
 if __name__ == '__main__':
     
     BASE_FILE_PATH = r""
+    # The residue count store directory, or None to read the peptide lists every time
+    COUNT_STORE_DIRECTORY = None
     conditions_n14 = [['Tryp_rCrt14_Cys', 'A) Trypsin rCrt14 (rCRT)'], ['Tryp_pCrt14_Cys', 'B) Trypsin pCrt14 (pCRT)'],
                       ['Mix_37', 'C) 37 °C (pCRT)'], ['Mix_42', 'D) 42 °C (pCRT)'],
                       ['Mix_42_Zn', 'E) 42 °C + Zn (pCRT)']]
@@ -34,15 +66,11 @@ if __name__ == '__main__':
     file_data_n14: list = []
     for condition in conditions_n14:
         file_data_n14.append((os.path.join(BASE_FILE_PATH, condition[0]), condition[1], None))
-    create_plots_from_peptide_lists(peptide_lists=file_data_n14, modifications=MODIFICATIONS,
-                                    modification_position=POSITIONS,
-                                    combine_function=None, labels=None)
+    create_plots(file_data=file_data_n14, experiment="N14", count_store_directory=COUNT_STORE_DIRECTORY)
     
     # Create the plot for 15N data
     file_data_n15: list = []
     for condition in conditions_n15:
         file_data_n15.append((os.path.join(BASE_FILE_PATH, condition[0]), condition[1], None))
 
-    create_plots_from_peptide_lists(peptide_lists=file_data_n15, modifications=MODIFICATIONS,
-                                    modification_position=POSITIONS,
-                                    combine_function=None, labels=None)
+    create_plots(file_data=file_data_n15, experiment="N15", count_store_directory=COUNT_STORE_DIRECTORY)
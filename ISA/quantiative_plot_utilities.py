@@ -5,24 +5,35 @@ Description: Utility functions for creating the quantitative plots.
 import math
 from typing import List, Tuple, Dict, Callable, Union
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from analysis_code.coverage import calculate_residue_coverage
+from analysis_code.instrumentation import trace_stage
+from analysis_code.mass_index import DEFAULT_MASS_TOLERANCE, create_mass_index
+from analysis_code.modification_table import ModificationTable, parse_modifications
+from analysis_code.peptide_list_cache import read_peptide_list
+from analysis_code.prefetch import DEFAULT_PREFETCH, iterate_prefetched
+from analysis_code.rendering import show_or_save_figure
+from analysis_code.residue_count_store import ResidueCountStore
 
-def _find_modifications(hits_df: pd.DataFrame, positions: List[int], modification_dict: Dict[float, str]) \
-        -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+
+def _find_modifications(hits_df: pd.DataFrame, positions: List[int], modification_dict: Dict[float, str],
+                        tolerance: float = DEFAULT_MASS_TOLERANCE) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     Find the modifications in the given peptide DataFrame.
 
     :param hits_df: The hits found hits.
     :param positions: The list of positions available for modification.
     :param modification_dict: The dictionary with the modification mass and the name.
+    :param tolerance: The mass tolerance in Da.
     :return: The tuple containing DataFrames with position, modifications for the absolute and percentage values,
         and the total peptide count, respectively.
     """
     # Get the modifications  and filter them
     modifications: list = _parse_and_filter_modifications(modifications=hits_df['modifs'], positions=positions,
-                                                          modification_dict=modification_dict)
+                                                          modification_dict=modification_dict, tolerance=tolerance)
     # Count the number of modifications at each position.
     modification_count: dict = {}
     for pos in positions:
@@ -54,29 +65,22 @@ def _find_modifications(hits_df: pd.DataFrame, positions: List[int], modificatio
 
 
 def _parse_and_filter_modifications(modifications: pd.Series, positions: List[int],
-                                    modification_dict: Dict[float, str]) -> List[tuple]:
+                                    modification_dict: Dict[float, str],
+                                    tolerance: float = DEFAULT_MASS_TOLERANCE) -> List[tuple]:
     """
-    Parse and filter the modifications.
+    Parse and filter the modifications. Modifications without a known mass within the tolerance are skipped.
 
     :param modifications: The Series containing the modifications found in the hits.
     :param positions: The list of positions.
+    :param modification_dict: The dictionary with the modification mass and the name.
+    :param tolerance: The mass tolerance in Da.
     :return: The list containing tuples with the modification position and the modification type.
     """
-    mods_raw = [mod for mod in list(modifications) if mod != '-']
-    mod_temp: list = []
-    # Get all the modifications even if the multiple exist for one peptide
-    for mod_raw in mods_raw:
-        if ' ' in mod_raw:
-            mods = str.split(' ')
-            for mod in mods:
-                mod_temp.append(mod)
-        else:
-            mod_temp.append(mod_raw)
-
-    # Split the modifications into residue nad mass
-    modifications_list = [str.split(mod, sep='@') for mod in mod_temp]
+    mod_table: ModificationTable = parse_modifications(modifications)
     # Get the modification position and type
-    return [(mod[0], modification_dict[float(mod[1])]) for mod in modifications_list if int(mod[0]) in positions]
+    mod_names: np.ndarray = create_mass_index(modification_dict).lookup_names(mod_table.masses, tolerance=tolerance)
+    selected: np.ndarray = np.isin(mod_table.positions, [int(pos) for pos in positions]) & (mod_names != None)
+    return [(str(pos), name) for pos, name in zip(mod_table.positions[selected], mod_names[selected])]
 
 
 def _count_peptides(hits_df: pd.DataFrame, positions: List[int]) -> dict:
@@ -87,27 +91,22 @@ def _count_peptides(hits_df: pd.DataFrame, positions: List[int]) -> dict:
     :param positions: The list of positions available for modification.
     :return: The number of peptide for each position.
     """
-    counts: dict = {}
-
-    for pos in positions:
-        counts[pos] = 0
+    coverage: pd.DataFrame = calculate_residue_coverage(starts=hits_df['from'], ends=hits_df['to'],
+                                                       length=max([int(pos) for pos in positions], default=0))
 
-    for start_pos, end_pos in zip(hits_df['from'], hits_df['to']):
-        for pos in positions:
-            if start_pos <= int(pos) <= end_pos:
-                counts[pos] += 1
-
-    return counts
+    return {pos: int(coverage.at[int(pos), 'Hits']) for pos in positions}
 
 
 def _create_plot(mod_dict: Dict[str, Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]], labels: Union[List[str], None],
-                 max_y: int):
+                 max_y: int, output_directory: Union[str, None] = None, file_name: str = "modification_plot"):
     """
     Create plot.
 
     :param mod_dict: The dictionary with the condition name and the count and percentage, and total count DataFrames.
     :param labels: The list of labels. If None, no legend will be shown.
     :param max_y: The maximum y-value.
+    :param output_directory: The directory where the plot is saved. If None, the plot is shown.
+    :param file_name: The file name of the saved plot without the suffix.
     """
     # Create the subplots
     fig, ax = plt.subplots(nrows=len(mod_dict), sharex='all', figsize=(20 * 1 / 2.54, 20 * 1 / 2.54))
@@ -143,12 +142,56 @@ def _create_plot(mod_dict: Dict[str, Tuple[pd.DataFrame, pd.DataFrame, pd.DataFr
     if labels is not None:
         fig.legend(loc='lower center', ncol=len(labels), labels=labels)
     plt.tight_layout(pad=0.5)
-    plt.show()
+    show_or_save_figure(figure=fig, output_directory=output_directory, file_name=file_name)
+
+
+def _prepare_plot_tables(mod_df_raw: pd.DataFrame, percentage_df_raw: pd.DataFrame, peptide_count_df: pd.DataFrame,
+                         combine_function: Union[Callable, None]) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Combine the columns of the count and percentage DataFrames and sort the DataFrames by the position.
+
+    :param mod_df_raw: The modification counts.
+    :param percentage_df_raw: The modification percentages.
+    :param peptide_count_df: The total peptide counts.
+    :param combine_function: The function which can be used for combining columns etc.
+    :return: The tuple with the count, percentage and total count DataFrames.
+    """
+    # Combine if a combine function is given.
+    if combine_function is not None:
+        mod_df = combine_function(mod_df_raw)
+        percentage_df = combine_function(percentage_df_raw)
+    else:
+        mod_df = mod_df_raw
+        percentage_df = percentage_df_raw
+
+    mod_df.index = [int(idx) for idx in mod_df.index]
+    mod_df = mod_df.sort_index()
+    percentage_df.index = [int(idx) for idx in percentage_df.index]
+    percentage_df = percentage_df.sort_index()
+    peptide_count_df.index = [int(idx) for idx in peptide_count_df.index]
+    peptide_count_df = peptide_count_df.sort_index()
+    return mod_df, percentage_df, peptide_count_df
+
+
+def _read_hits(peptide_list: Tuple[str, str, str]) -> pd.DataFrame:
+    """
+    Read the hits of a peptide list.
+
+    :param peptide_list: The tuple with the name of the peptide list, the condition and the sheet name. If sheet name
+        is None, 'Sheet1' is used.
+    :return: The hits.
+    """
+    return read_peptide_list(f"{peptide_list[0]}.xlsx",
+                             sheet_name=peptide_list[2] if peptide_list[2] is not None else 'Sheet1',
+                             usecols=["V", "modifs", "from", "to", "seq"])
 
 
 def create_plots_from_peptide_lists(peptide_lists: List[Tuple[str, str, str]], modifications: Dict[float, str],
                                     modification_position: List[int], combine_function: Union[Callable, None],
-                                    labels: Union[List[str], None], max_y: int = 100):
+                                    labels: Union[List[str], None], max_y: int = 100,
+                                    tolerance: float = DEFAULT_MASS_TOLERANCE,
+                                    output_directory: Union[str, None] = None, file_name: str = "modification_plot",
+                                    prefetch: int = DEFAULT_PREFETCH):
     """
     Create plots from the a list of peptide lists
 
@@ -159,36 +202,81 @@ def create_plots_from_peptide_lists(peptide_lists: List[Tuple[str, str, str]], m
     :param combine_function: The function which can be used for combining columns etc.
     :param labels: The labels to be used in the plot.
     :param max_y: The maximum y-value shown in the plot. Default 100.
+    :param tolerance: The mass tolerance in Da used to match the modifications.
+    :param output_directory: The directory where the plot is saved. If None, the plot is shown.
+    :param file_name: The file name of the saved plot without the suffix.
+    :param prefetch: The number of peptide lists read ahead on background threads.
     """
     modification_files: Dict[str, Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]] = {}
-    for peptide_list in peptide_lists:
-        hits: pd.DataFrame = pd.read_excel(io=f"{peptide_list[0]}.xlsx",
-                                           sheet_name=peptide_list[2] if peptide_list[2] is not None else 'Sheet1',
-                                           usecols=["V", "modifs", "from", "to", "seq"])
-
+    # The next peptide lists are read while the modifications of the current list are found
+    for peptide_list, hits in iterate_prefetched(function=_read_hits, items=peptide_lists, prefetch=prefetch):
         # Remove invalid peptides
         hits = hits[hits['V'] == "Y"]
         # Get the mods and the modifications percentages.
-        mod_df_raw, percentage_df_raw, peptide_count_df = _find_modifications(hits_df=hits,
-                                                                              positions=modification_position,
-                                                                              modification_dict=modifications)
-
-        # Combine if a combine function is given.
-        if combine_function is not None:
-            mod_df = combine_function(mod_df_raw)
-            percentage_df = combine_function(percentage_df_raw)
-        else:
-            mod_df = mod_df_raw
-            percentage_df = percentage_df_raw
-
-        mod_df.index = [int(idx) for idx in mod_df.index]
-        mod_df = mod_df.sort_index()
-        percentage_df.index = [int(idx) for idx in percentage_df.index]
-        percentage_df = percentage_df.sort_index()
-        peptide_count_df.index = [int(idx) for idx in peptide_count_df.index]
-        peptide_count_df = peptide_count_df.sort_index()
-
-        modification_files[peptide_list[1]] = (mod_df, percentage_df, peptide_count_df)
+        with trace_stage("find_modifications", category="aggregate", file=f"{peptide_list[0]}.xlsx", rows=len(hits)):
+            mod_df_raw, percentage_df_raw, peptide_count_df = _find_modifications(hits_df=hits,
+                                                                                  positions=modification_position,
+                                                                                  modification_dict=modifications,
+                                                                                  tolerance=tolerance)
+
+        modification_files[peptide_list[1]] = _prepare_plot_tables(
+            mod_df_raw=mod_df_raw, percentage_df_raw=percentage_df_raw, peptide_count_df=peptide_count_df,
+            combine_function=combine_function)
+
+    # Create the plots
+    with trace_stage("modification_plot", category="plot", rows=len(modification_files)):
+        _create_plot(mod_dict=modification_files, labels=labels, max_y=max_y, output_directory=output_directory,
+                     file_name=file_name)
+
+
+def add_peptide_lists_to_count_store(store: ResidueCountStore, peptide_lists: List[Tuple[str, str, str]],
+                                     experiment: Union[str, None] = None, replace: bool = False,
+                                     prefetch: int = DEFAULT_PREFETCH):
+    """
+    Count the valid hits of the peptide lists into a residue count store, so the plots can be created from the store
+    without reading the peptide lists again.
+
+    :param store: The residue count store, which must have the modifications of the plots.
+    :param peptide_lists: The list of tuples containing the name of the peptide list and the condition and the
+        sheet name. If sheet name is None, 'Sheet1' is used. The condition is used as the condition name in the store.
+    :param experiment: The experiment name in the store.
+    :param replace: If True, existing conditions are replaced; Otherwise, they are skipped.
+    :param prefetch: The number of peptide lists read ahead on background threads.
+    """
+    existing: set = set(store.conditions)
+    peptide_lists = [peptide_list for peptide_list in peptide_lists if replace or
+                     (peptide_list[1] if experiment is None else f"{experiment}/{peptide_list[1]}") not in existing]
+    for peptide_list, hits in iterate_prefetched(function=_read_hits, items=peptide_lists, prefetch=prefetch):
+        hits = hits[hits['V'] == "Y"].rename(columns={"from": "Start", "to": "End", "modifs": "Modification"})
+        store.add_condition(peptide_list=hits, name=peptide_list[1], experiment=experiment, replace=replace)
+
+
+def create_plots_from_count_store(store: ResidueCountStore, conditions: List[str], modification_position: List[int],
+                                  combine_function: Union[Callable, None], labels: Union[List[str], None],
+                                  max_y: int = 100, output_directory: Union[str, None] = None,
+                                  file_name: str = "modification_plot", titles: Union[List[str], None] = None):
+    """
+    Create plots from the counts of a residue count store.
+
+    :param store: The residue count store.
+    :param conditions: The condition keys in the store.
+    :param modification_position: The list of position available for modification.
+    :param combine_function: The function which can be used for combining columns etc.
+    :param labels: The labels to be used in the plot.
+    :param max_y: The maximum y-value shown in the plot. Default 100.
+    :param output_directory: The directory where the plot is saved. If None, the plot is shown.
+    :param file_name: The file name of the saved plot without the suffix.
+    :param titles: The plot title of each condition. If None, the condition keys are used.
+    """
+    modification_files: Dict[str, Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]] = {}
+    for condition, title in zip(conditions, titles if titles is not None else conditions):
+        mod_df_raw, percentage_df_raw, peptide_count_df = store.get_condition_tables(condition=condition,
+                                                                                    positions=modification_position)
+        modification_files[title] = _prepare_plot_tables(
+            mod_df_raw=mod_df_raw.astype(np.int64), percentage_df_raw=percentage_df_raw,
+            peptide_count_df=peptide_count_df.astype(np.int64), combine_function=combine_function)
 
     # Create the plots
-    _create_plot(mod_dict=modification_files, labels=labels, max_y=max_y)
+    with trace_stage("modification_plot", category="plot", rows=len(modification_files)):
+        _create_plot(mod_dict=modification_files, labels=labels, max_y=max_y, output_directory=output_directory,
+                     file_name=file_name)
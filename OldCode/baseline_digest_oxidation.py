@@ -1,10 +1,12 @@
-import re
 from typing import List, Tuple, Dict
 
 from matplotlib.axes import Axes
 import matplotlib.pyplot as plt
 import seaborn as sns
+import numpy as np
 import pandas as pd
+from analysis_code.coverage import calculate_residue_coverage
+from analysis_code.modification_table import ModificationTable, parse_modifications
 from analysis_code.utils import get_residue_positions
 
 
@@ -46,16 +48,10 @@ def get_positions_and_total_spectra(peptide_list: pd.DataFrame, residues: str) \
     """
     residues: List[Tuple[int, str]] = get_residue_positions(residues=residues)
     residues = [(res_num, res) for res_num, res in residues if res_num > 17]
-    total_position_spectra: Dict[str, int] = {r: 0 for _, r in residues}
-
-    for idx, row in peptide_list.iterrows():
-        start_position: int = row["Start"]
-        end_position: int = row["End"]
-        spectra: int = row["Spectra"]
-
-        for res_num, res in residues:
-            if start_position <= res_num <= end_position:
-                total_position_spectra[res] += spectra
+    coverage: pd.DataFrame = calculate_residue_coverage(starts=peptide_list["Start"], ends=peptide_list["End"],
+                                                       spectra=peptide_list["Spectra"],
+                                                       length=max([res_num for res_num, _ in residues], default=0))
+    total_position_spectra: Dict[str, int] = {res: int(coverage.at[res_num, "Spectra"]) for res_num, res in residues}
 
     return residues, total_position_spectra
 
@@ -68,11 +64,12 @@ def analyse_methionine_proline_cysteine_oxidation(peptide_list: pd.DataFrame):
     :return:
     """
     residues, total_position_spectra = get_positions_and_total_spectra(peptide_list=peptide_list, residues="MPC")
-    oxidation_spectra_count: Dict[str, int] = {k: 0 for k in total_position_spectra.keys()}
-
-    for idx, row in peptide_list.iterrows():
-        for match in re.finditer("([MPC][0-9]{1,3})", row["Modification"]):
-            oxidation_spectra_count[match.group(1)] += row["Spectra"]
+    mod_table: ModificationTable = parse_modifications(peptide_list["Modification"])
+    residue_numbers: List[int] = [res_num for res_num, _ in residues]
+    position_spectra: np.ndarray = mod_table.count_per_position(np.isin(mod_table.positions, residue_numbers),
+                                                                weights=peptide_list["Spectra"].to_numpy(),
+                                                                length=max(residue_numbers, default=0))
+    oxidation_spectra_count: Dict[str, int] = {res: int(position_spectra[res_num]) for res_num, res in residues}
 
     percentage_spectra_count: Dict[str, float] = {
         k: [(round(oxidation_spectra_count[k] / float(total_position_spectra[k]) * 100,
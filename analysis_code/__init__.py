@@ -3,7 +3,47 @@ The package containing the final analysis code for the master thesis.
 """
 from .convert_peptide_list import convert_peptide_list_files
 
+from .instrumentation import enable_instrumentation, export_trace, instrumented_run, summarize_trace, trace_stage
+
+from .peptide_list_cache import read_peptide_list, clear_peptide_list_cache, set_peptide_list_cache_enabled
+
+from .prefetch import iterate_peptide_lists, iterate_prefetched
+
+from .coverage import calculate_residue_coverage
+
+from .digestion import DigestionSettings, digest_sequences, get_theoretical_coverage
+
+from .mass_index import MassIndex, create_mass_index
+
+from .modification_table import ModificationTable, parse_modifications
+
+from .peptide_table import PeptideTable, read_peptide_table
+
+from .hit_store import HitStore
+
+from .residue_count_store import ResidueCountStore
+
+from .proteins import find_protein_name, get_protein_sequence, get_residue_position_array, get_signal_peptide_length, \
+    register_fasta
+
 from .utils import get_residue_positions, get_residue_name
 
+from .confidence_intervals import add_confidence_intervals, calculate_confidence_intervals, draw_error_bars
+
 from .modification_statistics import combine_spectra_in_peptide_lists, calculate_modification_percentages,\
-    create_modification_barplot
+    calculate_modification_statistics, create_modification_barplot, split_modification_statistics
+
+from .chunked_csv import iterate_csv_chunks
+
+from .hit_statistics import calculate_hit_statistics, read_hit_lists
+
+from .ptm_profile import calculate_ptm_percentages, find_ptm_conditions, melt_ptm_percentages, read_ptm_percentages, \
+    read_ptm_profile
+
+from .ptm_plots import create_ptm_plots
+
+from .rendering import headless_backend, render_figures, show_or_save_figure, use_headless_backend
+
+from .result_sinks import ResultSink, get_result_files, open_result_sink, read_result_tables, write_result
+
+from .pipeline import run_pipeline
@@ -0,0 +1,33 @@
+"""
+Reading of large CSV exports (Fx. ptmprofile.csv or peptide lists exported as CSV) in chunks of bounded size, so the
+memory use is given by the chunk size instead of the file size.
+"""
+import pathlib
+from typing import Iterator, List, Optional, Union
+
+import pandas as pd
+
+from .instrumentation import trace_stage
+
+DEFAULT_CHUNK_SIZE: int = 50000
+
+
+def iterate_csv_chunks(file: Union[str, pathlib.Path], columns: Optional[List[str]] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE, **read_kwargs) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV file in chunks.
+
+    :param file: The CSV file.
+    :param columns: The columns to read. If None, all the columns are read.
+    :param chunk_size: The number of rows in each chunk.
+    :param read_kwargs: The keyword arguments for 'pd.read_csv'.
+    :return: The iterator of chunks. The index continues over the chunks like reading the whole file.
+    """
+    with pd.read_csv(file, usecols=columns, chunksize=chunk_size, **read_kwargs) as reader:
+        while True:
+            with trace_stage("read_csv_chunk", category="io", file=file) as stage:
+                chunk: Optional[pd.DataFrame] = next(reader, None)
+                stage["rows"] = len(chunk) if chunk is not None else 0
+            if chunk is None:
+                return
+            yield chunk
@@ -0,0 +1,143 @@
+"""
+Confidence intervals of the modification percentages.
+
+The intervals of all the positions and conditions are calculated at once as array operations. The Wilson score
+interval is calculated in closed form, and the bootstrap interval resamples the modified count of every row from its
+binomial distribution as a row x resample matrix and takes the percentiles of each row.
+"""
+import statistics
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CI_METHODS: Tuple[str, ...] = ("wilson", "bootstrap")
+DEFAULT_CI_METHOD: str = "wilson"
+DEFAULT_CONFIDENCE: float = 0.95
+DEFAULT_RESAMPLES: int = 2000
+LOWER_COLUMN: str = "PercentageLower"
+UPPER_COLUMN: str = "PercentageUpper"
+# The maximum number of values in the resample matrix, the rows are resampled in chunks above it
+MAX_RESAMPLE_VALUES: int = 10_000_000
+
+
+def calculate_confidence_intervals(modified, total, method: str = DEFAULT_CI_METHOD,
+                                   confidence: float = DEFAULT_CONFIDENCE, resamples: int = DEFAULT_RESAMPLES,
+                                   seed: Optional[int] = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the confidence intervals of the percentages modified/total. Rows with a total of 0 have the interval
+    (0, 0), like their percentage.
+
+    :param modified: The modified counts.
+    :param total: The total counts.
+    :param method: 'wilson' for the Wilson score interval or 'bootstrap' for the binomial bootstrap interval.
+    :param confidence: The confidence level. Fx. 0.95.
+    :param resamples: The number of bootstrap resamples.
+    :param seed: The seed of the bootstrap resampling.
+    :return: The tuple with the lower and the upper bound of each row in percent.
+    """
+    modified = np.asarray(modified, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+    if method not in CI_METHODS:
+        raise ValueError(f"Unknown confidence interval method '{method}'. The methods are: {', '.join(CI_METHODS)}")
+
+    counted: np.ndarray = total > 0
+    proportions: np.ndarray = np.divide(modified, total, out=np.zeros_like(modified), where=counted)
+    if method == "wilson":
+        lower, upper = _wilson_interval(proportions=proportions, total=total, confidence=confidence)
+    else:
+        lower, upper = _bootstrap_interval(proportions=proportions, total=total, confidence=confidence,
+                                           resamples=resamples, seed=seed)
+
+    return np.where(counted, lower * 100, 0), np.where(counted, upper * 100, 0)
+
+
+def add_confidence_intervals(data: pd.DataFrame, method: str = DEFAULT_CI_METHOD,
+                             confidence: float = DEFAULT_CONFIDENCE, modified_column: str = "ModifiedSpectra",
+                             total_column: str = "TotalModSpectra", **kwargs) -> pd.DataFrame:
+    """
+    Add the confidence interval columns ('PercentageLower' and 'PercentageUpper') of the percentages to a data frame.
+    The bounds are rounded to two decimals like the percentages.
+
+    :param data: The data frame with the modified and the total counts.
+    :param method: 'wilson' or 'bootstrap' (See 'calculate_confidence_intervals').
+    :param confidence: The confidence level.
+    :param modified_column: The column with the modified counts.
+    :param total_column: The column with the total counts.
+    :param kwargs: The keyword arguments for 'calculate_confidence_intervals'. Fx. 'resamples' and 'seed'.
+    :return: The data frame with the interval columns.
+    """
+    lower, upper = calculate_confidence_intervals(modified=data[modified_column].to_numpy(),
+                                                  total=data[total_column].to_numpy(), method=method,
+                                                  confidence=confidence, **kwargs)
+    return data.assign(**{LOWER_COLUMN: np.round(lower, 2), UPPER_COLUMN: np.round(upper, 2)})
+
+
+def draw_error_bars(axes, data: pd.DataFrame, value_column: str = "Percentage") -> np.ndarray:
+    """
+    Draw the confidence intervals as error bars on the bars of a bar plot with a bar per row of the data. The y-axis
+    is extended to leave room for labels above the error bars.
+
+    :param axes: The axes with the bar plot.
+    :param data: The data with the percentages and the interval columns.
+    :param value_column: The column with the bar heights.
+    :return: The top of each bar or error bar, which can be used to place labels above the bars.
+    """
+    values: np.ndarray = data[value_column].to_numpy(dtype=np.float64)
+    if LOWER_COLUMN not in data.columns or UPPER_COLUMN not in data.columns:
+        return values
+    lower: np.ndarray = data[LOWER_COLUMN].to_numpy(dtype=np.float64)
+    upper: np.ndarray = data[UPPER_COLUMN].to_numpy(dtype=np.float64)
+    # The bounds are rounded separately from the percentages, so the error lengths are clipped at 0
+    axes.errorbar(x=np.arange(len(values)), y=values,
+                  yerr=np.vstack((np.clip(values - lower, 0, None), np.clip(upper - values, 0, None))),
+                  fmt="none", ecolor="black", elinewidth=1, capsize=4)
+    tops: np.ndarray = np.fmax(values, upper)
+    if len(tops) > 0 and np.isfinite(tops).any():
+        axes.set_ylim(top=max(axes.get_ylim()[1], np.nanmax(tops) * 1.2))
+    return tops
+
+
+def _wilson_interval(proportions: np.ndarray, total: np.ndarray,
+                     confidence: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the Wilson score intervals.
+
+    :param proportions: The proportions.
+    :param total: The total counts.
+    :param confidence: The confidence level.
+    :return: The tuple with the lower and the upper bounds as proportions.
+    """
+    z: float = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    total = np.where(total > 0, total, 1)
+    denominator: np.ndarray = 1 + z ** 2 / total
+    center: np.ndarray = (proportions + z ** 2 / (2 * total)) / denominator
+    margin: np.ndarray = z * np.sqrt(proportions * (1 - proportions) / total + z ** 2 / (4 * total ** 2)) / denominator
+    return np.clip(center - margin, 0, 1), np.clip(center + margin, 0, 1)
+
+
+def _bootstrap_interval(proportions: np.ndarray, total: np.ndarray, confidence: float, resamples: int,
+                        seed: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the percentile intervals of the binomial bootstrap. The modified count of each row is resampled from its
+    binomial distribution, so the rows are resampled in a row x resample matrix without a loop over the rows.
+
+    :param proportions: The proportions.
+    :param total: The total counts.
+    :param confidence: The confidence level.
+    :param resamples: The number of resamples.
+    :param seed: The seed of the random generator.
+    :return: The tuple with the lower and the upper bounds as proportions.
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    counts: np.ndarray = total.astype(np.int64)
+    divisors: np.ndarray = np.where(counts > 0, counts, 1)[:, np.newaxis]
+    lower: np.ndarray = np.zeros(len(counts))
+    upper: np.ndarray = np.zeros(len(counts))
+    chunk_size: int = max(1, MAX_RESAMPLE_VALUES // max(resamples, 1))
+    for start in range(0, len(counts), chunk_size):
+        rows: slice = slice(start, start + chunk_size)
+        samples: np.ndarray = rng.binomial(counts[rows, np.newaxis], proportions[rows, np.newaxis],
+                                           size=(len(counts[rows]), resamples)) / divisors[rows]
+        lower[rows], upper[rows] = np.quantile(samples, [(1 - confidence) / 2, (1 + confidence) / 2], axis=1)
+    return lower, upper
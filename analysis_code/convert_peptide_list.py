@@ -1,7 +1,9 @@
 import pandas as pd
 import pathlib
+from typing import Dict, Optional
 
-import tqdm
+from .parallel import process_files
+from .result_sinks import write_result
 
 
 def _convert_peptide_list_file(peptide_list_file) -> None:
@@ -19,19 +21,22 @@ def _convert_peptide_list_file(peptide_list_file) -> None:
     peptide_list = peptide_list[peptide_list['V'] == 'Y']
     peptide_list = peptide_list.set_index("spec id")
     # Save the list to an excel file.
-    peptide_list.to_excel(output_file_name)
+    write_result(peptide_list, output_file_name)
 
 
-def convert_peptide_list_files(peptide_list_directory: str) -> None:
+def convert_peptide_list_files(peptide_list_directory: str, workers: Optional[int] = None) \
+        -> Dict[pathlib.Path, Exception]:
     """
     Convert peptide list files in a directory from the the old Excel (XLS) to new Excel (XLSX) format.
     The files are created in the same directory.
 
     :param peptide_list_directory: The peptide list directory.
+    :param workers: The number of worker processes. If None, the files are converted one at a time.
+    :return: The dictionary with the file and the error for each of the files which could not be converted.
     """
     # Get the files
     directory = pathlib.Path(peptide_list_directory)
     files = [directory / file for file in directory.glob("*.xls") if file.is_file()]
     # Convert each of the files
-    for file in tqdm.tqdm(files):
-        _convert_peptide_list_file(file)
+    return process_files(function=_convert_peptide_list_file, file_arguments=[(file,) for file in files],
+                         workers=workers)
@@ -0,0 +1,42 @@
+"""
+Per-residue coverage of the peptides in a peptide list.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def calculate_residue_coverage(starts, ends, spectra=None, length: Optional[int] = None) -> pd.DataFrame:
+    """
+    Calculate the number of hits and spectra covering each residue of the protein.
+    The coverage is calculated with difference arrays, so the cost is linear in the number of peptides plus the protein
+    length instead of their product.
+
+    :param starts: The start position (1-based and inclusive) of each peptide.
+    :param ends: The end position (1-based and inclusive) of each peptide.
+    :param spectra: The spectra count of each peptide. If None, each peptide counts as a single spectrum.
+    :param length: The protein length. If None, the largest end position is used.
+    :return: The data frame indexed by the residue position with the 'Hits' and 'Spectra' coverage.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    spectra = np.ones(len(starts), dtype=np.int64) if spectra is None else np.asarray(spectra, dtype=np.int64)
+    if length is None:
+        length = int(ends.max()) if len(ends) > 0 else 0
+
+    # Clip the peptides to the protein and skip the peptides outside of it
+    starts = np.clip(starts, 1, None)
+    ends = np.clip(ends, None, length)
+    valid: np.ndarray = starts <= ends
+    starts, ends, spectra = starts[valid], ends[valid], spectra[valid]
+
+    # Add the peptide at its start and remove it after its end, the running sum is then the coverage
+    hits_difference: np.ndarray = np.bincount(starts, minlength=length + 2) - \
+        np.bincount(ends + 1, minlength=length + 2)
+    spectra_difference: np.ndarray = np.bincount(starts, weights=spectra, minlength=length + 2) - \
+        np.bincount(ends + 1, weights=spectra, minlength=length + 2)
+
+    return pd.DataFrame({"Hits": np.cumsum(hits_difference)[1:length + 1],
+                         "Spectra": np.cumsum(spectra_difference)[1:length + 1].astype(np.int64)},
+                        index=pd.RangeIndex(1, length + 1, name="Position"))
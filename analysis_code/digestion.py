@@ -0,0 +1,163 @@
+"""
+In-silico digestion of protein sequences and the theoretical coverage of the digestion products.
+
+The cleavage sites of all the proteins are found at once on the concatenated sequences, and the products with up to
+the allowed number of missed cleavages are formed by pairing each site with the following sites of the same protein.
+The theoretical coverage is the number of digestion products covering each residue, and it is cached per sequence and
+digestion settings, so the observed coverage and modification percentages can be normalized against the residues the
+enzyme can produce.
+"""
+import functools
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .coverage import calculate_residue_coverage
+from .instrumentation import trace_stage
+from .proteins import get_protein_sequence
+
+
+@dataclass(frozen=True)
+class Enzyme:
+    """
+    The cleavage rule of an enzyme. The enzyme cleaves the bond after the 'cleave_after' residues unless the next residue
+    is one of the 'restrict_before' residues. If 'cleave_after' is None, every bond is cleaved (Nonspecific cleavage).
+    """
+    name: str
+    cleave_after: Optional[str]
+    restrict_before: str = ""
+
+
+ENZYMES: Dict[str, Enzyme] = {
+    "trypsin": Enzyme(name="trypsin", cleave_after="KR", restrict_before="P"),
+    "chymotrypsin": Enzyme(name="chymotrypsin", cleave_after="FWY", restrict_before="P"),
+    "nonspecific": Enzyme(name="nonspecific", cleave_after=None),
+}
+
+
+@dataclass(frozen=True)
+class DigestionSettings:
+    """
+    The enzyme and the limits of the digestion products. Nonspecific digestions have no missed cleavages, so only the
+    length limits apply to them.
+    """
+    enzyme: str = "trypsin"
+    missed_cleavages: int = 2
+    min_length: int = 6
+    max_length: int = 50
+
+    def get_enzyme(self) -> Enzyme:
+        """
+        Get the cleavage rule of the enzyme.
+
+        :return: The enzyme.
+        """
+        try:
+            return ENZYMES[self.enzyme]
+        except KeyError:
+            raise ValueError(f"Unknown enzyme '{self.enzyme}'. The enzymes are: {', '.join(ENZYMES)}") from None
+
+
+DEFAULT_DIGESTION: DigestionSettings = DigestionSettings()
+
+
+def digest_sequences(sequences: Union[Dict[str, str], Sequence[str]],
+                     settings: DigestionSettings = DEFAULT_DIGESTION, include_sequences: bool = True) -> pd.DataFrame:
+    """
+    Digest protein sequences in-silico.
+
+    :param sequences: The dictionary with the protein name and its sequence, or the list of protein names in the
+        protein registry.
+    :param settings: The digestion settings.
+    :param include_sequences: If True, the peptide sequences are included.
+    :return: The data frame with the categorical 'Protein' column, the 'Start' and 'End' positions (1-based and
+        inclusive), the number of 'MissedCleavages' and the 'Sequence' of each digestion product. The products are
+        sorted by the protein, the start and the end position.
+    """
+    if not isinstance(sequences, dict):
+        sequences = {name: get_protein_sequence(name) for name in sequences}
+    enzyme: Enzyme = settings.get_enzyme()
+    names: List[str] = list(sequences)
+    joined: str = "".join(sequences.values()).upper()
+    lengths: np.ndarray = np.array([len(sequence) for sequence in sequences.values()], dtype=np.int64)
+
+    with trace_stage("digest_sequences", category="aggregate", rows=len(joined)):
+        residues: np.ndarray = np.frombuffer(joined.encode(), dtype="S1")
+        proteins: np.ndarray = np.repeat(np.arange(len(names)), lengths)
+        positions: np.ndarray = np.arange(len(residues)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+
+        # The bond after a residue is cleaved if the enzyme cleaves after the residue and the residue is not the last
+        # residue of its protein
+        cleaved: np.ndarray = positions < lengths[proteins]
+        if enzyme.cleave_after is not None:
+            cleaved &= np.isin(residues, [residue.encode() for residue in enzyme.cleave_after])
+            if enzyme.restrict_before:
+                cleaved[:-1] &= ~np.isin(residues[1:], [residue.encode() for residue in enzyme.restrict_before])
+
+        # The sites are the ends of the products, with 0 before the first residue of each protein
+        site_proteins: np.ndarray = np.concatenate((np.arange(len(names)), proteins[cleaved],
+                                                    np.arange(len(names))))
+        site_positions: np.ndarray = np.concatenate((np.zeros(len(names), dtype=np.int64), positions[cleaved],
+                                                     lengths))
+        order: np.ndarray = np.lexsort((site_positions, site_proteins))
+        site_proteins, site_positions = site_proteins[order], site_positions[order]
+
+        # Pair each site with the site 'missed + 1' sites later in the same protein
+        max_missed: int = settings.max_length - 1 if enzyme.cleave_after is None else settings.missed_cleavages
+        parts: List[tuple] = []
+        for missed in range(min(max_missed, len(site_positions) - 2) + 1):
+            same_protein: np.ndarray = site_proteins[:-missed - 1] == site_proteins[missed + 1:]
+            starts: np.ndarray = site_positions[:-missed - 1] + 1
+            ends: np.ndarray = site_positions[missed + 1:]
+            product_lengths: np.ndarray = ends - starts + 1
+            selected: np.ndarray = same_protein & (product_lengths >= settings.min_length) & \
+                (product_lengths <= settings.max_length)
+            parts.append((site_proteins[:-missed - 1][selected], starts[selected], ends[selected],
+                          np.full(selected.sum(), 0 if enzyme.cleave_after is None else missed, dtype=np.int64)))
+
+    product_proteins, starts, ends, missed_cleavages = [np.concatenate([part[column] for part in parts])
+                                                        if parts else np.zeros(0, dtype=np.int64)
+                                                        for column in range(4)]
+    order = np.lexsort((ends, starts, product_proteins))
+    product_proteins, starts, ends, missed_cleavages = (product_proteins[order], starts[order], ends[order],
+                                                        missed_cleavages[order])
+    products: pd.DataFrame = pd.DataFrame({
+        "Protein": pd.Categorical.from_codes(product_proteins, categories=names),
+        "Start": starts, "End": ends, "MissedCleavages": missed_cleavages})
+    if include_sequences:
+        offsets: np.ndarray = (np.cumsum(lengths) - lengths)[product_proteins]
+        products["Sequence"] = [joined[start:end] for start, end in zip(offsets + starts - 1, offsets + ends)]
+    return products
+
+
+def get_theoretical_coverage(protein: str, settings: DigestionSettings = DEFAULT_DIGESTION,
+                             mature: bool = False) -> np.ndarray:
+    """
+    Get the number of digestion products covering each residue of a protein in the protein registry.
+
+    :param protein: The protein name.
+    :param settings: The digestion settings.
+    :param mature: If True, the mature protein is digested.
+    :return: The read-only array with the coverage of each residue. Residue i is at index i - 1.
+    """
+    return get_sequence_theoretical_coverage(get_protein_sequence(protein, mature=mature), settings=settings)
+
+
+@functools.lru_cache(maxsize=None)
+def get_sequence_theoretical_coverage(sequence: str, settings: DigestionSettings = DEFAULT_DIGESTION) -> np.ndarray:
+    """
+    Get the number of digestion products covering each residue of a sequence. The coverage is cached per sequence and
+    settings.
+
+    :param sequence: The protein sequence.
+    :param settings: The digestion settings.
+    :return: The read-only array with the coverage of each residue. Residue i is at index i - 1.
+    """
+    products: pd.DataFrame = digest_sequences({"": sequence}, settings=settings, include_sequences=False)
+    coverage: np.ndarray = calculate_residue_coverage(starts=products["Start"], ends=products["End"],
+                                                      length=len(sequence))["Hits"].to_numpy()
+    coverage.setflags(write=False)
+    return coverage
+
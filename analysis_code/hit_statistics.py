@@ -0,0 +1,179 @@
+"""
+Hit statistics of the peptide lists of several conditions and proteins.
+
+The peptide lists in one or more directories are read with prefetching and concatenated into a single table with
+categorical 'Protein' and 'Condition' columns, so the statistics of all the lists are calculated with a single groupby.
+The coverage of each group is calculated from the peptide positions with difference arrays for all the groups at once.
+With digestion settings, the coverage is also normalized to the residues the enzyme can produce in-silico.
+"""
+import pathlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .digestion import DigestionSettings, get_theoretical_coverage
+from .instrumentation import trace_stage
+from .prefetch import DEFAULT_PREFETCH, iterate_peptide_lists
+from .proteins import get_protein_sequence
+
+HIT_COLUMNS: List[str] = ["from", "to", "seq", "#"]
+HIT_STATISTICS_COLUMNS: List[str] = ["TotalHits", "UniqueHits", "HitsOnlySeq", "Coverage"]
+NORMALIZED_COVERAGE_COLUMNS: List[str] = ["TheoreticalCoverage", "NormalizedCoverage"]
+# The protein of the conditions without a known protein, which has no coverage
+UNKNOWN_PROTEIN: str = "Unknown"
+
+
+def read_hit_lists(directories: Union[str, pathlib.Path, Sequence[Union[str, pathlib.Path]],
+                                      Dict[str, Union[str, pathlib.Path]]],
+                   exclude: Optional[str] = None, prefetch: int = DEFAULT_PREFETCH,
+                   condition_proteins: Union[Dict[str, str], Callable[[str], Optional[str]], None] = None) \
+        -> pd.DataFrame:
+    """
+    Read the peptide lists (XLSX) in the directories into a single table.
+
+    :param directories: The directory, the list of directories or the dictionary with the protein name and its
+        directory. Without a dictionary, the directory name is used as the protein name.
+    :param exclude: The lists with this text in the file name are skipped. Fx. 'tryp'.
+    :param prefetch: The number of lists read ahead on background threads.
+    :param condition_proteins: The dictionary or the function mapping a condition to its protein, for directories
+        with the lists of several proteins. The conditions it does not map get the protein 'Unknown', which has no
+        coverage. If None, the protein of the directory is used.
+    :return: The data frame with the 'from', 'to', 'seq' and '#' columns, and the categorical 'Protein' and
+        'Condition' (The file name without the suffix) columns.
+    """
+    files: List[Tuple[str, str, pathlib.Path]] = [
+        (protein, file.stem, file) for protein, directory in _get_protein_directories(directories).items()
+        for file in sorted(directory.glob("*.xlsx")) if file.is_file() and (exclude is None or exclude not in file.stem)]
+    if condition_proteins is not None:
+        get_protein: Callable[[str], Optional[str]] = condition_proteins.get if isinstance(condition_proteins, dict) \
+            else condition_proteins
+        files = [(get_protein(condition) or UNKNOWN_PROTEIN, condition, file) for _, condition, file in files]
+
+    peptide_lists: List[pd.DataFrame] = [peptide_list for _, peptide_list in iterate_peptide_lists(
+        [file for _, _, file in files], prefetch=prefetch, usecols=HIT_COLUMNS)]
+
+    with trace_stage("concatenate_hit_lists", category="aggregate") as stage:
+        hits: pd.DataFrame = pd.concat(peptide_lists, ignore_index=True) if peptide_lists else \
+            pd.DataFrame(columns=HIT_COLUMNS)
+        lengths: List[int] = [len(peptide_list) for peptide_list in peptide_lists]
+        hits["Protein"] = _repeat_categorical([protein for protein, _, _ in files], lengths)
+        hits["Condition"] = _repeat_categorical([condition for _, condition, _ in files], lengths)
+        stage["rows"] = len(hits)
+    return hits
+
+
+def calculate_hit_statistics(hits: pd.DataFrame, by: Sequence[str] = ("Protein", "Condition"),
+                             mature: bool = True, digestion: Optional[DigestionSettings] = None) -> pd.DataFrame:
+    """
+    Calculate the hit statistics of each group of peptide lists. The total hits are the sum of the spectra, the unique
+    hits the number of peptides, the sequence hits the number of distinct sequences and the coverage the percentage of
+    the protein residues covered by at least one peptide.
+
+    :param hits: The peptide lists from 'read_hit_lists'.
+    :param by: The grouping columns. Fx. ('Protein', 'Condition') for each list or ('Protein',) for each protein.
+    :param mature: If True, the coverage is calculated for the mature proteins.
+    :param digestion: The in-silico digestion settings. If given, the 'TheoreticalCoverage' (The percentage of the
+        residues covered by the digestion products) and the 'NormalizedCoverage' (The percentage of those residues
+        covered by the peptides) columns are added.
+    :return: The data frame indexed by the groups with the 'TotalHits', 'UniqueHits', 'HitsOnlySeq' and 'Coverage'
+        columns. The coverage is missing for proteins which are not in the protein registry, or if the groups are not
+        grouped by the protein.
+    """
+    with trace_stage("hit_statistics", category="aggregate", rows=len(hits)):
+        grouped = hits.groupby(list(by), observed=True, sort=False)
+        statistics: pd.DataFrame = grouped.agg(TotalHits=("#", "sum"), UniqueHits=("seq", "size"),
+                                               HitsOnlySeq=("seq", "nunique"))
+        coverage: pd.DataFrame = _calculate_group_coverage(hits=hits, group_codes=grouped.ngroup().to_numpy(),
+                                                           groups=statistics.index, mature=mature, digestion=digestion)
+        statistics[coverage.columns] = coverage.to_numpy()
+    return statistics[HIT_STATISTICS_COLUMNS + (NORMALIZED_COVERAGE_COLUMNS if digestion is not None else [])]
+
+
+def _calculate_group_coverage(hits: pd.DataFrame, group_codes: np.ndarray, groups: pd.Index, mature: bool,
+                              digestion: Optional[DigestionSettings] = None) -> pd.DataFrame:
+    """
+    Calculate the protein coverage of each group with a difference array per group.
+
+    :param hits: The peptide lists.
+    :param group_codes: The group number of each peptide.
+    :param groups: The group index, which must have a 'Protein' level for the coverage to be calculated.
+    :param mature: If True, the coverage is calculated for the mature proteins.
+    :param digestion: The in-silico digestion settings. If given, the theoretical and normalized coverage are added.
+    :return: The data frame with the 'Coverage' of each group in percent and possibly the 'TheoreticalCoverage' and
+        'NormalizedCoverage'.
+    """
+    columns: List[str] = ["Coverage"] + (NORMALIZED_COVERAGE_COLUMNS if digestion is not None else [])
+    if "Protein" not in groups.names or len(groups) == 0:
+        return pd.DataFrame(np.nan, index=range(len(groups)), columns=columns)
+
+    group_proteins: pd.Index = groups.get_level_values("Protein")
+    protein_lengths: Dict[str, int] = {}
+    for protein in pd.unique(group_proteins):
+        try:
+            protein_lengths[protein] = len(get_protein_sequence(protein, mature=mature))
+        except KeyError:
+            protein_lengths[protein] = 0
+    group_lengths: np.ndarray = np.array([protein_lengths[protein] for protein in group_proteins], dtype=np.int64)
+
+    # Clip the peptides to their protein and skip the peptides outside of it
+    starts: np.ndarray = np.nan_to_num(hits["from"].to_numpy(dtype=np.float64), nan=0).astype(np.int64)
+    ends: np.ndarray = np.nan_to_num(hits["to"].to_numpy(dtype=np.float64), nan=-1).astype(np.int64)
+    starts = np.clip(starts, 1, None)
+    ends = np.minimum(ends, group_lengths[group_codes])
+    valid: np.ndarray = starts <= ends
+    codes: np.ndarray = group_codes[valid]
+
+    # Add each peptide at its start and remove it after its end in the row of its group, so the running sum of each row
+    # is the number of peptides covering each residue
+    width: int = int(group_lengths.max()) + 2
+    difference: np.ndarray = (np.bincount(codes * width + starts[valid], minlength=len(groups) * width) -
+                              np.bincount(codes * width + ends[valid] + 1, minlength=len(groups) * width))
+    covered_residues: np.ndarray = np.cumsum(difference.reshape(len(groups), width), axis=1) > 0
+
+    coverage: pd.DataFrame = pd.DataFrame(np.nan, index=range(len(groups)), columns=columns)
+    known: np.ndarray = group_lengths > 0
+    coverage.loc[known, "Coverage"] = covered_residues[known].sum(axis=1) / group_lengths[known] * 100
+    if digestion is not None:
+        # The residues the digestion can produce, in the same layout as the covered residues
+        coverable_residues: np.ndarray = np.zeros((len(groups), width), dtype=bool)
+        for protein in [protein for protein, length in protein_lengths.items() if length > 0]:
+            theoretical_coverage: np.ndarray = get_theoretical_coverage(protein, settings=digestion, mature=mature)
+            coverable_residues[np.asarray(group_proteins == protein), 1:len(theoretical_coverage) + 1] = \
+                theoretical_coverage > 0
+        coverable: np.ndarray = coverable_residues.sum(axis=1)
+        coverage.loc[known, "TheoreticalCoverage"] = coverable[known] / group_lengths[known] * 100
+        producible: np.ndarray = coverable > 0
+        coverage.loc[producible, "NormalizedCoverage"] = \
+            (covered_residues & coverable_residues)[producible].sum(axis=1) / coverable[producible] * 100
+    return coverage
+
+
+def _get_protein_directories(directories: Union[str, pathlib.Path, Sequence[Union[str, pathlib.Path]],
+                                                Dict[str, Union[str, pathlib.Path]]]) -> Dict[str, pathlib.Path]:
+    """
+    Get the directory of each protein.
+
+    :param directories: The directory, the list of directories or the dictionary with the protein name and its
+        directory.
+    :return: The dictionary with the protein name and its directory.
+    """
+    if isinstance(directories, dict):
+        return {protein: pathlib.Path(directory) for protein, directory in directories.items()}
+    if isinstance(directories, (str, pathlib.Path)):
+        directories = [directories]
+    return {pathlib.Path(directory).name: pathlib.Path(directory) for directory in directories}
+
+
+def _repeat_categorical(values: List[str], counts: List[int]) -> pd.Categorical:
+    """
+    Create a categorical column with each value repeated a number of times. The categories are in the order of the
+    values.
+
+    :param values: The values.
+    :param counts: The number of times each value is repeated.
+    :return: The categorical column.
+    """
+    categories: List[str] = list(dict.fromkeys(values))
+    codes: np.ndarray = np.array([categories.index(value) for value in values], dtype=np.int32)
+    return pd.Categorical.from_codes(np.repeat(codes, counts), categories=categories)
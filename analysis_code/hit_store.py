@@ -0,0 +1,396 @@
+"""
+Local SQLite store of the hits in the peptide lists of many experiments.
+
+The peptide lists are ingested once into normalized tables:
+    conditions: A row per peptide list with the experiment, the condition name, the protein and the source file.
+    peptides: A row per peptide (Hit) with its condition, the start and end position, the sequence and the spectra.
+    modifications: A row per modification of a peptide with the protein position and the mass.
+The peptides are indexed on the residue range and the modifications on the mass and position, so questions like "all
+hits covering residue 163 with a +15.995 modification in every experiment" and the modification and position
+statistics are answered with indexed SQL queries instead of reading the peptide lists again.
+
+Usage: python hit_store.py ingest DATABASE DIRECTORY [DIRECTORY ...] [--protein NAME] [--experiment NAME] [--replace]
+       python hit_store.py query DATABASE [--position POSITION] [--mass MASS] [--tolerance DA] [--experiment NAME]
+"""
+import argparse
+import pathlib
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import trace_stage
+from .mass_index import DEFAULT_MASS_TOLERANCE
+from .modification_table import ModificationTable, parse_modifications
+from .peptide_list_cache import _content_key
+from .peptide_table import read_list_columns
+from .result_sinks import write_result
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS conditions (
+    condition_id INTEGER PRIMARY KEY,
+    experiment TEXT NOT NULL,
+    name TEXT NOT NULL,
+    protein TEXT,
+    source_file TEXT NOT NULL,
+    source_directory TEXT NOT NULL,
+    content_key TEXT NOT NULL,
+    UNIQUE (experiment, name)
+);
+CREATE TABLE IF NOT EXISTS peptides (
+    peptide_id INTEGER PRIMARY KEY,
+    condition_id INTEGER NOT NULL REFERENCES conditions (condition_id) ON DELETE CASCADE,
+    start_position INTEGER NOT NULL,
+    end_position INTEGER NOT NULL,
+    sequence TEXT NOT NULL,
+    spectra INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS modifications (
+    peptide_id INTEGER NOT NULL REFERENCES peptides (peptide_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    mass REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conditions_directory ON conditions (source_directory);
+CREATE INDEX IF NOT EXISTS peptides_range ON peptides (start_position, end_position);
+CREATE INDEX IF NOT EXISTS peptides_condition_range ON peptides (condition_id, start_position, end_position);
+CREATE INDEX IF NOT EXISTS modifications_mass ON modifications (mass, position);
+CREATE INDEX IF NOT EXISTS modifications_peptide ON modifications (peptide_id);
+"""
+
+
+class HitStore:
+    """
+    SQLite store of the hits of the peptide lists. The store is used as a context manager.
+    """
+
+    def __init__(self, database: Union[str, pathlib.Path]):
+        """
+        Open the store and create the tables if they do not exist.
+
+        :param database: The database file.
+        """
+        self.database: pathlib.Path = pathlib.Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection: sqlite3.Connection = sqlite3.connect(self.database)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def ingest_peptide_list(self, file: Union[str, pathlib.Path], experiment: Optional[str] = None,
+                            condition: Optional[str] = None, protein: Optional[str] = None,
+                            replace: bool = False) -> bool:
+        """
+        Load a raw or combined peptide list (XLSX) into the store. A list which is already in the store is replaced if
+        the file changed, and skipped otherwise.
+
+        :param file: The peptide list.
+        :param experiment: The experiment name. If None, the resolved path of the directory of the list is used, so
+            directories with the same name in different experiments (Fx. 'Lists_CBM') are different experiments.
+        :param condition: The condition name. If None, the file name without the suffix is used.
+        :param protein: The protein name in the protein registry.
+        :param replace: If True, a condition with the same experiment and name loaded from another file is replaced;
+            Otherwise, it is an error.
+        :return: True, if the list was loaded; False, if it was already in the store.
+        """
+        file = pathlib.Path(file).resolve()
+        experiment = experiment if experiment is not None else str(file.parent)
+        condition = condition if condition is not None else file.stem
+        content_key: str = _content_key(file)
+        existing = self._connection.execute(
+            "SELECT content_key, source_file FROM conditions WHERE experiment = ? AND name = ?",
+            (experiment, condition)).fetchone()
+        if existing is not None and existing[1] != str(file) and not replace:
+            raise ValueError(f"The condition '{condition}' of the experiment '{experiment}' was loaded from "
+                             f"{existing[1]}, not {file}. Use another experiment name or replace it")
+        if existing is not None and existing[0] == content_key and existing[1] == str(file):
+            return False
+
+        peptide_list: pd.DataFrame = read_list_columns(file)
+        with trace_stage("ingest_peptide_list", category="io", file=file, rows=len(peptide_list)), self._connection:
+            self._connection.execute("DELETE FROM conditions WHERE experiment = ? AND name = ?", (experiment, condition))
+            condition_id: int = self._connection.execute(
+                "INSERT INTO conditions (experiment, name, protein, source_file, source_directory, content_key) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (experiment, condition, protein, str(file), str(file.parent), content_key)).lastrowid
+            self._insert_peptides(condition_id=condition_id, peptide_list=peptide_list)
+        return True
+
+    def ingest_directory(self, directory: Union[str, pathlib.Path], experiment: Optional[str] = None,
+                         protein: Optional[str] = None, replace: bool = False) -> List[pathlib.Path]:
+        """
+        Load the peptide lists (XLSX) in a directory into the store.
+
+        :param directory: The directory with the peptide lists.
+        :param experiment: The experiment name. If None, the resolved directory path is used.
+        :param protein: The protein name in the protein registry.
+        :param replace: If True, conditions loaded from other files are replaced; Otherwise, they are an error.
+        :return: The list of loaded files. The unchanged lists which were already in the store are not included.
+        """
+        return [file for file in sorted(pathlib.Path(directory).glob("*.xlsx")) if file.is_file() and
+                self.ingest_peptide_list(file=file, experiment=experiment, protein=protein, replace=replace)]
+
+    def get_conditions(self, experiment: Optional[str] = None) -> pd.DataFrame:
+        """
+        Get the conditions in the store.
+
+        :param experiment: The experiment. If None, the conditions of all the experiments are returned.
+        :return: The data frame with the condition id, the experiment, the condition name, the protein, the source
+            file and the number of peptides of each condition.
+        """
+        where, parameters = _condition_filter(experiment=experiment)
+        return pd.read_sql_query(
+            "SELECT c.condition_id, c.experiment, c.name AS condition, c.protein, c.source_file, "
+            "(SELECT COUNT(*) FROM peptides p WHERE p.condition_id = c.condition_id) AS peptides "
+            f"FROM conditions c {where} ORDER BY c.condition_id", self._connection, params=parameters)
+
+    def query_hits(self, position: Optional[int] = None, mass: Optional[float] = None,
+                   tolerance: float = DEFAULT_MASS_TOLERANCE, ppm: Optional[float] = None,
+                   experiment: Optional[str] = None, protein: Optional[str] = None) -> pd.DataFrame:
+        """
+        Find the hits covering a residue and/or carrying a modification in all the conditions.
+
+        :param position: The residue position the hits must cover. If None, the hits are not filtered on the position.
+        :param mass: The modification mass. If a position is given as well, the modification must be on the residue.
+            If None, the hits are not filtered on the modifications.
+        :param tolerance: The absolute mass tolerance in Da.
+        :param ppm: The relative mass tolerance in ppm. If given, it is used instead of the tolerance.
+        :param experiment: The experiment. If None, all the experiments are searched.
+        :param protein: The protein. If None, all the proteins are searched.
+        :return: The data frame with the experiment, the condition, the protein, the peptide id, the start and end
+            position, the sequence, the spectra and the matching modifications (Fx. '163@15.995') of each hit.
+        """
+        clauses: List[str] = []
+        parameters: List[object] = []
+        if position is not None:
+            clauses.append("p.start_position <= ? AND p.end_position >= ?")
+            parameters += [position, position]
+        if experiment is not None:
+            clauses.append("c.experiment = ?")
+            parameters.append(experiment)
+        if protein is not None:
+            clauses.append("c.protein = ?")
+            parameters.append(protein)
+
+        if mass is not None:
+            lower, upper = _mass_range(mass=mass, tolerance=tolerance, ppm=ppm)
+            modification_join: str = "JOIN modifications m ON m.peptide_id = p.peptide_id AND m.mass BETWEEN ? AND ?" + \
+                (" AND m.position = ?" if position is not None else "")
+            parameters = [lower, upper] + ([position] if position is not None else []) + parameters
+        else:
+            modification_join = "LEFT JOIN modifications m ON m.peptide_id = p.peptide_id"
+
+        where: str = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return pd.read_sql_query(
+            "SELECT c.experiment, c.name AS condition, c.protein, p.peptide_id, p.start_position AS start, "
+            "p.end_position AS end, p.sequence, p.spectra, "
+            "GROUP_CONCAT(m.position || '@' || m.mass, ';') AS modifications "
+            f"FROM peptides p JOIN conditions c ON c.condition_id = p.condition_id {modification_join} {where} "
+            "GROUP BY p.peptide_id ORDER BY c.condition_id, p.start_position, p.peptide_id",
+            self._connection, params=parameters)
+
+    def modification_statistics(self, sequence: str, modifications: List[Tuple[str, str, float]],
+                                experiment: Optional[str] = None, source_directory: Union[str, pathlib.Path, None] = None,
+                                tolerance: float = DEFAULT_MASS_TOLERANCE) -> pd.DataFrame:
+        """
+        Calculate the modification percentages of the modifications for each of the conditions. The result is the same
+        as 'calculate_modification_statistics' on the peptide lists.
+
+        :param sequence: The protein sequence.
+        :param modifications: The list of tuples with the modification name, the residues as a string and the mass.
+        :param experiment: The experiment. If None, all the experiments are used.
+        :param source_directory: Only the conditions ingested from this directory are used, if given.
+        :param tolerance: The absolute mass tolerance in Da.
+        :return: The data frame with a row per condition and modification with the condition, the modification, the
+            percentage and the counts.
+        """
+        where, parameters = _condition_filter(experiment=experiment, source_directory=source_directory)
+        results: List[pd.DataFrame] = []
+        for mod_name, residue_str, mod_mass in modifications:
+            lower, upper = _mass_range(mass=mod_mass, tolerance=tolerance)
+            self._set_query_positions(match.start() + 1 for match in re.finditer(f"[{residue_str}]", sequence.upper()))
+            # The peptides containing one of the residues, and their spectra if one of the residues is modified
+            counts: pd.DataFrame = pd.read_sql_query(
+                "SELECT c.name AS Condition, COALESCE(SUM(CASE WHEN EXISTS ("
+                "SELECT 1 FROM modifications m WHERE m.peptide_id = p.peptide_id AND m.mass BETWEEN ? AND ? "
+                "AND m.position IN (SELECT position FROM temp.query_positions)) THEN p.spectra ELSE 0 END), 0) "
+                "AS ModifiedSpectra, COALESCE(SUM(p.spectra), 0) AS TotalModSpectra "
+                "FROM conditions c LEFT JOIN peptides p ON p.condition_id = c.condition_id AND p.sequence GLOB ? "
+                f"{where} GROUP BY c.condition_id ORDER BY c.condition_id",
+                self._connection, params=[lower, upper, f"*[{residue_str}]*"] + parameters)
+            counts.insert(1, "Modification", mod_name)
+            results.append(counts)
+
+        statistics: pd.DataFrame = pd.concat(results, ignore_index=True) if results else pd.DataFrame(
+            columns=["Condition", "Modification", "ModifiedSpectra", "TotalModSpectra"])
+        total: pd.Series = statistics["TotalModSpectra"]
+        statistics.insert(2, "Percentage", np.where(total != 0, np.round(
+            statistics["ModifiedSpectra"] / total.replace(0, 1) * 100, 2), 0))
+        return statistics
+
+    def position_statistics(self, condition: str, positions: Sequence[int], mass: float,
+                            experiment: Optional[str] = None,
+                            tolerance: float = DEFAULT_MASS_TOLERANCE) -> pd.DataFrame:
+        """
+        Count the modified hits and the hits covering each of the positions in a condition.
+
+        :param condition: The condition name.
+        :param positions: The residue positions.
+        :param mass: The modification mass.
+        :param experiment: The experiment. Must be given if the condition name is used in several experiments.
+        :param tolerance: The absolute mass tolerance in Da.
+        :return: The data frame indexed by the position with the 'ModifiedSpectra' (Modified hits) and the
+            'TotalModSpectra' (Hits covering the position) columns.
+        """
+        condition_id: int = self._get_condition_id(condition=condition, experiment=experiment)
+        lower, upper = _mass_range(mass=mass, tolerance=tolerance)
+        self._set_query_positions(positions)
+        counts: pd.DataFrame = pd.read_sql_query(
+            "SELECT r.position AS Position, "
+            "(SELECT COUNT(*) FROM modifications m JOIN peptides p ON p.peptide_id = m.peptide_id "
+            "WHERE m.mass BETWEEN ? AND ? AND m.position = r.position AND p.condition_id = ?) AS ModifiedSpectra, "
+            "(SELECT COUNT(*) FROM peptides p WHERE p.condition_id = ? AND p.start_position <= r.position "
+            "AND p.end_position >= r.position) AS TotalModSpectra "
+            "FROM temp.query_positions r ORDER BY r.rowid",
+            self._connection, params=[lower, upper, condition_id, condition_id])
+        return counts.set_index("Position")
+
+    def close(self) -> None:
+        """
+        Close the store.
+        """
+        self._connection.close()
+
+    def _insert_peptides(self, condition_id: int, peptide_list: pd.DataFrame) -> None:
+        """
+        Insert the peptides of a list and their modifications.
+
+        :param condition_id: The condition id.
+        :param peptide_list: The peptide list with the combined peptide list columns.
+        """
+        first_id: int = (self._connection.execute("SELECT COALESCE(MAX(peptide_id), 0) FROM peptides").fetchone()[0]
+                         + 1)
+        peptide_ids: np.ndarray = np.arange(first_id, first_id + len(peptide_list))
+        self._connection.executemany(
+            "INSERT INTO peptides (peptide_id, condition_id, start_position, end_position, sequence, spectra) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(peptide_ids.tolist(), [condition_id] * len(peptide_list),
+                peptide_list["Start"].astype(np.int64).tolist(), peptide_list["End"].astype(np.int64).tolist(),
+                peptide_list["Sequence"].astype(str).tolist(), peptide_list["Spectra"].astype(np.int64).tolist()))
+
+        mod_table: ModificationTable = parse_modifications(peptide_list["Modification"])
+        self._connection.executemany(
+            "INSERT INTO modifications (peptide_id, position, mass) VALUES (?, ?, ?)",
+            zip(peptide_ids[mod_table.rows].tolist(), mod_table.positions.tolist(), mod_table.masses.tolist()))
+
+    def _set_query_positions(self, positions: Iterable[int]) -> None:
+        """
+        Fill the temporary table with the positions of a query.
+
+        :param positions: The positions.
+        """
+        self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS query_positions (position INTEGER PRIMARY KEY)")
+        self._connection.execute("DELETE FROM temp.query_positions")
+        self._connection.executemany("INSERT OR IGNORE INTO temp.query_positions (position) VALUES (?)",
+                                     [(int(position),) for position in positions])
+
+    def _get_condition_id(self, condition: str, experiment: Optional[str]) -> int:
+        """
+        Get the id of a condition.
+
+        :param condition: The condition name.
+        :param experiment: The experiment. If None, the condition name must be unique.
+        :return: The condition id.
+        """
+        where, parameters = _condition_filter(experiment=experiment)
+        rows: list = self._connection.execute(
+            f"SELECT c.condition_id FROM conditions c {where} {'AND' if where else 'WHERE'} c.name = ?",
+            parameters + [condition]).fetchall()
+        if len(rows) != 1:
+            raise KeyError(f"The condition '{condition}' was found {len(rows)} times in the hit store")
+        return rows[0][0]
+
+    def __enter__(self) -> "HitStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def _mass_range(mass: float, tolerance: float = DEFAULT_MASS_TOLERANCE,
+                ppm: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Get the mass range matching a mass within the tolerance (See 'within_tolerance').
+
+    :param mass: The mass.
+    :param tolerance: The absolute tolerance in Da.
+    :param ppm: The relative tolerance in ppm. If given, it is used instead of the tolerance.
+    :return: The tuple with the lower and the upper mass.
+    """
+    limit: float = abs(mass) * ppm * 1e-6 if ppm is not None else tolerance
+    return mass - limit, mass + limit
+
+
+def _condition_filter(experiment: Optional[str] = None,
+                      source_directory: Union[str, pathlib.Path, None] = None) -> Tuple[str, List[object]]:
+    """
+    Get the WHERE clause selecting the conditions (Alias 'c') of an experiment or a source directory.
+
+    :param experiment: The experiment. If None, the conditions are not filtered on the experiment.
+    :param source_directory: The source directory. If None, the conditions are not filtered on the directory.
+    :return: The tuple with the WHERE clause (Empty if there is no filter) and its parameters.
+    """
+    clauses: List[str] = []
+    parameters: List[object] = []
+    if experiment is not None:
+        clauses.append("c.experiment = ?")
+        parameters.append(experiment)
+    if source_directory is not None:
+        clauses.append("c.source_directory = ?")
+        parameters.append(str(pathlib.Path(source_directory).resolve()))
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), parameters
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """
+    Ingest peptide lists into a hit store or query the store from the command line.
+
+    :param arguments: The command line arguments. If None, the arguments of the process are used.
+    """
+    parser = argparse.ArgumentParser(description="Load peptide lists into a local hit store and query it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Load the peptide lists (XLSX) in directories into the store.")
+    ingest_parser.add_argument("database", type=pathlib.Path, help="The SQLite database file.")
+    ingest_parser.add_argument("directories", type=pathlib.Path, nargs="+", help="The peptide list directories.")
+    ingest_parser.add_argument("--protein", help="The protein name in the protein registry.")
+    ingest_parser.add_argument("--experiment", help="The experiment name. Default is the resolved directory path.")
+    ingest_parser.add_argument("--replace", action="store_true",
+                               help="Replace the conditions of the experiment loaded from other files.")
+    query_parser = commands.add_parser("query", help="Find the hits covering a residue and/or with a modification.")
+    query_parser.add_argument("database", type=pathlib.Path, help="The SQLite database file.")
+    query_parser.add_argument("--position", type=int, help="The residue position the hits must cover.")
+    query_parser.add_argument("--mass", type=float, help="The modification mass.")
+    query_parser.add_argument("--tolerance", type=float, default=DEFAULT_MASS_TOLERANCE,
+                              help="The mass tolerance in Da.")
+    query_parser.add_argument("--experiment", help="The experiment. Default is all experiments.")
+    query_parser.add_argument("--output", type=pathlib.Path, help="Save the hits to the file (XLSX, Parquet or CSV).")
+    parsed_arguments = parser.parse_args(arguments)
+
+    with HitStore(parsed_arguments.database) as store:
+        if parsed_arguments.command == "ingest":
+            for directory in parsed_arguments.directories:
+                loaded: List[pathlib.Path] = store.ingest_directory(directory=directory,
+                                                                    experiment=parsed_arguments.experiment,
+                                                                    protein=parsed_arguments.protein,
+                                                                    replace=parsed_arguments.replace)
+                print(f"{directory}: {len(loaded)} peptide lists loaded")
+            return
+
+        hits: pd.DataFrame = store.query_hits(position=parsed_arguments.position, mass=parsed_arguments.mass,
+                                              tolerance=parsed_arguments.tolerance,
+                                              experiment=parsed_arguments.experiment)
+    if parsed_arguments.output is not None:
+        write_result(hits, parsed_arguments.output, index=False)
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        print(hits)
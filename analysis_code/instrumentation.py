@@ -0,0 +1,251 @@
+"""
+Opt-in timing and memory instrumentation of the analysis stages.
+
+The stages are wrapped in 'trace_stage', which records the wall time, the number of rows processed, the RSS at the
+start and the end of the stage and the peak RSS of the process so far when the instrumentation is enabled, and does
+nothing otherwise. The process peak RSS is a high-water mark over the lifetime of the process, so it is not the peak of
+the stage; the change of the RSS over the stage is the per-stage memory measure. The records can be exported as a
+Chrome trace (Open it in chrome://tracing or https://ui.perfetto.dev) and summarized in a table.
+
+The instrumentation is enabled with 'enable_instrumentation', with the 'instrumented_run' context manager, or by
+setting the 'ANALYSIS_TRACE_FILE' environment variable to the trace file. With the environment variable, the trace is
+exported and the summary printed when the process exits.
+"""
+import atexit
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Callable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+TRACE_FILE_VARIABLE: str = "ANALYSIS_TRACE_FILE"
+
+_enabled: bool = False
+_events: List[dict] = []
+_lock: threading.Lock = threading.Lock()
+
+
+def enable_instrumentation(enabled: bool = True) -> None:
+    """
+    Enable or disable the instrumentation for the current process.
+
+    :param enabled: True, if the stages should be recorded; Otherwise, False.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_instrumentation_enabled() -> bool:
+    """
+    Check if the instrumentation is enabled.
+
+    :return: True, if the stages are recorded; Otherwise, False.
+    """
+    return _enabled
+
+
+@contextlib.contextmanager
+def trace_stage(name: str, category: str = "analysis", file: Union[str, pathlib.Path, None] = None,
+                rows: Optional[int] = None) -> Iterator[dict]:
+    """
+    Record the wall time and the memory of a stage. The RSS is recorded at the start and the end of the stage
+    ('rss_start' and 'rss_end') together with the peak RSS of the process so far ('process_peak_rss'). The number of
+    rows can be given, or set in the yielded dictionary when it is known at the end of the stage
+    (Fx. 'stage["rows"] = len(df)').
+
+    :param name: The stage name.
+    :param category: The stage category. Fx. 'io', 'parse', 'aggregate' or 'plot'.
+    :param file: The file processed in the stage.
+    :param rows: The number of rows processed in the stage.
+    :return: The dictionary with the stage arguments.
+    """
+    arguments: dict = {"rows": rows}
+    if not _enabled:
+        yield arguments
+        return
+
+    if file is not None:
+        arguments["file"] = str(file)
+    arguments["rss_start"] = _get_current_rss()
+    start_time: float = time.time()
+    start_counter: float = time.perf_counter()
+    try:
+        yield arguments
+    finally:
+        duration: float = time.perf_counter() - start_counter
+        arguments["rss_end"] = _get_current_rss()
+        arguments["process_peak_rss"] = _get_process_peak_rss()
+        record_event({"name": name, "cat": category, "ph": "X", "ts": start_time * 1e6, "dur": duration * 1e6,
+                      "pid": os.getpid(), "tid": threading.get_ident(),
+                      "args": {key: value for key, value in arguments.items() if value is not None}})
+
+
+def record_event(event: dict) -> None:
+    """
+    Add a recorded trace event. Used to merge the events recorded in worker processes.
+
+    :param event: The trace event.
+    """
+    with _lock:
+        _events.append(event)
+
+
+def get_trace_events() -> List[dict]:
+    """
+    Get the recorded trace events.
+
+    :return: The list of trace events.
+    """
+    with _lock:
+        return list(_events)
+
+
+def clear_trace_events() -> None:
+    """
+    Remove the recorded trace events.
+    """
+    with _lock:
+        _events.clear()
+
+
+def export_trace(trace_file: Union[str, pathlib.Path]) -> None:
+    """
+    Export the recorded events as a Chrome trace.
+
+    :param trace_file: The trace file (JSON).
+    """
+    trace_file = pathlib.Path(trace_file)
+    trace_file.parent.mkdir(parents=True, exist_ok=True)
+    trace_file.write_text(json.dumps({"traceEvents": get_trace_events(), "displayTimeUnit": "ms"}))
+
+
+def summarize_trace(events: Optional[List[dict]] = None) -> pd.DataFrame:
+    """
+    Summarize the recorded events per stage.
+
+    :param events: The trace events. If None, the recorded events are used.
+    :return: The data frame with the count, the total, mean and maximum wall time in seconds, the rows, the largest
+        change of the RSS over a run of the stage and the process peak RSS so far at the end of the stage in MiB of
+        each stage, sorted by the total time.
+    """
+    events = events if events is not None else get_trace_events()
+    columns: List[str] = ["Count", "TotalTime", "MeanTime", "MaxTime", "Rows", "RSSChange", "ProcessPeakRSS"]
+    if not events:
+        return pd.DataFrame(columns=columns)
+
+    records: pd.DataFrame = pd.DataFrame({
+        "Stage": [event["name"] for event in events],
+        "Time": [event["dur"] / 1e6 for event in events],
+        "Rows": [event["args"].get("rows", 0) for event in events],
+        "RSSChange": [(event["args"]["rss_end"] - event["args"]["rss_start"]) / 1024 ** 2
+                      if "rss_start" in event["args"] and "rss_end" in event["args"] else np.nan for event in events],
+        "ProcessPeakRSS": [event["args"].get("process_peak_rss", 0) / 1024 ** 2 for event in events],
+    })
+    summary: pd.DataFrame = records.groupby("Stage", sort=False).agg(
+        Count=("Time", "size"), TotalTime=("Time", "sum"), MeanTime=("Time", "mean"), MaxTime=("Time", "max"),
+        Rows=("Rows", "sum"), RSSChange=("RSSChange", "max"), ProcessPeakRSS=("ProcessPeakRSS", "max"))
+    summary.index.name = None
+    return summary.sort_values("TotalTime", ascending=False)[columns].round(4)
+
+
+@contextlib.contextmanager
+def instrumented_run(trace_file: Union[str, pathlib.Path, None] = None, print_summary: bool = True) -> Iterator[None]:
+    """
+    Record the stages of a run, and export the trace and print the summary at the end of the run.
+
+    :param trace_file: The trace file. If None, the trace is not exported.
+    :param print_summary: If True, the summary table is printed.
+    """
+    was_enabled: bool = _enabled
+    enable_instrumentation(True)
+    clear_trace_events()
+    try:
+        yield
+    finally:
+        enable_instrumentation(was_enabled)
+        _finish_run(trace_file=trace_file, print_summary=print_summary)
+
+
+def call_traced(function: Callable, *arguments) -> List[dict]:
+    """
+    Call a function in a worker process with the instrumentation enabled and return the events it recorded, so they
+    can be merged into the trace of the main process.
+
+    :param function: The function.
+    :param arguments: The arguments for the function.
+    :return: The list of trace events.
+    """
+    enable_instrumentation(True)
+    clear_trace_events()
+    function(*arguments)
+    return get_trace_events()
+
+
+def _finish_run(trace_file: Union[str, pathlib.Path, None], print_summary: bool) -> None:
+    """
+    Export the trace and print the summary.
+
+    :param trace_file: The trace file. If None, the trace is not exported.
+    :param print_summary: If True, the summary table is printed.
+    """
+    if trace_file is not None:
+        export_trace(trace_file)
+    if print_summary:
+        with pd.option_context("display.max_rows", None, "display.width", None):
+            print(summarize_trace())
+        if trace_file is not None:
+            print(f"Trace saved in {trace_file}")
+
+
+def _get_current_rss() -> Optional[int]:
+    """
+    Get the current resident set size of the process in bytes. /proc is used on Linux, and psutil (If it is installed)
+    on other platforms.
+
+    :return: The current RSS or None, if it can not be measured.
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def _get_process_peak_rss() -> Optional[int]:
+    """
+    Get the peak resident set size of the process so far in bytes. It is the high-water mark over the lifetime of the
+    process, so it never decreases. The resource module is used on Unix, and psutil (If it is installed) on other
+    platforms.
+
+    :return: The peak RSS or None, if it can not be measured.
+    """
+    try:
+        import resource
+        import sys
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss)
+    except ImportError:
+        return None
+
+
+if os.environ.get(TRACE_FILE_VARIABLE) and os.environ.get(f"_{TRACE_FILE_VARIABLE}_WORKER") is None:
+    # Mark the child processes, so only the main process exports the trace
+    os.environ[f"_{TRACE_FILE_VARIABLE}_WORKER"] = str(os.getpid())
+    enable_instrumentation(True)
+    atexit.register(_finish_run, trace_file=os.environ[TRACE_FILE_VARIABLE], print_summary=True)
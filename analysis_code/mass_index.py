@@ -0,0 +1,81 @@
+"""
+Tolerance-aware lookup of modification masses.
+
+The search engine does not always print the masses with the same precision (Fx. 15.9949 instead of 15.995), so the
+masses are matched within a tolerance in Da or ppm instead of by exact float or string equality.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+DEFAULT_MASS_TOLERANCE: float = 0.005
+
+
+def within_tolerance(observed, reference, tolerance: float = DEFAULT_MASS_TOLERANCE,
+                     ppm: Optional[float] = None) -> np.ndarray:
+    """
+    Check if the observed masses are within the tolerance of the reference masses.
+
+    :param observed: The observed masses.
+    :param reference: The reference masses.
+    :param tolerance: The absolute tolerance in Da.
+    :param ppm: The relative tolerance in ppm of the reference mass. If given, it is used instead of the tolerance.
+    :return: The mask of the masses within the tolerance.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    limit = np.abs(reference) * ppm * 1e-6 if ppm is not None else tolerance
+    return np.abs(np.asarray(observed, dtype=np.float64) - reference) <= limit
+
+
+@dataclass(frozen=True)
+class MassIndex:
+    """
+    The sorted modification masses and their names.
+    """
+    masses: np.ndarray
+    names: np.ndarray
+
+    def lookup(self, observed, tolerance: float = DEFAULT_MASS_TOLERANCE, ppm: Optional[float] = None) -> np.ndarray:
+        """
+        Find the closest modification of each of the observed masses with a binary search.
+
+        :param observed: The observed masses.
+        :param tolerance: The absolute tolerance in Da.
+        :param ppm: The relative tolerance in ppm. If given, it is used instead of the tolerance.
+        :return: The index of the modification for each of the observed masses, or -1 if none is within the tolerance.
+        """
+        observed = np.asarray(observed, dtype=np.float64)
+        if len(self.masses) == 0:
+            return np.full(observed.shape, -1, dtype=np.int64)
+        # The closest mass is either the first mass above or the last mass below the observed mass
+        upper: np.ndarray = np.clip(np.searchsorted(self.masses, observed), 0, len(self.masses) - 1)
+        lower: np.ndarray = np.clip(upper - 1, 0, len(self.masses) - 1)
+        closest: np.ndarray = np.where(np.abs(self.masses[lower] - observed) <= np.abs(self.masses[upper] - observed),
+                                       lower, upper)
+        return np.where(within_tolerance(observed, self.masses[closest], tolerance=tolerance, ppm=ppm), closest, -1)
+
+    def lookup_names(self, observed, tolerance: float = DEFAULT_MASS_TOLERANCE,
+                     ppm: Optional[float] = None) -> np.ndarray:
+        """
+        Get the modification name of each of the observed masses.
+
+        :param observed: The observed masses.
+        :param tolerance: The absolute tolerance in Da.
+        :param ppm: The relative tolerance in ppm. If given, it is used instead of the tolerance.
+        :return: The array with the modification names, or None if no modification is within the tolerance.
+        """
+        indexes: np.ndarray = self.lookup(observed, tolerance=tolerance, ppm=ppm)
+        return np.where(indexes >= 0, self.names[np.clip(indexes, 0, None)] if len(self.names) > 0 else None, None)
+
+
+def create_mass_index(modification_dict: Dict[float, str]) -> MassIndex:
+    """
+    Create the mass index from the dictionary with the modification mass and the name.
+
+    :param modification_dict: The dictionary with the modification mass and the name.
+    :return: The mass index.
+    """
+    masses: np.ndarray = np.array(list(modification_dict.keys()), dtype=np.float64)
+    order: np.ndarray = np.argsort(masses)
+    return MassIndex(masses=masses[order], names=np.array(list(modification_dict.values()), dtype=object)[order])
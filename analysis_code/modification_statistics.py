@@ -1,55 +1,168 @@
 import pathlib
 import re
-from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib.axes import Axes
-from tqdm import tqdm
 
+from .confidence_intervals import DEFAULT_CI_METHOD, LOWER_COLUMN, UPPER_COLUMN, add_confidence_intervals, \
+    draw_error_bars
+from .digestion import DigestionSettings, get_sequence_theoretical_coverage
+from .hit_store import HitStore
+from .instrumentation import trace_stage
+from .modification_table import ModificationTable, parse_modifications
+from .parallel import process_files
+from .peptide_list_cache import read_peptide_list
+from .prefetch import DEFAULT_PREFETCH, iterate_peptide_lists
+from .rendering import DEFAULT_FILE_FORMATS, show_or_save_figure
+from .result_sinks import write_result
 from .utils import get_residue_name
 
 
-def combine_spectra_in_peptide_lists(list_directory: pathlib.Path, save_directory: pathlib.Path) -> None:
+def combine_spectra_in_peptide_lists(list_directory: pathlib.Path, save_directory: pathlib.Path,
+                                     workers: Optional[int] = None) -> Dict[pathlib.Path, Exception]:
     """
     Combine the peptides in the peptide list and save it in a new directory.
 
     :param list_directory: The directory with the peptide lists.
     :param save_directory: The directory where the peptide list should be saved.
-    :return:
+    :param workers: The number of worker processes. If None, the lists are combined one at a time.
+    :return: The dictionary with the file and the error for each of the lists which could not be combined.
     """
     files_list = [(file, pathlib.Path(save_directory, f"{file.name}")) for file in list_directory.glob("*.xlsx")
                   if file.is_file()]
 
-    for input_file, output_file in tqdm(files_list):
-        # Read the file
-        df: pd.DataFrame = pd.read_excel(io=input_file, usecols=["from", "to", "seq", "modifs", "#"])
-        df.columns = ["Start", "End", "Sequence", "Modification", "Spectra"]
-        # Remove Q/E loss
-        for i, row in df.iterrows():
-            if row["Modification"] == "-":
-                continue
-            modification_list = []
-            # Loop over the modification
-            for mod in row["Modification"].split(" "):
-                residue_id = int(mod.split("@")[0])
-                residue = str(row["Sequence"])[residue_id - row["Start"]]
-                if residue not in ["Q", "E"]:
-                    modification_list.append(mod)
-
-            if len(modification_list) == 0:
-                df.at[i, "Modification"] = "-"
-            else:
-                df.at[i, "Modification"] = ";".join(modification_list)
-        # Sum the spectra (Assume that spectra with only Q/E modifications are the same as non-modified spectra)
-        df["Spectra"] = df.groupby(["Sequence", "Modification"])["Spectra"].transform("sum")
-        df = df.drop_duplicates(subset=["Sequence", "Modification"]).reset_index(drop=True)
-        df.to_excel(output_file)
+    return process_files(function=_combine_spectra_in_peptide_list, file_arguments=files_list, workers=workers)
+
+
+def _combine_spectra_in_peptide_list(input_file: pathlib.Path, output_file: pathlib.Path) -> None:
+    """
+    Combine the peptides in a single peptide list and save it.
+
+    :param input_file: The peptide list.
+    :param output_file: The file where the combined peptide list should be saved.
+    """
+    # Read the file
+    df: pd.DataFrame = read_peptide_list(input_file, usecols=["from", "to", "seq", "modifs", "#"])
+    df.columns = ["Start", "End", "Sequence", "Modification", "Spectra"]
+    with trace_stage("combine_spectra", category="aggregate", file=input_file, rows=len(df)):
+        df = _combine_spectra(peptide_list=df)
+    write_result(df, output_file)
+
+
+def _combine_spectra(peptide_list: pd.DataFrame) -> pd.DataFrame:
+    """
+    Remove the Q/E loss modifications and sum the spectra of the peptides with the same sequence and modifications.
+
+    :param peptide_list: The peptide list with the 'Start', 'End', 'Sequence', 'Modification' and 'Spectra' columns.
+    :return: The combined peptide list.
+    """
+    df: pd.DataFrame = peptide_list.reset_index(drop=True)
+    sequences: pd.Series = df["Sequence"].astype(str)
+    # Explode the modifications into a row per modification and get the residue position in the peptide
+    mods: pd.Series = df["Modification"][df["Modification"] != "-"].str.split(" ").explode()
+    rows: np.ndarray = mods.index.to_numpy()
+    lengths: np.ndarray = sequences.str.len().to_numpy()
+    residue_offsets: np.ndarray = mods.str.split("@", n=1).str[0].astype(int).to_numpy() - \
+        df["Start"].to_numpy()[rows]
+    residue_offsets = np.where(residue_offsets < 0, residue_offsets + lengths[rows], residue_offsets)
+    # Look up the residues in the concatenated sequences
+    sequence_offsets: np.ndarray = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    residue_buffer: np.ndarray = np.frombuffer("".join(sequences).encode(), dtype="S1")
+    residues: np.ndarray = residue_buffer[sequence_offsets[rows] + residue_offsets]
+    # Remove Q/E loss and join the remaining modifications of each peptide
+    kept: np.ndarray = ~np.isin(residues, [b"Q", b"E"])
+    kept_rows: np.ndarray = rows[kept]
+    df.loc[np.unique(rows), "Modification"] = "-"
+    if len(kept_rows) > 0:
+        row_starts: np.ndarray = np.flatnonzero(np.r_[True, kept_rows[1:] != kept_rows[:-1]])
+        joined_mods: np.ndarray = np.add.reduceat((";" + mods[kept]).to_numpy(dtype=object), row_starts)
+        df.loc[kept_rows[row_starts], "Modification"] = [mod[1:] for mod in joined_mods]
+    # Sum the spectra (Assume that spectra with only Q/E modifications are the same as non-modified spectra)
+    df = df.groupby(["Sequence", "Modification"], sort=False, dropna=False) \
+        .agg(Start=("Start", "first"), End=("End", "first"), Spectra=("Spectra", "sum")).reset_index()
+    return df[["Start", "End", "Sequence", "Modification", "Spectra"]]
+
+
+def calculate_modification_statistics(peptide_list_directory: pathlib.Path, sequence: str,
+                                      modifications: List[Tuple[str, str, float]],
+                                      hit_store: Optional[HitStore] = None,
+                                      confidence_interval: Optional[str] = DEFAULT_CI_METHOD,
+                                      prefetch: int = DEFAULT_PREFETCH,
+                                      digestion: Optional[DigestionSettings] = None) -> pd.DataFrame:
+    """
+    Calculate the modification percentages of all the modifications for each of the given lists in the directory.
+    Each list is read once, and all the modifications are calculated from it while the next lists are read.
+
+    :param peptide_list_directory: The directory with the peptide lists.
+    :param sequence: The protein sequence.
+    :param modifications: The list of tuples with the modification name, the residues as a string and the mass.
+    :param hit_store: The hit store the lists in the directory are ingested in. If given, the statistics are
+        calculated with SQL queries on the store instead of reading the lists.
+    :param confidence_interval: The method of the confidence intervals of the percentages ('wilson' or 'bootstrap').
+        If None, the intervals are not calculated.
+    :param prefetch: The number of lists read ahead on background threads.
+    :param digestion: The in-silico digestion settings. If given, only the residues which the digestion can produce
+        are counted, and the 'TheoreticalResidues' column with the number of those residues is added. It cannot be used
+        with a hit store.
+    :return: The data frame with a row per list and modification with the condition, the modification, the
+        percentage, the counts and the 'PercentageLower' and 'PercentageUpper' bounds of the confidence interval.
+    """
+    if hit_store is not None and digestion is not None:
+        raise ValueError("The modification statistics of a hit store cannot be normalized to a digestion")
+    if hit_store is not None:
+        statistics: pd.DataFrame = hit_store.modification_statistics(sequence=sequence, modifications=modifications,
+                                                                     source_directory=peptide_list_directory)
+        return add_confidence_intervals(statistics, method=confidence_interval) if confidence_interval is not None \
+            else statistics
+
+    directory = pathlib.Path(peptide_list_directory)
+    files = [file for file in directory.glob("*.xlsx") if file.is_file()]
+
+    rows: List[dict] = []
+    for file, df in iterate_peptide_lists(files, prefetch=prefetch, index_col=0):
+        condition_name: str = file.stem
+        with trace_stage("modification_statistics", category="aggregate", file=file, rows=len(df)):
+            list_statistics = _calculate_list_modification_statistics(peptide_list=df, sequence=sequence,
+                                                                      modifications=modifications,
+                                                                      digestion=digestion)
+        for mod_name, modified_spectra, total_spectra in list_statistics:
+            rows.append({"Condition": condition_name, "Modification": mod_name,
+                         "Percentage": round((modified_spectra / total_spectra) * 100, 2) if total_spectra != 0 else 0,
+                         "ModifiedSpectra": modified_spectra, "TotalModSpectra": total_spectra})
+
+    statistics = pd.DataFrame(rows, columns=["Condition", "Modification", "Percentage", "ModifiedSpectra",
+                                             "TotalModSpectra"])
+    if digestion is not None:
+        statistics["TheoreticalResidues"] = statistics["Modification"].map(
+            {mod_name: len(_get_residue_positions(sequence=sequence, residue_str=residue_str, digestion=digestion))
+             for mod_name, residue_str, _ in modifications}).astype(np.int64)
+    return add_confidence_intervals(statistics, method=confidence_interval) if confidence_interval is not None \
+        else statistics
+
+
+def split_modification_statistics(statistics: pd.DataFrame, condition_order: Optional[List[str]] = None) \
+        -> Dict[str, pd.DataFrame]:
+    """
+    Split the modification statistics into a data frame per modification indexed by the condition.
+
+    :param statistics: The modification statistics from 'calculate_modification_statistics'.
+    :param condition_order: The order of the conditions. If None, the order of the statistics is used.
+    :return: The dictionary with the modification name and the statistics of the modification.
+    """
+    result: Dict[str, pd.DataFrame] = {}
+    for mod_name in statistics["Modification"].unique():
+        mod_df: pd.DataFrame = statistics[statistics["Modification"] == mod_name].set_index("Condition")
+        mod_df = mod_df.drop(columns="Modification")
+        mod_df.index.name = None
+        result[mod_name] = mod_df.reindex(condition_order) if condition_order is not None else mod_df
+    return result
 
 
 def calculate_modification_percentages(peptide_list_directory: pathlib.Path, sequence: str,
-                                       residue_str: str, mod_mass: float) -> dict:
+                                       residue_str: str, mod_mass: float,
+                                       hit_store: Optional[HitStore] = None,
+                                       confidence_interval: Optional[str] = DEFAULT_CI_METHOD) -> dict:
     """
     Calculate the modification percentages for each of the given lists in the directory.
 
@@ -57,54 +170,108 @@ def calculate_modification_percentages(peptide_list_directory: pathlib.Path, seq
     :param sequence: The protein sequence.
     :param residue_str: The residues to calculate modifications for as a string.
     :param mod_mass: The modification mass.
-    :return: The modification percentage and counts for each of the given lists.
+    :param hit_store: The hit store the lists in the directory are ingested in. If given, the percentages are
+        calculated with SQL queries on the store instead of reading the lists.
+    :param confidence_interval: The method of the confidence intervals of the percentages ('wilson' or 'bootstrap').
+        If None, the intervals are not calculated.
+    :return: The modification percentage, counts and confidence interval for each of the given lists.
     """
-    directory = pathlib.Path(peptide_list_directory)
-    files = [(file.stem, file) for file in directory.glob("*.xlsx") if file.is_file()]
-    residues = [match.start() + 1 for match in re.finditer(f"[{residue_str}]", sequence.upper())]
-    mod_dict: defaultdict = defaultdict(lambda: {"Percentage": 0, "ModifiedSpectra": 0, "TotalModSpectra": 0})
+    statistics: pd.DataFrame = calculate_modification_statistics(peptide_list_directory=peptide_list_directory,
+                                                                 sequence=sequence,
+                                                                 modifications=[("", residue_str, mod_mass)],
+                                                                 hit_store=hit_store,
+                                                                 confidence_interval=confidence_interval)
+    statistics = statistics.set_index("Condition")[[column for column in [
+        "Percentage", "ModifiedSpectra", "TotalModSpectra", LOWER_COLUMN, UPPER_COLUMN] if column in statistics]]
+    return statistics.to_dict(orient="index")
 
-    for condition_name, file in files:
-        oxidized_spectra_count: int = 0
-        total_oxidation_spectra_count: int = 0
 
-        df: pd.DataFrame = pd.read_excel(file, index_col=0)
-        for _, row in df.iterrows():
-            if any([res for res in residue_str if res in row["Sequence"]]):
-                total_oxidation_spectra_count += row["Spectra"]
-                if not not re.search(f"[{'|'.join([str(res) for res in residues])}]@{mod_mass}", row["Modification"]):
-                    oxidized_spectra_count += row["Spectra"]
+def _calculate_list_modification_statistics(peptide_list: pd.DataFrame, sequence: str,
+                                            modifications: List[Tuple[str, str, float]],
+                                            digestion: Optional[DigestionSettings] = None) \
+        -> List[Tuple[str, int, int]]:
+    """
+    Calculate the modified and total spectra count of each modification in a single peptide list.
 
-        if total_oxidation_spectra_count == 0:
-            mod_dict[condition_name]["Percentage"] = 0
-        else:
-            mod_dict[condition_name]["Percentage"] = round((oxidized_spectra_count / total_oxidation_spectra_count)
-                                                           * 100, 2)
-        mod_dict[condition_name]["ModifiedSpectra"] = oxidized_spectra_count
-        mod_dict[condition_name]["TotalModSpectra"] = total_oxidation_spectra_count
+    :param peptide_list: The peptide list.
+    :param sequence: The protein sequence.
+    :param modifications: The list of tuples with the modification name, the residues as a string and the mass.
+    :param digestion: The in-silico digestion settings. If given, only the peptides covering one of the residues which
+        the digestion can produce are counted.
+    :return: The list of tuples with the modification name, the modified and the total spectra count.
+    """
+    spectra: np.ndarray = peptide_list["Spectra"].to_numpy()
+    sequences: pd.Series = peptide_list["Sequence"].astype(str)
+    mod_table: ModificationTable = parse_modifications(peptide_list["Modification"])
+
+    result: List[Tuple[str, int, int]] = []
+    for mod_name, residue_str, mod_mass in modifications:
+        residues = _get_residue_positions(sequence=sequence, residue_str=residue_str, digestion=digestion)
+        # Spectra of peptides containing one of the residues
+        modifiable: np.ndarray = sequences.str.contains(f"[{residue_str}]").to_numpy()
+        if digestion is not None:
+            # Spectra of peptides covering one of the residues the digestion can produce
+            starts: np.ndarray = peptide_list["Start"].to_numpy(dtype=np.int64)
+            ends: np.ndarray = peptide_list["End"].to_numpy(dtype=np.int64)
+            modifiable = modifiable & (np.searchsorted(residues, ends, side="right") >
+                                       np.searchsorted(residues, starts))
+        # Spectra of peptides with the modification on one of the residues
+        modified: np.ndarray = modifiable & mod_table.any_per_row(
+            np.isin(mod_table.positions, residues) & mod_table.mass_mask(mod_mass))
+        result.append((mod_name, int(spectra[modified].sum()), int(spectra[modifiable].sum())))
 
-    return mod_dict
+    return result
 
 
-def create_modification_barplot(data: pd.DataFrame, mod_name: str, residues: str, condition_title: str) -> None:
+def _get_residue_positions(sequence: str, residue_str: str,
+                           digestion: Optional[DigestionSettings] = None) -> np.ndarray:
+    """
+    Get the positions of the residues in a sequence.
+
+    :param sequence: The protein sequence.
+    :param residue_str: The residues as a string.
+    :param digestion: The in-silico digestion settings. If given, only the residues covered by the digestion products
+        are returned.
+    :return: The sorted positions (1-based) of the residues.
+    """
+    residues: np.ndarray = np.array([match.start() + 1 for match in re.finditer(f"[{residue_str}]", sequence.upper())],
+                                    dtype=np.int64)
+    if digestion is None:
+        return residues
+    return residues[get_sequence_theoretical_coverage(sequence, settings=digestion)[residues - 1] > 0]
+
+
+def create_modification_barplot(data: pd.DataFrame, mod_name: str, residues: str, condition_title: str,
+                                output_directory: Optional[pathlib.Path] = None,
+                                file_formats: Sequence[str] = DEFAULT_FILE_FORMATS) -> None:
     """
     Create the modification bar plot.
 
-    :param data: The data.
+    :param data: The data. If it has the confidence interval columns, the intervals are drawn as error bars.
     :param mod_name: The modification name.
     :param residues: The residues to show.
     :param condition_title: The condition information to show in the plot title.
+    :param output_directory: The directory where the plot is saved. If None, the plot is shown.
+    :param file_formats: The file formats the plot is saved in.
     """
-    chart: Axes = sns.barplot(data=data, x=data.index, y="Percentage")
-    chart.set_title(f"Total {mod_name} of {' and '.join(get_residue_name(res) for res in residues)}")
-    chart.set_xlabel("Condition")
-    chart.set_ylabel("Percentage\n(Spectra count/Total spectra count)")
+    # The plotting libraries are imported here, so the statistics can be calculated without importing them
+    import seaborn as sns
+    from matplotlib.axes import Axes
+
+    with trace_stage("modification_barplot", category="plot", rows=len(data)):
+        chart: Axes = sns.barplot(data=data, x=data.index, y="Percentage")
+        chart.set_title(f"Total {mod_name} of {' and '.join(get_residue_name(res) for res in residues)}")
+        chart.set_xlabel("Condition")
+        chart.set_ylabel("Percentage\n(Spectra count/Total spectra count)")
+        # The labels are placed above the error bars of the confidence intervals
+        label_heights: np.ndarray = draw_error_bars(axes=chart, data=data)
 
-    for idx, p in enumerate(chart.patches):
-        chart.annotate(f"{p.get_height()} %\n"
-                       f"({int(data.iloc[idx]['ModifiedSpectra'])}/{int(data.iloc[idx]['TotalModSpectra'])})",
-                       (p.get_x() + p.get_width() / 2., p.get_height()),
-                       ha='center', va='center', fontsize=12, color='black', xytext=(0, 12),
-                       textcoords='offset points')
+        for idx, p in enumerate(chart.patches):
+            chart.annotate(f"{p.get_height()} %\n"
+                           f"({int(data.iloc[idx]['ModifiedSpectra'])}/{int(data.iloc[idx]['TotalModSpectra'])})",
+                           (p.get_x() + p.get_width() / 2., label_heights[idx]),
+                           ha='center', va='bottom', fontsize=12, color='black', xytext=(0, 3),
+                           textcoords='offset points')
 
-    plt.show()
+        show_or_save_figure(figure=chart.figure, output_directory=output_directory,
+                            file_name=f"{mod_name}_{residues}", file_formats=file_formats)
@@ -0,0 +1,102 @@
+"""
+Parsed representation of the modifications in a peptide list.
+
+The modification strings (Fx. '105@15.995 137@-33.988') are parsed once into flat arrays in CSR style, so the
+statistics can be calculated as masks over the arrays instead of string operations on each row.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import trace_stage
+from .mass_index import DEFAULT_MASS_TOLERANCE, within_tolerance
+
+
+@dataclass(frozen=True)
+class ModificationTable:
+    """
+    The modifications of a peptide list. The modifications of row i are at the indexes
+    row_offsets[i]:row_offsets[i + 1] in the position and mass arrays.
+    """
+    positions: np.ndarray
+    masses: np.ndarray
+    row_offsets: np.ndarray
+
+    @property
+    def row_count(self) -> int:
+        """
+        The number of rows (Peptides) in the table.
+        """
+        return len(self.row_offsets) - 1
+
+    @property
+    def rows(self) -> np.ndarray:
+        """
+        The owning row of each modification.
+        """
+        return np.repeat(np.arange(self.row_count), np.diff(self.row_offsets))
+
+    def mass_mask(self, mass: float, tolerance: float = DEFAULT_MASS_TOLERANCE,
+                  ppm: Optional[float] = None) -> np.ndarray:
+        """
+        Get the mask of the modifications with the given mass.
+
+        :param mass: The modification mass.
+        :param tolerance: The absolute mass tolerance in Da.
+        :param ppm: The relative mass tolerance in ppm. If given, it is used instead of the tolerance.
+        :return: The mask over the modifications.
+        """
+        return within_tolerance(self.masses, mass, tolerance=tolerance, ppm=ppm)
+
+    def any_per_row(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Check for each row if any of its modifications is in the mask.
+
+        :param mask: The mask over the modifications.
+        :return: The mask over the rows.
+        """
+        return np.bincount(self.rows[mask], minlength=self.row_count) > 0
+
+    def count_per_position(self, mask: np.ndarray, weights: Optional[np.ndarray] = None,
+                           length: Optional[int] = None) -> np.ndarray:
+        """
+        Count the modifications in the mask at each position.
+
+        :param mask: The mask over the modifications.
+        :param weights: The weight of each row (Fx. the spectra count). If None, each modification counts as one.
+        :param length: The protein length. If None, the largest modified position is used.
+        :return: The array with the count at each position. The index is the position, so index 0 is unused.
+        """
+        positions: np.ndarray = self.positions[mask]
+        if weights is not None:
+            weights = np.asarray(weights)[self.rows[mask]]
+        minlength: int = length + 1 if length is not None else 0
+        counts: np.ndarray = np.bincount(positions, weights=weights, minlength=minlength)
+        return counts[:minlength] if length is not None else counts
+
+
+def parse_modifications(modifications: pd.Series) -> ModificationTable:
+    """
+    Parse the modification column of a peptide list. The modifications can be separated by ' ' (Raw lists) or ';'
+    (Combined lists), and the position can be prefixed by the residue (Fx. 'M105@15.995').
+
+    :param modifications: The modification column.
+    :return: The modification table with a row for each row in the column.
+    """
+    with trace_stage("parse_modifications", category="parse", rows=len(modifications)):
+        tokens: pd.Series = modifications.reset_index(drop=True).fillna("-").astype(str) \
+            .str.replace(";", " ", regex=False).str.split().explode()
+        tokens = tokens[tokens.str.contains("@", regex=False, na=False)]
+        parts: pd.DataFrame = tokens.str.split("@", n=1, expand=True) if len(tokens) > 0 else \
+            pd.DataFrame({0: pd.Series(dtype=str), 1: pd.Series(dtype=str)})
+        positions: pd.Series = pd.to_numeric(parts[0].str.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"), errors="coerce")
+        masses: pd.Series = pd.to_numeric(parts[1], errors="coerce")
+        valid: pd.Series = positions.notna() & masses.notna()
+
+    rows: np.ndarray = tokens.index.to_numpy()[valid.to_numpy()]
+    row_offsets: np.ndarray = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(modifications)))))
+    return ModificationTable(positions=positions[valid].to_numpy(dtype=np.int64),
+                             masses=masses[valid].to_numpy(dtype=np.float64),
+                             row_offsets=row_offsets.astype(np.int64))
@@ -0,0 +1,63 @@
+"""
+Processing of independent peptide list files (Or other independent items) in a process pool.
+"""
+import concurrent.futures
+import pathlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .instrumentation import call_traced, is_instrumentation_enabled, record_event, trace_stage
+
+
+def process_files(function: Callable, file_arguments: List[Tuple[pathlib.Path, ...]],
+                  workers: Optional[int] = None) -> Dict[pathlib.Path, Exception]:
+    """
+    Call the function for each of the files with a single progress bar for the whole batch.
+    A failing file is reported and the remaining files are still processed.
+
+    :param function: The module level function processing a single file. It must be picklable if workers are used.
+    :param file_arguments: The list of argument tuples for the function. The first argument must identify the item
+        (Fx. the input file) and is used when reporting errors.
+    :param workers: The number of worker processes. If None or 1, the files are processed in the current process.
+    :return: The dictionary with the first argument and the error for each of the failed files.
+    """
+    from tqdm import tqdm
+
+    errors: Dict[pathlib.Path, Exception] = {}
+
+    with tqdm(total=len(file_arguments)) as progress_bar:
+        if workers is None or workers <= 1:
+            for arguments in file_arguments:
+                try:
+                    _process_file(function, *arguments)
+                except Exception as error:
+                    errors[arguments[0]] = error
+                    progress_bar.write(f"Failed to process {arguments[0]}: {error}")
+                progress_bar.update()
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                # With the instrumentation enabled, the events recorded in the workers are merged into the trace
+                traced: bool = is_instrumentation_enabled()
+                futures = {executor.submit(call_traced, _process_file, function, *arguments) if traced else
+                           executor.submit(function, *arguments): arguments[0] for arguments in file_arguments}
+                for future in concurrent.futures.as_completed(futures):
+                    error = future.exception()
+                    if error is not None:
+                        errors[futures[future]] = error
+                        progress_bar.write(f"Failed to process {futures[future]}: {error}")
+                    elif traced:
+                        for event in future.result():
+                            record_event(event)
+                    progress_bar.update()
+
+    return errors
+
+
+def _process_file(function: Callable, *arguments) -> None:
+    """
+    Call the function for a single file and record it as a stage.
+
+    :param function: The function processing a single file.
+    :param arguments: The arguments for the function.
+    """
+    with trace_stage(function.__name__.strip("_"), category="file", file=arguments[0]):
+        function(*arguments)
@@ -0,0 +1,218 @@
+"""
+Columnar on-disk cache for the parsed peptide lists.
+
+Parsing the Excel peptide lists is by far the slowest step of the analysis, so each list is parsed once and stored as
+a Parquet file. Later loads of the same list (Same path, size, modification time, content and read arguments) are
+served from the cache.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from typing import Optional, Tuple, Union
+
+import pandas as pd
+
+from .instrumentation import trace_stage
+
+CACHE_DIRECTORY_VARIABLE: str = "PEPTIDE_LIST_CACHE_DIR"
+CACHE_DISABLE_VARIABLE: str = "PEPTIDE_LIST_CACHE_DISABLE"
+DEFAULT_CACHE_DIRECTORY: pathlib.Path = pathlib.Path.home() / ".cache" / "master_thesis_analysis" / "peptide_lists"
+DEFAULT_MAX_CACHE_SIZE: int = 2 * 1024 ** 3
+
+_cache_enabled: bool = True
+
+
+def set_peptide_list_cache_enabled(enabled: bool) -> None:
+    """
+    Enable or disable the peptide list cache for the current process.
+    The cache can also be disabled by setting the 'PEPTIDE_LIST_CACHE_DISABLE' environment variable.
+
+    :param enabled: True, if the cache should be used; Otherwise, False.
+    """
+    global _cache_enabled
+    _cache_enabled = enabled
+
+
+def get_cache_directory() -> pathlib.Path:
+    """
+    Get the cache directory. The 'PEPTIDE_LIST_CACHE_DIR' environment variable overrides the default directory.
+
+    :return: The cache directory.
+    """
+    return pathlib.Path(os.environ.get(CACHE_DIRECTORY_VARIABLE, DEFAULT_CACHE_DIRECTORY))
+
+
+def read_peptide_list(file_path: Union[str, pathlib.Path], use_cache: Optional[bool] = None,
+                      cache_directory: Optional[pathlib.Path] = None, max_cache_size: int = DEFAULT_MAX_CACHE_SIZE,
+                      **read_kwargs) -> pd.DataFrame:
+    """
+    Read a peptide list through the cache. The keyword arguments are passed to 'pd.read_excel' and are part of the
+    cache key, so the same file read with different columns is cached separately.
+
+    :param file_path: The peptide list file.
+    :param use_cache: True or False to force or bypass the cache. If None, the global setting is used.
+    :param cache_directory: The cache directory. If None, the default cache directory is used.
+    :param max_cache_size: The maximum size of the cache in bytes. The least recently used entries are removed first.
+    :param read_kwargs: The keyword arguments for 'pd.read_excel'.
+    :return: The peptide list.
+    """
+    file_path = pathlib.Path(file_path)
+    with trace_stage("read_peptide_list", category="io", file=file_path) as stage:
+        peptide_list, stage["cache"] = _read_through_cache(file_path=file_path, use_cache=use_cache,
+                                                           cache_directory=cache_directory,
+                                                           max_cache_size=max_cache_size, read_kwargs=read_kwargs)
+        stage["rows"] = len(peptide_list)
+    return peptide_list
+
+
+def _read_through_cache(file_path: pathlib.Path, use_cache: Optional[bool], cache_directory: Optional[pathlib.Path],
+                        max_cache_size: int, read_kwargs: dict) -> Tuple[pd.DataFrame, str]:
+    """
+    Read a peptide list through the cache.
+
+    :param file_path: The peptide list file.
+    :param use_cache: True or False to force or bypass the cache. If None, the global setting is used.
+    :param cache_directory: The cache directory. If None, the default cache directory is used.
+    :param max_cache_size: The maximum size of the cache in bytes.
+    :param read_kwargs: The keyword arguments for 'pd.read_excel'.
+    :return: The tuple with the peptide list and 'hit', 'miss' or 'disabled' depending on the use of the cache.
+    """
+    if not _use_cache(use_cache):
+        return pd.read_excel(file_path, **read_kwargs), "disabled"
+
+    cache_directory = pathlib.Path(cache_directory) if cache_directory is not None else get_cache_directory()
+    entry_key: str = f"{_path_key(file_path)}-{_arguments_key(read_kwargs)}"
+    cache_file: pathlib.Path = cache_directory / f"{entry_key}-{_content_key(file_path)}.parquet"
+
+    # Serve the list from the cache and mark the entry as recently used
+    if cache_file.is_file():
+        try:
+            peptide_list: pd.DataFrame = pd.read_parquet(cache_file)
+            os.utime(cache_file)
+            return peptide_list, "hit"
+        except (ImportError, OSError, ValueError):
+            cache_file.unlink(missing_ok=True)
+
+    peptide_list = pd.read_excel(file_path, **read_kwargs)
+    _write_cache_entry(peptide_list=peptide_list, cache_file=cache_file, entry_key=entry_key,
+                       max_cache_size=max_cache_size)
+    return peptide_list, "miss"
+
+
+def clear_peptide_list_cache(file_path: Union[str, pathlib.Path, None] = None,
+                             cache_directory: Optional[pathlib.Path] = None) -> int:
+    """
+    Invalidate the cache entries of a single peptide list or the whole cache.
+
+    :param file_path: The peptide list to invalidate. If None, all entries are removed.
+    :param cache_directory: The cache directory. If None, the default cache directory is used.
+    :return: The number of removed entries.
+    """
+    cache_directory = pathlib.Path(cache_directory) if cache_directory is not None else get_cache_directory()
+    pattern: str = f"{_path_key(pathlib.Path(file_path))}-*.parquet" if file_path is not None else "*.parquet"
+    removed: int = 0
+    for cache_file in cache_directory.glob(pattern):
+        cache_file.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def _use_cache(use_cache: Optional[bool]) -> bool:
+    """
+    Check if the cache should be used.
+
+    :param use_cache: The explicit choice of the caller or None.
+    :return: True, if the cache should be used; Otherwise, False.
+    """
+    if use_cache is not None:
+        return use_cache
+    return _cache_enabled and not os.environ.get(CACHE_DISABLE_VARIABLE)
+
+
+def _path_key(file_path: pathlib.Path) -> str:
+    """
+    Get the part of the cache key identifying the file path.
+
+    :param file_path: The peptide list file.
+    :return: The path key.
+    """
+    return hashlib.sha1(str(file_path.resolve()).encode()).hexdigest()[:16]
+
+
+def _arguments_key(read_kwargs: dict) -> str:
+    """
+    Get the part of the cache key identifying the read arguments.
+
+    :param read_kwargs: The keyword arguments for 'pd.read_excel'.
+    :return: The arguments key.
+    """
+    return hashlib.sha1(json.dumps(read_kwargs, sort_keys=True, default=str).encode()).hexdigest()[:8]
+
+
+def _content_key(file_path: pathlib.Path) -> str:
+    """
+    Get the part of the cache key identifying the size, modification time and content of the file.
+
+    :param file_path: The peptide list file.
+    :return: The content key.
+    """
+    stat: os.stat_result = file_path.stat()
+    digest = hashlib.sha256()
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}:".encode())
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def _write_cache_entry(peptide_list: pd.DataFrame, cache_file: pathlib.Path, entry_key: str,
+                       max_cache_size: int) -> None:
+    """
+    Write a cache entry, remove the stale entries of the same file and read arguments, and enforce the cache size.
+    Lists which cannot be stored as Parquet (Fx. mixed column types or no Parquet engine) are not cached.
+
+    :param peptide_list: The parsed peptide list.
+    :param cache_file: The cache file.
+    :param entry_key: The path and arguments key of the entry.
+    :param max_cache_size: The maximum size of the cache in bytes.
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # The temporary file is unique to the process and thread, as the lists can be read by concurrent readers
+    temporary_file: pathlib.Path = cache_file.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        peptide_list.to_parquet(temporary_file)
+    except (ImportError, ValueError, TypeError):
+        temporary_file.unlink(missing_ok=True)
+        return
+    os.replace(temporary_file, cache_file)
+
+    for stale_file in cache_file.parent.glob(f"{entry_key}-*.parquet"):
+        if stale_file != cache_file:
+            stale_file.unlink(missing_ok=True)
+
+    _evict_least_recently_used(cache_directory=cache_file.parent, max_cache_size=max_cache_size)
+
+
+def _evict_least_recently_used(cache_directory: pathlib.Path, max_cache_size: int) -> None:
+    """
+    Remove the least recently used cache entries until the cache is within the size limit.
+
+    :param cache_directory: The cache directory.
+    :param max_cache_size: The maximum size of the cache in bytes.
+    """
+    entries = []
+    for entry in cache_directory.glob("*.parquet"):
+        # The entry can be removed by a concurrent reader
+        try:
+            entries.append((entry.stat(), entry))
+        except FileNotFoundError:
+            continue
+    entries.sort(key=lambda entry: entry[0].st_mtime_ns)
+    cache_size: int = sum(stat.st_size for stat, _ in entries)
+    for stat, entry in entries:
+        if cache_size <= max_cache_size:
+            break
+        entry.unlink(missing_ok=True)
+        cache_size -= stat.st_size
@@ -0,0 +1,153 @@
+"""
+Compact in-memory table of the peptides of many conditions.
+
+The peptide lists of the conditions of an experiment share most of their peptide strings, so the sequences and the
+modifications are dictionary encoded as categoricals with a single set of categories shared by all the conditions. The
+positions are stored as uint16 (Or int32 for longer proteins) and the spectra as int32, so the table takes a fraction
+of the memory of the concatenated peptide lists with object and int64 columns.
+"""
+import pathlib
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import trace_stage
+from .peptide_list_cache import read_peptide_list
+from .prefetch import DEFAULT_PREFETCH, iterate_prefetched
+
+# The columns of the raw peptide lists and the corresponding columns of the combined peptide lists
+RAW_LIST_COLUMNS: Dict[str, str] = {"from": "Start", "to": "End", "seq": "Sequence", "modifs": "Modification",
+                                    "#": "Spectra"}
+PEPTIDE_LIST_COLUMNS: List[str] = ["Start", "End", "Sequence", "Modification", "Spectra"]
+
+
+@dataclass(frozen=True)
+class PeptideTable:
+    """
+    The peptides of a set of conditions with the categorical 'Condition', 'Sequence' and 'Modification' columns and the
+    narrow integer 'Start', 'End' and 'Spectra' columns. Peptides without modifications have the modification '-'.
+    """
+    data: pd.DataFrame
+
+    @property
+    def conditions(self) -> List[str]:
+        """
+        The conditions in the order they were loaded.
+        """
+        return list(self.data["Condition"].cat.categories)
+
+    def get_condition(self, condition: str) -> pd.DataFrame:
+        """
+        Get the peptide list of a condition.
+
+        :param condition: The condition.
+        :return: The peptide list with the 'Start', 'End', 'Sequence', 'Modification' and 'Spectra' columns. The
+            sequences and modifications are still categorical.
+        """
+        return self.data.loc[self.data["Condition"] == condition, PEPTIDE_LIST_COLUMNS].reset_index(drop=True)
+
+    def memory_usage(self) -> int:
+        """
+        Get the memory used by the table, including the categories.
+
+        :return: The memory usage in bytes.
+        """
+        return int(self.data.memory_usage(index=True, deep=True).sum())
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def read_peptide_table(peptide_lists: Union[str, pathlib.Path, Sequence[Union[str, pathlib.Path]]],
+                       prefetch: int = DEFAULT_PREFETCH) -> PeptideTable:
+    """
+    Load peptide lists (XLSX) directly into a compact peptide table. The lists are encoded one at a time while the next
+    lists are read, so only the prefetched lists are held with object columns.
+
+    :param peptide_lists: The directory with the peptide lists, or the list of peptide list files. Both raw and combined
+        peptide lists can be read. The condition is the file name without the suffix.
+    :param prefetch: The number of lists read ahead on background threads.
+    :return: The peptide table.
+    """
+    if isinstance(peptide_lists, (str, pathlib.Path)) and pathlib.Path(peptide_lists).is_dir():
+        files: List[pathlib.Path] = sorted(file for file in pathlib.Path(peptide_lists).glob("*.xlsx")
+                                           if file.is_file())
+    else:
+        files = [pathlib.Path(file) for file in ([peptide_lists] if isinstance(peptide_lists, (str, pathlib.Path))
+                                                 else peptide_lists)]
+
+    sequences: _StringEncoder = _StringEncoder()
+    modifications: _StringEncoder = _StringEncoder()
+    parts: List[Tuple[np.ndarray, ...]] = []
+    for file, peptide_list in iterate_prefetched(function=read_list_columns, items=files, prefetch=prefetch):
+        with trace_stage("encode_peptide_list", category="parse", file=file, rows=len(peptide_list)):
+            parts.append((peptide_list["Start"].to_numpy(dtype=np.int64), peptide_list["End"].to_numpy(dtype=np.int64),
+                          sequences.encode(peptide_list["Sequence"].astype(str)),
+                          modifications.encode(peptide_list["Modification"].fillna("-").astype(str)),
+                          peptide_list["Spectra"].to_numpy(dtype=np.int64)))
+
+    def concatenate(column: int) -> np.ndarray:
+        return np.concatenate([part[column] for part in parts]) if parts else np.zeros(0, dtype=np.int64)
+
+    starts, ends, spectra = concatenate(0), concatenate(1), concatenate(4)
+    position_type: type = np.uint16 if len(ends) == 0 or (starts.min() >= 0 and ends.max() <= np.iinfo(np.uint16).max) \
+        else np.int32
+    return PeptideTable(data=pd.DataFrame({
+        "Condition": pd.Categorical.from_codes(np.repeat(np.arange(len(files)), [len(part[0]) for part in parts]),
+                                               categories=[file.stem for file in files]),
+        "Start": starts.astype(position_type),
+        "End": ends.astype(position_type),
+        "Sequence": sequences.to_categorical(concatenate(2)),
+        "Modification": modifications.to_categorical(concatenate(3)),
+        "Spectra": spectra.astype(np.int32),
+    }))
+
+
+def read_list_columns(file: Union[str, pathlib.Path]) -> pd.DataFrame:
+    """
+    Read a raw or combined peptide list with the combined peptide list columns.
+
+    :param file: The peptide list.
+    :return: The peptide list with the 'Start', 'End', 'Sequence', 'Modification' and 'Spectra' columns. The rows
+        without a position or a sequence are removed.
+    """
+    peptide_list: pd.DataFrame = read_peptide_list(file).rename(columns=RAW_LIST_COLUMNS)
+    missing: List[str] = [column for column in PEPTIDE_LIST_COLUMNS if column not in peptide_list.columns]
+    if missing:
+        raise ValueError(f"The peptide list {file} is missing the columns: {', '.join(missing)}")
+    return peptide_list[PEPTIDE_LIST_COLUMNS].dropna(subset=["Start", "End", "Sequence"])
+
+
+class _StringEncoder:
+    """
+    Dictionary encoding of strings with categories shared across several columns.
+    """
+
+    def __init__(self):
+        self._categories: pd.Index = pd.Index([], dtype=object)
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        """
+        Encode the values, adding the new values to the categories.
+
+        :param values: The strings.
+        :return: The code of each value.
+        """
+        codes, uniques = pd.factorize(values)
+        category_codes: np.ndarray = self._categories.get_indexer(uniques)
+        new: np.ndarray = category_codes < 0
+        if new.any():
+            category_codes[new] = np.arange(len(self._categories), len(self._categories) + new.sum())
+            self._categories = self._categories.append(pd.Index(uniques[new], dtype=object))
+        return category_codes[codes].astype(np.int32)
+
+    def to_categorical(self, codes: np.ndarray) -> pd.Categorical:
+        """
+        Create the categorical column of the codes.
+
+        :param codes: The codes.
+        :return: The categorical column.
+        """
+        return pd.Categorical.from_codes(codes, categories=self._categories)
@@ -0,0 +1,268 @@
+"""
+Incremental pipeline for the peptide list analysis (Convert -> combine -> statistics -> plots).
+
+The stages are declared as a dependency graph and driven by a JSON config file. Each stage records the content hashes
+of its inputs in a state file in the base directory, and only the inputs which changed since the last run are
+processed again.
+
+The config file has the following keys. The directories and files are relative to the base directory.
+    base_directory: The base directory. Default is the directory of the config file.
+    xls_directory: The directory with the old Excel (XLS) peptide lists. If missing, the convert stage is skipped.
+    list_directory: The directory with the peptide lists (XLSX). Default is the XLS directory.
+    combined_directory: The directory where the combined peptide lists are saved.
+    protein: The protein name in the protein registry. Default CRT.
+    mature: If true, the mature protein sequence is used. Default true.
+    modifications: The list of [name, residues, mass] of the modifications.
+    condition_order: The order of the conditions in the statistics. Optional.
+    statistics_file: The file where the statistics are saved (XLSX, Parquet or CSV). Default 'ModStats.xlsx'.
+    figure_directory: The directory where the plots are saved. If missing, the plots stage is skipped.
+    figure_formats: The file formats of the plots. Default ['png'].
+    workers: The number of worker processes. Optional.
+
+Usage: python run_pipeline.py config.json [--stages STAGE ...] [--force] [--trace TRACE_FILE]
+"""
+import argparse
+import graphlib
+import hashlib
+import json
+import pathlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .convert_peptide_list import _convert_peptide_list_file
+from .instrumentation import instrumented_run, trace_stage
+from .modification_statistics import _combine_spectra_in_peptide_list, calculate_modification_statistics, \
+    create_modification_barplot, split_modification_statistics
+from .parallel import process_files
+from .proteins import get_protein_sequence
+from .rendering import render_figures
+from .result_sinks import get_result_files, open_result_sink, read_result_tables
+
+STATE_FILE_NAME: str = ".pipeline_state.json"
+
+# The stages and the stages they depend on
+STAGES: Dict[str, List[str]] = {
+    "convert": [],
+    "combine": ["convert"],
+    "statistics": ["combine"],
+    "plots": ["statistics"],
+}
+
+
+def run_pipeline(config_file: pathlib.Path, stages: Optional[List[str]] = None, force: bool = False) -> None:
+    """
+    Run the pipeline. Only the inputs which changed since the last run are processed.
+
+    :param config_file: The JSON config file.
+    :param stages: The stages to run. Their dependencies are run as well. If None, all stages are run.
+    :param force: If True, all inputs are processed regardless of the recorded state.
+    """
+    config_file = pathlib.Path(config_file)
+    with open(config_file, "r") as file:
+        config: dict = json.load(file)
+    base_directory: pathlib.Path = config_file.parent / config.get("base_directory", ".")
+
+    state_file: pathlib.Path = base_directory / STATE_FILE_NAME
+    state: dict = json.loads(state_file.read_text()) if state_file.is_file() else {}
+
+    for stage in _get_stage_order(stages if stages is not None else list(STAGES.keys())):
+        print("*" * 5, stage, "*" * 5)
+        with trace_stage(f"pipeline:{stage}", category="pipeline"):
+            state[stage] = _STAGE_FUNCTIONS[stage](config, base_directory, {} if force else state.get(stage, {}))
+        # Save the state after each stage, so the finished work is kept if a later stage fails
+        state_file.write_text(json.dumps(state, indent=2))
+
+
+def _get_stage_order(stages: List[str]) -> List[str]:
+    """
+    Get the stages and their dependencies in the order they should be run.
+
+    :param stages: The requested stages.
+    :return: The ordered list of stages.
+    """
+    required: set = set()
+    pending: List[str] = list(stages)
+    while pending:
+        stage: str = pending.pop()
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}'. The stages are: {', '.join(STAGES)}")
+        if stage not in required:
+            required.add(stage)
+            pending.extend(STAGES[stage])
+
+    return [stage for stage in graphlib.TopologicalSorter(STAGES).static_order() if stage in required]
+
+
+def _file_hash(file_path: pathlib.Path) -> str:
+    """
+    Get the content hash of a file.
+
+    :param file_path: The file.
+    :return: The hash.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _config_hash(config: dict, keys: List[str]) -> str:
+    """
+    Get the hash of the config values a stage depends on.
+
+    :param config: The config.
+    :param keys: The keys of the values.
+    :return: The hash.
+    """
+    return hashlib.sha256(json.dumps({key: config.get(key) for key in keys}, sort_keys=True).encode()).hexdigest()
+
+
+def _run_file_stage(function: Callable, file_jobs: List[Tuple[tuple, pathlib.Path]], stage_state: dict,
+                    workers: Optional[int]) -> dict:
+    """
+    Run a stage processing each input file independently. Only the changed inputs or inputs with missing outputs are
+    processed, and failed inputs are processed again in the next run.
+
+    :param function: The function processing a single file. The first argument is the input file.
+    :param file_jobs: The list of tuples with the function arguments and the output file.
+    :param stage_state: The recorded input hashes of the stage.
+    :param workers: The number of worker processes.
+    :return: The new input hashes of the stage.
+    """
+    input_hashes: Dict[str, str] = {str(arguments[0]): _file_hash(arguments[0]) for arguments, _ in file_jobs}
+    pending: List[tuple] = [arguments for arguments, output_file in file_jobs
+                            if stage_state.get(str(arguments[0])) != input_hashes[str(arguments[0])]
+                            or not output_file.is_file()]
+    print(f"{len(pending)} of {len(file_jobs)} files changed")
+    if not pending:
+        return input_hashes
+
+    errors: dict = process_files(function=function, file_arguments=pending, workers=workers)
+    return {input_file: file_hash for input_file, file_hash in input_hashes.items()
+            if pathlib.Path(input_file) not in errors}
+
+
+def _run_convert_stage(config: dict, base_directory: pathlib.Path, stage_state: dict) -> dict:
+    """
+    Convert the old Excel (XLS) peptide lists to the new Excel (XLSX) format.
+
+    :param config: The config.
+    :param base_directory: The base directory.
+    :param stage_state: The recorded state of the stage.
+    :return: The new state of the stage.
+    """
+    if "xls_directory" not in config:
+        print("No XLS directory, skipping")
+        return {}
+    xls_directory: pathlib.Path = base_directory / config["xls_directory"]
+    file_jobs = [((file,), file.with_suffix(".xlsx")) for file in sorted(xls_directory.glob("*.xls")) if file.is_file()]
+    return _run_file_stage(function=_convert_peptide_list_file, file_jobs=file_jobs, stage_state=stage_state,
+                           workers=config.get("workers"))
+
+
+def _run_combine_stage(config: dict, base_directory: pathlib.Path, stage_state: dict) -> dict:
+    """
+    Combine the spectra in the peptide lists.
+
+    :param config: The config.
+    :param base_directory: The base directory.
+    :param stage_state: The recorded state of the stage.
+    :return: The new state of the stage.
+    """
+    list_directory: pathlib.Path = base_directory / config.get("list_directory", config.get("xls_directory", "."))
+    combined_directory: pathlib.Path = base_directory / config["combined_directory"]
+    combined_directory.mkdir(parents=True, exist_ok=True)
+    file_jobs = [((file, combined_directory / file.name), combined_directory / file.name)
+                 for file in sorted(list_directory.glob("*.xlsx")) if file.is_file()]
+    return _run_file_stage(function=_combine_spectra_in_peptide_list, file_jobs=file_jobs, stage_state=stage_state,
+                           workers=config.get("workers"))
+
+
+def _run_statistics_stage(config: dict, base_directory: pathlib.Path, stage_state: dict) -> dict:
+    """
+    Calculate the modification statistics of the combined peptide lists and save a sheet per modification.
+    The statistics are calculated again if any of the combined lists or the modifications changed.
+
+    :param config: The config.
+    :param base_directory: The base directory.
+    :param stage_state: The recorded state of the stage.
+    :return: The new state of the stage.
+    """
+    combined_directory: pathlib.Path = base_directory / config["combined_directory"]
+    statistics_file: pathlib.Path = base_directory / config.get("statistics_file", "ModStats.xlsx")
+    new_state: dict = {str(file): _file_hash(file) for file in sorted(combined_directory.glob("*.xlsx"))}
+    new_state["__config__"] = _config_hash(config, ["protein", "mature", "modifications", "condition_order"])
+    if new_state == stage_state and get_result_files(statistics_file):
+        print("Up to date")
+        return new_state
+
+    sequence: str = get_protein_sequence(config.get("protein", "CRT"), mature=config.get("mature", True))
+    modifications: List[Tuple[str, str, float]] = [tuple(mod) for mod in config["modifications"]]
+    statistics: pd.DataFrame = calculate_modification_statistics(peptide_list_directory=combined_directory,
+                                                                 sequence=sequence, modifications=modifications)
+    with open_result_sink(statistics_file) as sink:
+        for mod_name, mod_df in split_modification_statistics(statistics=statistics,
+                                                              condition_order=config.get("condition_order")).items():
+            sink.write_table(mod_df, name=mod_name)
+    return new_state
+
+
+def _run_plots_stage(config: dict, base_directory: pathlib.Path, stage_state: dict) -> dict:
+    """
+    Create a bar plot for each modification in the statistics.
+
+    :param config: The config.
+    :param base_directory: The base directory.
+    :param stage_state: The recorded state of the stage.
+    :return: The new state of the stage.
+    """
+    if "figure_directory" not in config:
+        print("No figure directory, skipping")
+        return {}
+    statistics_file: pathlib.Path = base_directory / config.get("statistics_file", "ModStats.xlsx")
+    figure_directory: pathlib.Path = base_directory / config["figure_directory"]
+    new_state: dict = {str(file): _file_hash(file) for file in get_result_files(statistics_file)}
+    new_state["__config__"] = _config_hash(config, ["modifications", "figure_formats"])
+    if new_state == stage_state and figure_directory.is_dir():
+        print("Up to date")
+        return new_state
+
+    mod_dfs: Dict[str, pd.DataFrame] = read_result_tables(statistics_file)
+    figure_jobs = [(mod_name, create_modification_barplot,
+                    {"data": mod_dfs[mod_name], "mod_name": mod_name, "residues": residues, "condition_title": "",
+                     "output_directory": figure_directory,
+                     "file_formats": tuple(config.get("figure_formats", ["png"]))})
+                   for mod_name, residues, _ in config["modifications"] if mod_name in mod_dfs]
+    errors: dict = render_figures(figure_jobs=figure_jobs, workers=config.get("workers"))
+    return new_state if not errors else {}
+
+
+_STAGE_FUNCTIONS: Dict[str, Callable] = {
+    "convert": _run_convert_stage,
+    "combine": _run_combine_stage,
+    "statistics": _run_statistics_stage,
+    "plots": _run_plots_stage,
+}
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """
+    Run the pipeline from the command line.
+
+    :param arguments: The command line arguments. If None, the arguments of the process are used.
+    """
+    parser = argparse.ArgumentParser(description="Run the peptide list analysis pipeline.")
+    parser.add_argument("config", type=pathlib.Path, help="The JSON config file.")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES.keys()),
+                        help="The stages to run (And their dependencies). Default is all stages.")
+    parser.add_argument("--force", action="store_true", help="Process all inputs regardless of the recorded state.")
+    parser.add_argument("--trace", type=pathlib.Path,
+                        help="Record the stages and save the timeline as a Chrome trace in the file.")
+    parsed_arguments = parser.parse_args(arguments)
+    if parsed_arguments.trace is None:
+        run_pipeline(config_file=parsed_arguments.config, stages=parsed_arguments.stages, force=parsed_arguments.force)
+        return
+    with instrumented_run(trace_file=parsed_arguments.trace):
+        run_pipeline(config_file=parsed_arguments.config, stages=parsed_arguments.stages, force=parsed_arguments.force)
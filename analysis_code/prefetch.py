@@ -0,0 +1,78 @@
+"""
+Prefetching of peptide lists (Or other inputs) on background threads while the current one is processed.
+
+The inputs are loaded in order on a thread pool, and at most 'prefetch' inputs are loaded ahead of the one being
+processed, so reading overlaps with the processing while the memory is capped at 'prefetch' + 1 loaded inputs. Reading
+the files and the cached Parquet lists releases the GIL, while parsing Excel files with openpyxl mostly holds it, so the
+overlap is largest for cached lists.
+"""
+import collections
+import concurrent.futures
+import pathlib
+from typing import Any, Callable, Deque, Iterable, Iterator, Tuple, TypeVar, Union
+
+import pandas as pd
+
+from .instrumentation import trace_stage
+from .peptide_list_cache import read_peptide_list
+
+DEFAULT_PREFETCH: int = 2
+# The marker of the end of the items
+_END: object = object()
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+def iterate_prefetched(function: Callable[[Item], Result], items: Iterable[Item],
+                       prefetch: int = DEFAULT_PREFETCH) -> Iterator[Tuple[Item, Result]]:
+    """
+    Load the items in order with the next items loaded on background threads.
+
+    :param function: The function loading an item.
+    :param items: The items. Fx. the files.
+    :param prefetch: The number of items loaded ahead of the current item. If 0, the items are loaded when they are
+        needed in the current thread.
+    :return: The iterator of tuples with the item and the loaded result. An error loading an item is raised when the
+        item is reached.
+    """
+    if prefetch <= 0:
+        for item in items:
+            yield item, function(item)
+        return
+
+    items = iter(items)
+    pending: Deque[Tuple[Item, concurrent.futures.Future]] = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="prefetch")
+    try:
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            item, future = pending.popleft()
+            with trace_stage("prefetch_wait", category="io"):
+                result = future.result()
+            # Start loading the next item before the current item is processed
+            next_item: Any = next(items, _END)
+            if next_item is not _END:
+                pending.append((next_item, executor.submit(function, next_item)))
+            yield item, result
+    finally:
+        # Stop loading if the iteration is stopped early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iterate_peptide_lists(files: Iterable[Union[str, pathlib.Path]], prefetch: int = DEFAULT_PREFETCH,
+                          **read_kwargs) -> Iterator[Tuple[pathlib.Path, pd.DataFrame]]:
+    """
+    Read the peptide lists through the cache with the next lists read on background threads.
+
+    :param files: The peptide list files.
+    :param prefetch: The number of lists read ahead of the current list.
+    :param read_kwargs: The keyword arguments for 'read_peptide_list'.
+    :return: The iterator of tuples with the file and the peptide list.
+    """
+    return iterate_prefetched(function=lambda file: read_peptide_list(file, **read_kwargs),
+                              items=[pathlib.Path(file) for file in files], prefetch=prefetch)
+
@@ -0,0 +1,114 @@
+"""
+Registry of the protein sequences used in the analysis.
+
+The sequences are loaded from FASTA files. The header can give the length of the signal peptide (Fx.
+'>CRT signal_peptide=17 Calreticulin'), which is the offset between the mature and the precursor numbering.
+The residue positions are cached, so repeated calls return the same read-only arrays.
+"""
+import functools
+import pathlib
+import re
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+DEFAULT_FASTA_FILE: pathlib.Path = pathlib.Path(__file__).parent / "proteins.fasta"
+
+_proteins: Dict[str, Tuple[str, int]] = {}
+
+
+def load_fasta(fasta_file: Union[str, pathlib.Path]) -> Dict[str, Tuple[str, int]]:
+    """
+    Load the proteins in a FASTA file.
+
+    :param fasta_file: The FASTA file.
+    :return: The dictionary with the protein name and a tuple with the sequence and the signal peptide length.
+    """
+    proteins: Dict[str, Tuple[str, int]] = {}
+    name, signal_peptide, sequence_parts = None, 0, []
+    with open(fasta_file, "r") as file:
+        for line in [line.strip() for line in file] + [">"]:
+            if line.startswith(">"):
+                if name is not None:
+                    proteins[name] = ("".join(sequence_parts).upper(), signal_peptide)
+                header = line[1:].split()
+                name = header[0] if len(header) > 0 else None
+                signal_match = re.search(r"signal_peptide=(\d+)", line)
+                signal_peptide = int(signal_match.group(1)) if signal_match else 0
+                sequence_parts = []
+            elif line:
+                sequence_parts.append(line)
+    return proteins
+
+
+def register_fasta(fasta_file: Union[str, pathlib.Path]) -> None:
+    """
+    Add the proteins in a FASTA file to the registry. Proteins with an existing name are replaced.
+
+    :param fasta_file: The FASTA file.
+    """
+    _get_registry().update(load_fasta(fasta_file))
+    get_residue_position_array.cache_clear()
+
+
+def get_protein_sequence(name: str, mature: bool = False) -> str:
+    """
+    Get the sequence of a protein.
+
+    :param name: The protein name. Fx. 'CRT'.
+    :param mature: If True, the sequence without the signal peptide is returned.
+    :return: The protein sequence.
+    """
+    sequence, signal_peptide = _get_registry()[name]
+    return sequence[signal_peptide:] if mature else sequence
+
+
+def find_protein_name(name: str) -> Optional[str]:
+    """
+    Find the registered name of a protein, ignoring the case. Fx. 'crt' and 'Crt' are 'CRT'.
+
+    :param name: The protein name.
+    :return: The registered protein name, or None if the protein is not registered.
+    """
+    registry: Dict[str, Tuple[str, int]] = _get_registry()
+    if name in registry:
+        return name
+    return next((registered_name for registered_name in registry if registered_name.lower() == name.lower()), None)
+
+
+def get_signal_peptide_length(name: str) -> int:
+    """
+    Get the signal peptide length of a protein, which is the offset from the mature to the precursor numbering.
+
+    :param name: The protein name.
+    :return: The signal peptide length.
+    """
+    return _get_registry()[name][1]
+
+
+@functools.lru_cache(maxsize=None)
+def get_residue_position_array(name: str, residues: str, mature: bool = False) -> np.ndarray:
+    """
+    Get the positions (1-based) of the residues in a protein.
+
+    :param name: The protein name.
+    :param residues: The residues as a string. Fx. 'MPH'.
+    :param mature: If True, the positions in the mature sequence are returned. The positions can be converted to the
+        precursor numbering by adding the signal peptide length.
+    :return: The read-only array with the positions.
+    """
+    sequence: np.ndarray = np.frombuffer(get_protein_sequence(name, mature=mature).encode(), dtype="S1")
+    positions: np.ndarray = np.flatnonzero(np.isin(sequence, [residue.encode() for residue in residues.upper()])) + 1
+    positions.setflags(write=False)
+    return positions
+
+
+def _get_registry() -> Dict[str, Tuple[str, int]]:
+    """
+    Get the registry and load the default proteins on first use.
+
+    :return: The registry.
+    """
+    if not _proteins:
+        _proteins.update(load_fasta(DEFAULT_FASTA_FILE))
+    return _proteins
@@ -0,0 +1,178 @@
+"""
+Batch plotting of the modification percentages of each modification in a PTM profile.
+
+The data is grouped by modification once, and the plots are rendered in batches. Each batch sets up the style and the
+figure once and reuses the axes for all its plots, and the batches can be rendered in a process pool. The strip plots
+are drawn with a scatter per condition instead of a seaborn figure per plot, and all the plots use the same condition
+order and colors, and the positions are ordered like the seaborn categorical plots (Sorted if they are numeric and in
+the order of appearance otherwise).
+"""
+import pathlib
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .parallel import process_files
+from .ptm_profile import MODIFICATION_COLUMN, POSITION_COLUMN
+from .rendering import DEFAULT_DPI, DEFAULT_FILE_FORMATS, headless_backend
+
+DEFAULT_FIGURE_SIZE: Tuple[float, float] = (15, 10)
+DEFAULT_PALETTE: str = "Paired"
+MARKER_SIZE: float = 20
+# The random horizontal offset of the points within a position
+STRIP_JITTER: float = 0.2
+# The number of batches per worker. More batches than workers balance the load, fewer reuse the figures more.
+BATCHES_PER_WORKER: int = 4
+
+
+def create_ptm_plots(modification_data: Union[pd.DataFrame, Dict[str, pd.DataFrame]],
+                     output_directory: Union[str, pathlib.Path], file_formats: Sequence[str] = DEFAULT_FILE_FORMATS,
+                     dpi: int = DEFAULT_DPI, workers: Optional[int] = None) -> Dict[str, Exception]:
+    """
+    Create a plot of the percentage at each position for each condition for each of the modifications.
+
+    :param modification_data: The percentages in the long format (See 'melt_ptm_percentages'), or the dictionary with
+        the modification and its percentages (See 'read_ptm_percentages').
+    :param output_directory: The directory where the plots are saved.
+    :param file_formats: The file formats. Fx. 'png', 'svg' or 'pdf'.
+    :param dpi: The resolution of the raster formats.
+    :param workers: The number of worker processes. If None, the plots are rendered in the current process.
+    :return: The dictionary with the batch name and the error for each of the batches with plots which could not be
+        rendered. The error lists the failed modifications. Modifications with the same file name (See
+        'get_ptm_plot_file_name') get a numeric suffix, so no plot overwrites another.
+    """
+    if isinstance(modification_data, pd.DataFrame):
+        modification_data = {mod_name: mod_df for mod_name, mod_df in
+                             modification_data.groupby(MODIFICATION_COLUMN, sort=False)}
+    conditions: List[str] = list(pd.unique(np.concatenate(
+        [mod_df["Condition"].to_numpy() for mod_df in modification_data.values()]))) if modification_data else []
+
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    file_names: List[str] = _get_unique_file_names([get_ptm_plot_file_name(mod_name) for mod_name in modification_data])
+    plots: List[Tuple[str, str, pd.DataFrame]] = [(mod_name, file_name, mod_df) for (mod_name, mod_df), file_name
+                                                  in zip(modification_data.items(), file_names)]
+    batch_count: int = min(len(plots), max(1, (workers or 1) * BATCHES_PER_WORKER))
+    batches: List[tuple] = [(f"Batch {index + 1}", plots[index::batch_count], output_directory, conditions,
+                             tuple(file_formats), dpi) for index in range(batch_count)]
+    return process_files(function=_render_ptm_plot_batch, file_arguments=batches, workers=workers)
+
+
+def get_ptm_plot_file_name(mod_name: str) -> str:
+    """
+    Get the file name of the plot of a modification. Fx. 'Oxidation (M)' is 'oxidation_m'.
+
+    :param mod_name: The modification name.
+    :return: The file name without the suffix.
+    """
+    file_name: str = mod_name.lower().replace(" ", "_").replace("(", "").replace(")", "")
+    return re.sub(r"[^\w\-.]", "", file_name)
+
+
+def _get_unique_file_names(file_names: List[str]) -> List[str]:
+    """
+    Make the file names unique by adding a numeric suffix to the repeated names. Fx. 'foobar2', 'foobar2' is 'foobar2',
+    'foobar2_2'.
+
+    :param file_names: The file names without the suffix.
+    :return: The unique file names in the same order.
+    """
+    used: set = set(file_names)
+    unique_names: List[str] = []
+    seen: set = set()
+    for file_name in file_names:
+        unique_name: str = file_name
+        number: int = 2
+        while unique_name in seen or (unique_name != file_name and unique_name in used):
+            unique_name = f"{file_name}_{number}"
+            number += 1
+        seen.add(unique_name)
+        unique_names.append(unique_name)
+    return unique_names
+
+
+def _get_position_order(positions: np.ndarray) -> np.ndarray:
+    """
+    Get the order of the positions on the x-axis like seaborn categorical plots. Numeric positions are sorted, and
+    other positions are in the order of appearance. Missing positions are skipped.
+
+    :param positions: The positions.
+    :return: The unique positions in the order of the x-axis.
+    """
+    categories: np.ndarray = np.asarray(pd.unique(pd.Series(positions).dropna()))
+    return np.sort(categories) if pd.api.types.is_numeric_dtype(categories) else categories
+
+
+def _render_ptm_plot_batch(batch_name: str, plots: List[Tuple[str, str, pd.DataFrame]],
+                           output_directory: pathlib.Path, conditions: List[str], file_formats: Sequence[str],
+                           dpi: int) -> None:
+    """
+    Render a batch of plots on a single reused figure with the Agg backend. The previous backend is restored when the
+    batch is rendered in the current process.
+
+    :param batch_name: The batch name.
+    :param plots: The list of tuples with the modification name, the file name without the suffix and its percentages.
+    :param output_directory: The directory where the plots are saved.
+    :param conditions: The conditions in the order of the legend.
+    :param file_formats: The file formats.
+    :param dpi: The resolution of the raster formats.
+    """
+    with headless_backend():
+        _draw_ptm_plot_batch(plots=plots, output_directory=output_directory, conditions=conditions,
+                             file_formats=file_formats, dpi=dpi)
+
+
+def _draw_ptm_plot_batch(plots: List[Tuple[str, str, pd.DataFrame]], output_directory: pathlib.Path,
+                         conditions: List[str], file_formats: Sequence[str], dpi: int) -> None:
+    """
+    Draw and save a batch of plots on a single reused figure.
+
+    :param plots: The list of tuples with the modification name, the file name without the suffix and its percentages.
+    :param output_directory: The directory where the plots are saved.
+    :param conditions: The conditions in the order of the legend.
+    :param file_formats: The file formats.
+    :param dpi: The resolution of the raster formats.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set up the style, the colors, the figure and the legend space once for the batch
+    sns.set_theme(style="darkgrid")
+    colors: list = sns.color_palette(palette=DEFAULT_PALETTE, n_colors=len(conditions))
+    figure, axes = plt.subplots(figsize=DEFAULT_FIGURE_SIZE)
+    figure.subplots_adjust(left=0.06, right=0.82, bottom=0.1, top=0.95)
+    rng: np.random.Generator = np.random.default_rng(0)
+
+    failed: List[str] = []
+    try:
+        for mod_name, file_name, mod_df in plots:
+            try:
+                axes.clear()
+                # Draw a strip plot with a scatter per condition over the categorical positions
+                positions: np.ndarray = mod_df[POSITION_COLUMN].to_numpy()
+                categories: np.ndarray = _get_position_order(positions)
+                position_indexes: np.ndarray = pd.Index(categories).get_indexer(positions)
+                x_values: np.ndarray = position_indexes + rng.uniform(-STRIP_JITTER, STRIP_JITTER, len(positions))
+                y_values: np.ndarray = mod_df["Percentage"].to_numpy()
+                condition_values: np.ndarray = mod_df["Condition"].to_numpy()
+                for condition, color in zip(conditions, colors):
+                    selected: np.ndarray = (condition_values == condition) & (position_indexes >= 0)
+                    axes.scatter(x_values[selected], y_values[selected], s=MARKER_SIZE, color=color, label=condition)
+                axes.set_xticks(np.arange(len(categories)), [str(category) for category in categories],
+                                rotation=90)
+                axes.set_xlim(-0.5, len(categories) - 0.5)
+                axes.set_xlabel("Position")
+                axes.set_ylabel("Modified peptides (%)")
+                axes.set_title(mod_name)
+                axes.legend(title="Condition", loc="center left", bbox_to_anchor=(1, 0.5), frameon=False)
+                for file_format in file_formats:
+                    figure.savefig(output_directory / f"{file_name}.{file_format}", format=file_format, dpi=dpi)
+            except Exception as error:
+                failed.append(f"{mod_name} ({error})")
+    finally:
+        plt.close(figure)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(plots)} plots failed: {', '.join(failed)}")
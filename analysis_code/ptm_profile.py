@@ -0,0 +1,158 @@
+"""
+Modification percentages of the conditions in a PTM profile (ptmprofile.csv).
+
+The conditions are discovered from the '<condition> modified' and '<condition> unmodified' column pairs in the header,
+and the percentages of all the conditions and the pass filter are calculated as matrix operations. Large profiles can
+be streamed in chunks with 'read_ptm_percentages', which keeps only the rows passing the filter.
+"""
+import pathlib
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .chunked_csv import DEFAULT_CHUNK_SIZE, iterate_csv_chunks
+
+POSITION_COLUMN: str = "Protein Position"
+MODIFICATION_COLUMN: str = "Modifications"
+MODIFIED_SUFFIX: str = " modified"
+UNMODIFIED_SUFFIX: str = " unmodified"
+
+
+def find_ptm_conditions(columns: Sequence[str]) -> List[str]:
+    """
+    Find the conditions with both a modified and an unmodified column.
+
+    :param columns: The column names.
+    :return: The list of conditions in the order of the header.
+    """
+    column_set: set = set(columns)
+    return [column[:-len(MODIFIED_SUFFIX)] for column in columns
+            if column.endswith(MODIFIED_SUFFIX) and f"{column[:-len(MODIFIED_SUFFIX)]}{UNMODIFIED_SUFFIX}" in column_set]
+
+
+def read_ptm_profile(file: Union[str, pathlib.Path], conditions: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read the position, modification and count columns of a PTM profile.
+
+    :param file: The PTM profile (CSV).
+    :param conditions: The conditions to read. If None, all the conditions in the header are read.
+    :return: The data frame with the position, the modifications and the modified and unmodified count columns.
+    """
+    conditions = conditions if conditions is not None else find_ptm_conditions(_read_header(file))
+    return pd.read_csv(file, usecols=_get_ptm_columns(conditions), **_get_csv_engine())
+
+
+def calculate_ptm_percentages(ptm_profile: pd.DataFrame, pass_percentage: float = 0,
+                              conditions: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Calculate the modification percentage of each condition, and keep the rows where at least one of the conditions
+    has a percentage above or equal to the pass percentage. Conditions without any peptides have a percentage of 0.
+
+    :param ptm_profile: The PTM profile.
+    :param pass_percentage: The pass percentage.
+    :param conditions: The conditions. If None, all the conditions in the PTM profile are used.
+    :return: The data frame with the position, the modifications and the percentage of each condition.
+    """
+    conditions = conditions if conditions is not None else find_ptm_conditions(list(ptm_profile.columns))
+    # The counts are used as condition x row matrices, so the reductions over the conditions run on contiguous rows
+    modified: np.ndarray = ptm_profile[[f"{condition}{MODIFIED_SUFFIX}" for condition in conditions]].to_numpy().T
+    total: np.ndarray = modified + ptm_profile[[f"{condition}{UNMODIFIED_SUFFIX}" for condition in conditions]] \
+        .to_numpy().T
+    # The modified count is 0 when the total is 0, so dividing by 1 gives a percentage of 0
+    total[total == 0] = 1
+    percentages: np.ndarray = modified / total
+    percentages *= 100
+
+    # Missing counts or identifiers remove the row
+    passed: np.ndarray = (percentages >= pass_percentage).any(axis=0) & \
+        ptm_profile[POSITION_COLUMN].notna().to_numpy() & ptm_profile[MODIFICATION_COLUMN].notna().to_numpy()
+    if total.dtype.kind == "f":
+        passed &= ~np.isnan(percentages).any(axis=0)
+    if not passed.all():
+        percentages = percentages[:, passed]
+
+    result: pd.DataFrame = pd.DataFrame(percentages.T, columns=conditions, index=ptm_profile.index[passed],
+                                        copy=False)
+    result.insert(0, MODIFICATION_COLUMN, ptm_profile[MODIFICATION_COLUMN].to_numpy()[passed])
+    result.insert(0, POSITION_COLUMN, ptm_profile[POSITION_COLUMN].to_numpy()[passed])
+    return result
+
+
+def melt_ptm_percentages(percentages: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the percentages to the long format with a row per position, modification and condition.
+
+    :param percentages: The percentages from 'calculate_ptm_percentages'.
+    :return: The data frame with the position, the modifications, the condition and the percentage.
+    """
+    conditions: List[str] = [column for column in percentages.columns
+                             if column not in (POSITION_COLUMN, MODIFICATION_COLUMN)]
+    row_count: int = len(percentages)
+    return pd.DataFrame({
+        POSITION_COLUMN: np.tile(percentages[POSITION_COLUMN].to_numpy(), len(conditions)),
+        MODIFICATION_COLUMN: np.tile(percentages[MODIFICATION_COLUMN].to_numpy(), len(conditions)),
+        "Condition": np.repeat(np.array(conditions, dtype=object), row_count),
+        "Percentage": percentages[conditions].to_numpy().ravel(order="F"),
+    })
+
+
+def read_ptm_percentages(file: Union[str, pathlib.Path], pass_percentage: float = 0,
+                         conditions: Optional[List[str]] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, pd.DataFrame]:
+    """
+    Stream a PTM profile in chunks and build the percentages of each modification incrementally. Only the rows passing
+    the filter are kept, so the memory use is bounded by the chunk size and the size of the result.
+
+    :param file: The PTM profile (CSV).
+    :param pass_percentage: The pass percentage.
+    :param conditions: The conditions to read. If None, all the conditions in the header are read.
+    :param chunk_size: The number of rows read at a time.
+    :return: The dictionary with the modification and its percentages in the long format (See 'melt_ptm_percentages')
+        in the order the modifications are found.
+    """
+    conditions = conditions if conditions is not None else find_ptm_conditions(_read_header(file))
+    modification_parts: Dict[str, List[pd.DataFrame]] = {}
+    for chunk in iterate_csv_chunks(file=file, columns=_get_ptm_columns(conditions), chunk_size=chunk_size):
+        percentages: pd.DataFrame = calculate_ptm_percentages(ptm_profile=chunk, pass_percentage=pass_percentage,
+                                                              conditions=conditions)
+        for mod_name, mod_df in percentages.groupby(MODIFICATION_COLUMN, sort=False):
+            modification_parts.setdefault(mod_name, []).append(mod_df)
+
+    return {mod_name: melt_ptm_percentages(percentages=pd.concat(parts, ignore_index=True))
+            for mod_name, parts in modification_parts.items()}
+
+
+def _read_header(file: Union[str, pathlib.Path]) -> List[str]:
+    """
+    Read the column names of a CSV file.
+
+    :param file: The CSV file.
+    :return: The list of column names.
+    """
+    return list(pd.read_csv(file, nrows=0).columns)
+
+
+def _get_ptm_columns(conditions: List[str]) -> List[str]:
+    """
+    Get the columns of the conditions in a PTM profile.
+
+    :param conditions: The conditions.
+    :return: The list with the position, modification and count columns.
+    """
+    return [POSITION_COLUMN, MODIFICATION_COLUMN] + [f"{condition}{suffix}" for condition in conditions
+                                                     for suffix in (MODIFIED_SUFFIX, UNMODIFIED_SUFFIX)]
+
+
+def _get_csv_engine() -> dict:
+    """
+    Get the keyword arguments for the fastest available CSV parser. The multithreaded pyarrow parser is used if
+    pyarrow is installed.
+
+    :return: The keyword arguments for 'pd.read_csv'.
+    """
+    try:
+        import pyarrow  # noqa: F401
+        return {"engine": "pyarrow"}
+    except ImportError:
+        return {}
@@ -0,0 +1,99 @@
+"""
+Headless rendering of the figures to files.
+
+The plotting functions show the figure if no output directory is given, and otherwise save it with the non-interactive
+Agg backend, so the figures can be created without a display and independent figures can be rendered concurrently.
+"""
+import contextlib
+import pathlib
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .parallel import process_files
+
+DEFAULT_FILE_FORMATS: Tuple[str, ...] = ("png",)
+DEFAULT_DPI: int = 150
+
+
+def use_headless_backend() -> None:
+    """
+    Switch matplotlib to the non-interactive Agg backend.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+@contextlib.contextmanager
+def headless_backend() -> Iterator[None]:
+    """
+    Switch matplotlib to the Agg backend while rendering, and restore the previous backend afterwards, so rendering to
+    files does not change the backend of an interactive session.
+    """
+    import matplotlib
+
+    previous_backend: str = matplotlib.get_backend()
+    if previous_backend.lower() == "agg":
+        yield
+        return
+    use_headless_backend()
+    try:
+        yield
+    finally:
+        matplotlib.use(previous_backend)
+
+
+def show_or_save_figure(figure=None, output_directory: Optional[pathlib.Path] = None, file_name: str = "figure",
+                        file_formats: Sequence[str] = DEFAULT_FILE_FORMATS, dpi: int = DEFAULT_DPI) -> None:
+    """
+    Show the figure, or save it in each of the file formats if an output directory is given.
+
+    :param figure: The figure. If None, the current figure is used.
+    :param output_directory: The output directory. If None, the figure is shown.
+    :param file_name: The file name without the suffix. Characters which are not valid in file names are removed.
+    :param file_formats: The file formats. Fx. 'png', 'svg' or 'pdf'.
+    :param dpi: The resolution of the raster formats.
+    """
+    import matplotlib.pyplot as plt
+
+    if output_directory is None:
+        plt.show()
+        return
+
+    figure = figure if figure is not None else plt.gcf()
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    clean_file_name: str = re.sub(r"[^\w\-. ]", "", file_name).strip().replace(" ", "_")
+    for file_format in file_formats:
+        figure.savefig(output_directory / f"{clean_file_name}.{file_format}", format=file_format, dpi=dpi,
+                       bbox_inches="tight")
+    plt.close(figure)
+
+
+def render_figures(figure_jobs: List[Tuple[str, Callable, dict]], workers: Optional[int] = None) \
+        -> Dict[str, Exception]:
+    """
+    Render independent figures with the Agg backend, possibly in a process pool.
+    Each plotting function should be given an output directory in its keyword arguments, so the figure is saved.
+
+    :param figure_jobs: The list of tuples with the figure name, the module level plotting function and its keyword
+        arguments.
+    :param workers: The number of worker processes. If None, the figures are rendered one at a time.
+    :return: The dictionary with the figure name and the error for each of the figures which could not be rendered.
+    """
+    if not figure_jobs:
+        return {}
+    # In the current process, the backend is switched once for all the figures and restored afterwards
+    with headless_backend() if workers is None or workers <= 1 else contextlib.nullcontext():
+        return process_files(function=_render_figure, file_arguments=figure_jobs, workers=workers)
+
+
+def _render_figure(figure_name: str, plot_function: Callable, plot_kwargs: dict) -> None:
+    """
+    Render a single figure with the Agg backend.
+
+    :param figure_name: The figure name.
+    :param plot_function: The plotting function.
+    :param plot_kwargs: The keyword arguments for the plotting function.
+    """
+    with headless_backend():
+        plot_function(**plot_kwargs)
@@ -0,0 +1,307 @@
+"""
+Persistent per-residue coverage and modification counts of many conditions.
+
+The counts are stored as a conditions x residues x channels array in a raw binary file, which is memory mapped when it
+is read, and described by a JSON index with the protein length, the modifications and the conditions. Channel 0 is the
+number of hits covering each residue and channel 1 + i is the number of hits with modification name i on each residue
+(Masses with the same name share a channel). The conditions are contiguous fixed size blocks, so a new condition is
+appended to the end of the file without rewriting it, and slicing a residue across all the conditions is a view of the
+memory map instead of a read of the peptide lists.
+
+Store directory:
+    counts.bin: The counts (C order, uint32).
+    index.json: The index.
+"""
+import json
+import os
+import pathlib
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .coverage import calculate_residue_coverage
+from .instrumentation import trace_stage
+from .mass_index import DEFAULT_MASS_TOLERANCE, MassIndex, create_mass_index
+from .modification_table import ModificationTable, parse_modifications
+from .peptide_table import read_list_columns
+from .prefetch import DEFAULT_PREFETCH, iterate_prefetched
+
+COUNTS_FILE: str = "counts.bin"
+INDEX_FILE: str = "index.json"
+COVERAGE_CHANNEL: str = "Hits"
+COUNT_TYPE: np.dtype = np.dtype(np.uint32)
+
+
+class ResidueCountStore:
+    """
+    Memory mapped conditions x residues x channels count store. Use 'create' to create a new store and the constructor
+    to open an existing store.
+    """
+
+    def __init__(self, directory: Union[str, pathlib.Path]):
+        """
+        Open an existing store.
+
+        :param directory: The store directory.
+        """
+        self.directory: pathlib.Path = pathlib.Path(directory)
+        self._index: dict = json.loads((self.directory / INDEX_FILE).read_text())
+        self._mass_index: MassIndex = create_mass_index({mod["mass"]: mod["name"]
+                                                         for mod in self._index["modifications"]})
+        # The channel of each mass in the mass index
+        self._mass_channels: np.ndarray = np.array([self.channels.index(name) for name in self._mass_index.names],
+                                                   dtype=np.int64)
+        self._counts: Optional[np.memmap] = None
+
+    @classmethod
+    def create(cls, directory: Union[str, pathlib.Path], length: int, modifications: Dict[float, str],
+               tolerance: float = DEFAULT_MASS_TOLERANCE, protein: Optional[str] = None) -> "ResidueCountStore":
+        """
+        Create an empty store.
+
+        :param directory: The store directory. It must not contain a store.
+        :param length: The number of residues. Positions above it are not counted.
+        :param modifications: The dictionary with the modification mass and the name.
+        :param tolerance: The mass tolerance in Da used to match the modifications.
+        :param protein: The protein name, which is only recorded in the index.
+        :return: The store.
+        """
+        directory = pathlib.Path(directory)
+        if (directory / INDEX_FILE).exists():
+            raise FileExistsError(f"A residue count store already exists in {directory}")
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / COUNTS_FILE).touch()
+        _write_index(directory, {
+            "dtype": COUNT_TYPE.str, "length": int(length), "protein": protein, "tolerance": tolerance,
+            "modifications": [{"mass": float(mass), "name": str(name)} for mass, name in modifications.items()],
+            "conditions": []})
+        return cls(directory)
+
+    @classmethod
+    def open_or_create(cls, directory: Union[str, pathlib.Path], length: int, modifications: Dict[float, str],
+                       tolerance: float = DEFAULT_MASS_TOLERANCE, protein: Optional[str] = None) -> "ResidueCountStore":
+        """
+        Open the store in a directory, or create it if the directory does not contain a store.
+
+        :param directory: The store directory.
+        :param length: The number of residues.
+        :param modifications: The dictionary with the modification mass and the name.
+        :param tolerance: The mass tolerance in Da used to match the modifications.
+        :param protein: The protein name, which is only recorded in the index.
+        :return: The store.
+        """
+        if not (pathlib.Path(directory) / INDEX_FILE).exists():
+            return cls.create(directory, length=length, modifications=modifications, tolerance=tolerance,
+                              protein=protein)
+        store: ResidueCountStore = cls(directory)
+        if store.length != length or store._index["tolerance"] != tolerance or \
+                {mod["mass"]: mod["name"] for mod in store._index["modifications"]} != \
+                {float(mass): str(name) for mass, name in modifications.items()}:
+            raise ValueError(f"The residue count store in {directory} has another length, tolerance or modifications")
+        return store
+
+    @property
+    def conditions(self) -> List[str]:
+        """
+        The condition keys ('<experiment>/<condition>', or the condition without an experiment) in the order of the
+        first axis.
+        """
+        return [_condition_key(condition["experiment"], condition["name"]) for condition in self._index["conditions"]]
+
+    @property
+    def channels(self) -> List[str]:
+        """
+        The channel names in the order of the last axis. The coverage followed by the modification names in the order
+        they were given.
+        """
+        return [COVERAGE_CHANNEL] + list(dict.fromkeys(mod["name"] for mod in self._index["modifications"]))
+
+    @property
+    def length(self) -> int:
+        """
+        The number of residues.
+        """
+        return self._index["length"]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        The read-only memory mapped conditions x residues x channels counts. Residue i is at index i - 1.
+        """
+        if self._counts is None:
+            shape: tuple = (len(self._index["conditions"]), self.length, len(self.channels))
+            self._counts = np.memmap(self.directory / COUNTS_FILE, dtype=np.dtype(self._index["dtype"]), mode="r",
+                                     shape=shape) if shape[0] > 0 else np.zeros(shape, dtype=self._index["dtype"])
+        return self._counts
+
+    def add_condition(self, peptide_list: pd.DataFrame, name: str, experiment: Optional[str] = None,
+                      replace: bool = False) -> None:
+        """
+        Count the coverage and the modifications of a peptide list and append them to the store. An existing condition
+        is overwritten in place if replace is True.
+
+        :param peptide_list: The peptide list with the 'Start', 'End' and 'Modification' columns.
+        :param name: The condition name.
+        :param experiment: The experiment name.
+        :param replace: If True, an existing condition with the same name is replaced; Otherwise, it is an error.
+        """
+        with trace_stage("count_residues", category="aggregate", rows=len(peptide_list)):
+            block: np.ndarray = self._count_residues(peptide_list=peptide_list)
+
+        key: str = _condition_key(experiment, name)
+        existing: List[str] = self.conditions
+        if key in existing and not replace:
+            raise ValueError(f"The condition '{key}' is already in the residue count store")
+
+        self._counts = None
+        if key in existing:
+            counts: np.memmap = np.memmap(self.directory / COUNTS_FILE, dtype=np.dtype(self._index["dtype"]),
+                                          mode="r+", shape=(len(existing),) + block.shape)
+            counts[existing.index(key)] = block
+            counts.flush()
+            del counts
+            return
+
+        # The index is only updated when the block is written, so a block left by an interrupted append is not indexed
+        # and is truncated before appending
+        with open(self.directory / COUNTS_FILE, "ab") as counts_file:
+            counts_file.truncate(len(existing) * block.nbytes)
+            counts_file.write(block.tobytes())
+        self._index["conditions"].append({"experiment": experiment, "name": name})
+        _write_index(self.directory, self._index)
+
+    def add_peptide_lists(self, files: Iterable[Union[str, pathlib.Path]], experiment: Optional[str] = None,
+                          replace: bool = False, prefetch: int = DEFAULT_PREFETCH) -> List[str]:
+        """
+        Count the peptide lists (Raw or combined XLSX) and append them to the store. The condition name is the file
+        name without the suffix.
+
+        :param files: The peptide lists.
+        :param experiment: The experiment name.
+        :param replace: If True, existing conditions are replaced; Otherwise, they are skipped.
+        :param prefetch: The number of lists read ahead on background threads.
+        :return: The list of added condition keys.
+        """
+        existing: set = set(self.conditions)
+        files = [pathlib.Path(file) for file in files
+                 if replace or _condition_key(experiment, pathlib.Path(file).stem) not in existing]
+        added: List[str] = []
+        for file, peptide_list in iterate_prefetched(function=read_list_columns, items=files, prefetch=prefetch):
+            self.add_condition(peptide_list=peptide_list, name=file.stem, experiment=experiment, replace=replace)
+            added.append(_condition_key(experiment, file.stem))
+        return added
+
+    def get_residue(self, position: int) -> np.ndarray:
+        """
+        Get the counts of a residue in all the conditions without copying them.
+
+        :param position: The residue position (1-based).
+        :return: The conditions x channels view of the counts.
+        """
+        return self.counts[:, position - 1, :]
+
+    def get_residue_table(self, position: int) -> pd.DataFrame:
+        """
+        Get the counts of a residue in all the conditions as a table.
+
+        :param position: The residue position (1-based).
+        :return: The data frame indexed by the condition with a column per channel.
+        """
+        return pd.DataFrame(self.get_residue(position), index=self.conditions, columns=self.channels)
+
+    def get_percentages(self, positions: Optional[Sequence[int]] = None,
+                        conditions: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Calculate the modification percentage of each modification at the positions in the conditions. Residues without
+        hits have a percentage of 0.
+
+        :param positions: The residue positions (1-based). If None, all the residues are used.
+        :param conditions: The condition keys. If None, all the conditions are used.
+        :return: The conditions x positions x modifications array with the percentages.
+        """
+        counts: np.ndarray = self._select(positions=positions, conditions=conditions)
+        coverage: np.ndarray = counts[..., :1].astype(np.float64)
+        coverage[coverage == 0] = np.inf
+        return counts[..., 1:] / coverage * 100
+
+    def get_condition_tables(self, condition: str, positions: Sequence[int]) -> tuple:
+        """
+        Get the modification counts, percentages and hit counts of a condition at the positions.
+
+        :param condition: The condition key.
+        :param positions: The residue positions (1-based).
+        :return: The tuple with the count, the percentage and the hit count data frames indexed by the position. The
+            count and percentage data frames have a column per modification.
+        """
+        counts: np.ndarray = self._select(positions=positions, conditions=[condition])[0]
+        index: List[int] = [int(position) for position in positions]
+        modification_names: List[str] = self.channels[1:]
+        return (pd.DataFrame(counts[:, 1:], index=index, columns=modification_names),
+                pd.DataFrame(self.get_percentages(positions=positions, conditions=[condition])[0], index=index,
+                             columns=modification_names),
+                pd.DataFrame(counts[:, :1], index=index))
+
+    def _select(self, positions: Optional[Sequence[int]], conditions: Optional[Sequence[str]]) -> np.ndarray:
+        """
+        Select the counts of the positions in the conditions.
+
+        :param positions: The residue positions (1-based). If None, all the residues are used.
+        :param conditions: The condition keys. If None, all the conditions are used.
+        :return: The conditions x positions x channels counts.
+        """
+        counts: np.ndarray = self.counts
+        if conditions is not None:
+            keys: List[str] = self.conditions
+            missing: List[str] = [condition for condition in conditions if condition not in keys]
+            if missing:
+                raise KeyError(f"The conditions are not in the residue count store: {', '.join(missing)}")
+            counts = counts[[keys.index(condition) for condition in conditions]]
+        if positions is not None:
+            counts = counts[:, np.asarray(positions, dtype=np.int64) - 1]
+        return counts
+
+    def _count_residues(self, peptide_list: pd.DataFrame) -> np.ndarray:
+        """
+        Count the hits covering each residue and the hits with each modification on each residue.
+
+        :param peptide_list: The peptide list.
+        :return: The residues x channels counts.
+        """
+        length: int = self.length
+        block: np.ndarray = np.zeros((length, len(self.channels)), dtype=np.dtype(self._index["dtype"]))
+        block[:, 0] = calculate_residue_coverage(starts=peptide_list["Start"], ends=peptide_list["End"],
+                                                 length=length)["Hits"].to_numpy()
+
+        mod_table: ModificationTable = parse_modifications(peptide_list["Modification"])
+        mass_indexes: np.ndarray = self._mass_index.lookup(mod_table.masses, tolerance=self._index["tolerance"])
+        selected: np.ndarray = (mass_indexes >= 0) & (mod_table.positions >= 1) & (mod_table.positions <= length)
+        # Count each (residue, channel) pair at once in the flattened block
+        channel_count: int = len(self.channels)
+        block += np.bincount((mod_table.positions[selected] - 1) * channel_count +
+                             self._mass_channels[mass_indexes[selected]],
+                             minlength=length * channel_count).reshape(length, channel_count).astype(block.dtype)
+        return block
+
+
+def _condition_key(experiment: Optional[str], name: str) -> str:
+    """
+    Get the key of a condition.
+
+    :param experiment: The experiment name.
+    :param name: The condition name.
+    :return: '<experiment>/<condition>', or the condition name without an experiment.
+    """
+    return f"{experiment}/{name}" if experiment is not None else name
+
+
+def _write_index(directory: pathlib.Path, index: dict) -> None:
+    """
+    Replace the index of a store atomically.
+
+    :param directory: The store directory.
+    :param index: The index.
+    """
+    temporary_file: pathlib.Path = directory / f"{INDEX_FILE}.{os.getpid()}.tmp"
+    temporary_file.write_text(json.dumps(index, indent=2))
+    os.replace(temporary_file, directory / INDEX_FILE)
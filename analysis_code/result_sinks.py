@@ -0,0 +1,234 @@
+"""
+Output sinks for the result tables.
+
+The sinks write one or more named tables to Parquet, CSV or Excel (XLSX). The Excel sink streams the rows to the
+workbook in constant memory (With xlsxwriter, or the write-only mode of openpyxl if xlsxwriter is not installed), so a
+multi-sheet workbook is written in a single pass without holding the whole workbook in memory. The Parquet and CSV
+sinks write a single unnamed table to the given file, and named tables to a file per table in a directory with the
+name of the file (Fx. 'CRTModStats/Oxidation.parquet').
+"""
+import pathlib
+import re
+from typing import Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+from .instrumentation import trace_stage
+
+FILE_FORMATS: List[str] = ["xlsx", "parquet", "csv"]
+# The number of rows converted at a time when streaming the rows to a workbook
+STREAMING_CHUNK_SIZE: int = 10000
+
+
+class ResultSink:
+    """
+    Base class of the result sinks. The sink is used as a context manager, and the tables are written with
+    'write_table'.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """
+        Create the sink.
+
+        :param path: The output file.
+        """
+        self.path: pathlib.Path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write_table(self, table: pd.DataFrame, name: Optional[str] = None, index: bool = True) -> None:
+        """
+        Write a table.
+
+        :param table: The table.
+        :param name: The table (Sheet) name. If None, the table is written as the only table of the output.
+        :param index: If True, the index is written as the first column.
+        """
+        with trace_stage("write_table", category="io", file=self.path, rows=len(table)):
+            self._write_table(table=table, name=name, index=index)
+
+    def close(self) -> None:
+        """
+        Finish the output.
+        """
+
+    def _write_table(self, table: pd.DataFrame, name: Optional[str], index: bool) -> None:
+        raise NotImplementedError
+
+    def _get_table_file(self, name: Optional[str]) -> pathlib.Path:
+        """
+        Get the file of a table for the sinks writing a file per table.
+
+        :param name: The table name.
+        :return: The output file if the name is None; Otherwise, the file in the directory with the output name.
+        """
+        if name is None:
+            return self.path
+        directory: pathlib.Path = self.path.with_suffix("")
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{_clean_name(name)}{self.path.suffix}"
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class ParquetSink(ResultSink):
+    """
+    Sink writing the tables to Parquet files.
+    """
+
+    def _write_table(self, table: pd.DataFrame, name: Optional[str], index: bool) -> None:
+        # Parquet needs string column names
+        table = table.rename(columns=str)
+        table.to_parquet(self._get_table_file(name), index=index)
+
+
+class CsvSink(ResultSink):
+    """
+    Sink writing the tables to CSV files.
+    """
+
+    def _write_table(self, table: pd.DataFrame, name: Optional[str], index: bool) -> None:
+        table.to_csv(self._get_table_file(name), index=index)
+
+
+class StreamingExcelSink(ResultSink):
+    """
+    Sink streaming the tables to the sheets of an Excel (XLSX) workbook in constant memory.
+    The layout is the same as 'DataFrame.to_excel' with a bold header row and the index in the first column.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        super().__init__(path)
+        try:
+            import xlsxwriter
+            self._workbook = xlsxwriter.Workbook(str(self.path), {"constant_memory": True})
+            self._header_format = self._workbook.add_format({"bold": True, "border": 1, "align": "center"})
+            self._openpyxl: bool = False
+        except ImportError:
+            import openpyxl
+            self._workbook = openpyxl.Workbook(write_only=True)
+            self._openpyxl = True
+        self._sheet_count: int = 0
+
+    def _write_table(self, table: pd.DataFrame, name: Optional[str], index: bool) -> None:
+        self._sheet_count += 1
+        sheet_name: str = name if name is not None else f"Sheet{self._sheet_count}"
+        header: list = (list(table.index.names) if index else []) + [str(column) for column in table.columns]
+
+        if self._openpyxl:
+            worksheet = self._workbook.create_sheet(title=sheet_name)
+            worksheet.append(header)
+            for row in _iterate_rows(table=table, index=index):
+                worksheet.append(row)
+            return
+
+        worksheet = self._workbook.add_worksheet(sheet_name)
+        for column_index, value in enumerate(header):
+            if value is not None:
+                worksheet.write_string(0, column_index, value, self._header_format)
+        # Select the writer of each column once, instead of the type dispatch of 'write' for each cell
+        columns: pd.DataFrame = table.reset_index() if index else table
+        writers: list = [worksheet.write_number if pd.api.types.is_numeric_dtype(dtype)
+                         and not pd.api.types.is_bool_dtype(dtype) else worksheet.write for dtype in columns.dtypes]
+        formats: list = [self._header_format if index and column_index < table.index.nlevels else None
+                         for column_index in range(len(writers))]
+        for row_index, row in enumerate(_iterate_rows(table=table, index=index), start=1):
+            for column_index, value in enumerate(row):
+                if value is not None:
+                    writers[column_index](row_index, column_index, value, formats[column_index])
+
+    def close(self) -> None:
+        if self._openpyxl:
+            self._workbook.save(self.path)
+        else:
+            self._workbook.close()
+
+
+_SINKS: Dict[str, type] = {"xlsx": StreamingExcelSink, "parquet": ParquetSink, "csv": CsvSink}
+
+
+def open_result_sink(path: Union[str, pathlib.Path], file_format: Optional[str] = None) -> ResultSink:
+    """
+    Open a sink for the result tables.
+
+    :param path: The output file.
+    :param file_format: The file format ('xlsx', 'parquet' or 'csv'). If None, it is given by the file suffix.
+    :return: The sink.
+    """
+    path = pathlib.Path(path)
+    file_format = (file_format if file_format is not None else path.suffix.lstrip(".")).lower()
+    if file_format not in _SINKS:
+        raise ValueError(f"Unknown output format '{file_format}'. The formats are: {', '.join(FILE_FORMATS)}")
+    return _SINKS[file_format](path.with_suffix(f".{file_format}"))
+
+
+def write_result(table: pd.DataFrame, path: Union[str, pathlib.Path], file_format: Optional[str] = None,
+                 index: bool = True) -> None:
+    """
+    Write a single result table.
+
+    :param table: The table.
+    :param path: The output file.
+    :param file_format: The file format ('xlsx', 'parquet' or 'csv'). If None, it is given by the file suffix.
+    :param index: If True, the index is written as the first column.
+    """
+    with open_result_sink(path=path, file_format=file_format) as sink:
+        sink.write_table(table=table, index=index)
+
+
+def read_result_tables(path: Union[str, pathlib.Path]) -> Dict[str, pd.DataFrame]:
+    """
+    Read the named tables written with a sink. The first column is used as the index.
+
+    :param path: The output file.
+    :return: The dictionary with the table name and the table.
+    """
+    path = pathlib.Path(path)
+    if path.suffix == ".xlsx":
+        return pd.read_excel(path, sheet_name=None, index_col=0)
+    read_function = pd.read_parquet if path.suffix == ".parquet" else lambda file: pd.read_csv(file, index_col=0)
+    return {file.stem: read_function(file) for file in sorted(path.with_suffix("").glob(f"*{path.suffix}"))}
+
+
+def get_result_files(path: Union[str, pathlib.Path]) -> List[pathlib.Path]:
+    """
+    Get the files written with a sink.
+
+    :param path: The output file.
+    :return: The list of existing files. The output file, or the files of the named tables in the output directory.
+    """
+    path = pathlib.Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(path.with_suffix("").glob(f"*{path.suffix}"))
+
+
+def _iterate_rows(table: pd.DataFrame, index: bool) -> Iterator[list]:
+    """
+    Iterate the rows of a table as lists of Python values, converting a chunk of rows at a time.
+    Missing values are None.
+
+    :param table: The table.
+    :param index: If True, the index value is the first value of each row.
+    :return: The iterator of rows.
+    """
+    for start in range(0, len(table), STREAMING_CHUNK_SIZE):
+        chunk: pd.DataFrame = table.iloc[start:start + STREAMING_CHUNK_SIZE]
+        if index:
+            chunk = chunk.reset_index()
+        values = chunk.astype(object).where(chunk.notna(), None).to_numpy(dtype=object)
+        for row in values.tolist():
+            yield row
+
+
+def _clean_name(name: str) -> str:
+    """
+    Remove the characters which are not valid in file names.
+
+    :param name: The name.
+    :return: The cleaned name.
+    """
+    return re.sub(r"[^\w\-. ]", "", name).strip()
@@ -1,26 +1,18 @@
 from typing import List, Tuple, Dict
 
-import re
+from .proteins import get_protein_sequence, get_residue_position_array
 
 
-def get_residue_positions(residues: str) -> List[Tuple[int, str]]:
+def get_residue_positions(residues: str, protein: str = "CRT") -> List[Tuple[int, str]]:
     """
-    Get residues in CRT.
+    Get residues in the protein (Precursor numbering).
 
     :param residues: The residues to search for.
+    :param protein: The protein name in the protein registry. Default CRT.
     :return: The tuple containing the position and the residue and position. Fx (163, 'C163').
     """
-
-    sequence = \
-        "MLLSVPLLLGLLGLAVAEPAVYFKEQFLDGDGWTSRWIESKHKSDFGKFVLSSGKFYGDE" + \
-        "EKDKGLQTSQDARFYALSASFEPFSNKGQTLVVQFTVKHEQNIDCGGGYVKLFPNSLDQT" + \
-        "DMHGDSEYNIMFGPDICGPGTKKVHVIFNYKGKNVLINKDIRCKDDEFTHLYTLIVRPDN" + \
-        "TYEVKIDNSQVESGSLEDDWDFLPPKKIKDPDASKPEDWDERAKIDDPTDSKPEDWDKPE" + \
-        "HIPDPDAKKPEDWDEEMDGEWEPPVIQNPEYKGEWKPRQIDNPDYKGTWIHPEIDNPEYS" + \
-        "PDPSIYAYDNFGVLGLDLWQVKSGTIFDNFLITNDEAYAEEFGNETWGVTKAAEKQMKDK" + \
-        "QDEEQRLKEEEEDKKRKEEEEAEDKEDDEDKDEDEEDEEDKEEDEEEDVPGQAKDEL"
-    result = [(match.start() + 1, f"{match.group(0)}{match.start() + 1}") for match in
-              re.finditer(f"[{residues}]", sequence.upper())]
+    sequence: str = get_protein_sequence(protein)
+    result = [(int(pos), f"{sequence[pos - 1]}{pos}") for pos in get_residue_position_array(protein, residues)]
 
     return result
 
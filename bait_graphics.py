@@ -1,7 +1,12 @@
+import pathlib
+from typing import Optional
+
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 
+from analysis_code import show_or_save_figure
+
 
 def main():
     filename: str = r"C:\Users\spec-makie17\Documents\Experiments\FigureGeneration\Bait\HitStats.xlsx"
@@ -18,7 +23,8 @@ def main():
     create_barplot_take3(df)
 
 
-def create_barplot_take_12(lacto_data: pd.DataFrame, ribo_data: pd.DataFrame):
+def create_barplot_take_12(lacto_data: pd.DataFrame, ribo_data: pd.DataFrame,
+                           output_directory: Optional[pathlib.Path] = None):
     def create_chart(data_f: pd.DataFrame, bait_name: str, condition: str, axis):
         sns.barplot(data=data_f, x="Time", y="Values", hue="Condition", ci=None, ax=axis)
         for container in axis.containers:
@@ -46,10 +52,10 @@ def create_barplot_take_12(lacto_data: pd.DataFrame, ribo_data: pd.DataFrame):
     plt.legend(loc="lower center", ncol=4, bbox_to_anchor=(0.5, -0.4), fontsize=15)
     plt.subplots_adjust(left=0.04, bottom=0.08, right=0.97, top=0.95)
 
-    plt.show()
+    show_or_save_figure(figure=fig, output_directory=output_directory, file_name="bait_hits_take_12")
 
 
-def create_barplot_take3(data: pd.DataFrame):
+def create_barplot_take3(data: pd.DataFrame, output_directory: Optional[pathlib.Path] = None):
     def create_subplot(hits_df: pd.DataFrame, condition: str, axis):
         sns.barplot(data=hits_df, x="Type", y="UniqueHits", hue="Condition", ax=axis, ci=None)
         for container in axis.containers:
@@ -67,7 +73,7 @@ def create_barplot_take3(data: pd.DataFrame):
     plt.legend(loc="lower center", ncol=4, bbox_to_anchor=(0.5, -0.2), fontsize=13)
     plt.subplots_adjust(left=0.04, bottom=0.08, right=0.97, top=0.95)
 
-    plt.show()
+    show_or_save_figure(figure=fig, output_directory=output_directory, file_name="bait_hits_take3")
 
 
 if __name__ == "__main__":
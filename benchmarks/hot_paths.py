@@ -0,0 +1,232 @@
+"""
+Description: Benchmark the hot paths of the analysis on synthetic peptide lists and store the results as JSON.
+
+Each benchmark is timed on lists of increasing size, and the peak memory of a separate run is measured with
+tracemalloc. The in-memory benchmarks run the core of the analysis functions on the generated data frames, and the
+file benchmarks ('--files') run the public functions on generated Excel files with the peptide list cache disabled.
+Excel files can not hold more than a million rows, so the file benchmarks are only run for the smaller sizes. The
+default sizes go up to a million rows, and larger lists can be given with '--sizes' (Fx. '--sizes 10000000').
+
+Usage: python benchmarks/hot_paths.py [--sizes N ...] [--repeat N] [--files] [--output FILE]
+                                      [--compare BASELINE_FILE] [--threshold RATIO]
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+REPOSITORY_DIRECTORY: pathlib.Path = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_DIRECTORY))
+sys.path.insert(0, str(REPOSITORY_DIRECTORY / "ISA"))
+
+from analysis_code import calculate_hit_statistics, calculate_modification_percentages, \
+    combine_spectra_in_peptide_lists, get_protein_sequence, get_residue_position_array, \
+    set_peptide_list_cache_enabled, use_headless_backend  # noqa
+from analysis_code.modification_statistics import _calculate_list_modification_statistics, _combine_spectra  # noqa
+from synthetic_peptide_lists import generate_peptide_list, to_combined_format  # noqa: E402
+
+DEFAULT_SIZES: List[int] = [1_000, 10_000, 100_000, 1_000_000]
+EXCEL_MAX_ROWS: int = 1_048_575
+MODIFICATIONS: List[tuple] = [("Oxidation", "M", 15.995), ("Oxidation", "W", 15.995),
+                              ("Carbamidomethyl", "C", 57.021), ("Deamidation", "NQ", 0.984)]
+PROTEIN: str = "CRT"
+HIT_CONDITIONS: int = 8
+
+
+def _create_memory_benchmarks(raw_list: pd.DataFrame) -> Dict[str, Callable[[], object]]:
+    """
+    Create the in-memory benchmarks for a generated peptide list.
+
+    :param raw_list: The raw peptide list.
+    :return: The dictionary with the benchmark name and the function to time.
+    """
+    use_headless_backend()
+    import position_plots
+    from cysteine_oxidations import MODIFICATIONS as CYSTEINE_MODIFICATIONS
+    from quantiative_plot_utilities import _find_modifications
+
+    combined_list: pd.DataFrame = to_combined_format(raw_list)
+    sequence: str = get_protein_sequence(PROTEIN, mature=True)
+    cysteine_positions: List[int] = get_residue_position_array(PROTEIN, "C", mature=True).tolist()
+    # The list split into conditions as read with 'read_hit_lists'
+    hits: pd.DataFrame = raw_list[["from", "to", "seq", "#"]].assign(
+        Protein=pd.Categorical([PROTEIN] * len(raw_list)),
+        Condition=pd.Categorical.from_codes(np.arange(len(raw_list)) % HIT_CONDITIONS,
+                                            categories=[f"Condition{index}" for index in range(HIT_CONDITIONS)]))
+
+    return {
+        "combine_spectra": lambda: _combine_spectra(peptide_list=combined_list),
+        "modification_statistics": lambda: _calculate_list_modification_statistics(
+            peptide_list=combined_list, sequence=sequence, modifications=MODIFICATIONS),
+        "position_dataframe": lambda: position_plots._create_position_dataframe(
+            peptide_list=combined_list, residues="M", mass_change="15.995", protein=PROTEIN),
+        "find_modifications": lambda: _find_modifications(hits_df=raw_list, positions=cysteine_positions,
+                                                          modification_dict=CYSTEINE_MODIFICATIONS),
+        "hit_statistics": lambda: calculate_hit_statistics(hits=hits),
+    }
+
+
+def _create_file_benchmarks(raw_list: pd.DataFrame, directory: pathlib.Path) -> Dict[str, Callable[[], object]]:
+    """
+    Write the generated peptide list to an Excel file and create the benchmarks of the public functions.
+
+    :param raw_list: The raw peptide list.
+    :param directory: The temporary directory for the files.
+    :return: The dictionary with the benchmark name and the function to time.
+    """
+    import hits_calculator
+    import position_plots
+
+    list_directory: pathlib.Path = directory / "lists"
+    combined_directory: pathlib.Path = directory / "combined"
+    list_directory.mkdir()
+    combined_directory.mkdir()
+    raw_list.to_excel(list_directory / "synthetic.xlsx", index=False)
+    combine_spectra_in_peptide_lists(list_directory=list_directory, save_directory=combined_directory)
+    sequence: str = get_protein_sequence(PROTEIN, mature=True)
+
+    return {
+        "file_combine_spectra_in_peptide_lists": lambda: combine_spectra_in_peptide_lists(
+            list_directory=list_directory, save_directory=combined_directory),
+        "file_calculate_modification_percentages": lambda: calculate_modification_percentages(
+            peptide_list_directory=combined_directory, sequence=sequence, residue_str="M", mod_mass=15.995),
+        "file_create_dataframe": lambda: position_plots.create_dataframe(
+            file_path=combined_directory / "synthetic.xlsx", residues="M", mass_change="15.995", protein=PROTEIN),
+        "file_calculate_hit_statistics": lambda: hits_calculator.calculate_hit_statistics(
+            directories={PROTEIN: list_directory}),
+    }
+
+
+def measure(function: Callable[[], object], repeat: int) -> dict:
+    """
+    Time a function and measure its peak memory in a separate run, so tracemalloc does not affect the timings.
+
+    :param function: The function.
+    :param repeat: The number of timed runs.
+    :return: The dictionary with the best and median time in seconds and the peak memory in bytes.
+    """
+    durations: List[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak_memory: int = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"best": min(durations), "median": statistics.median(durations), "repeat": repeat,
+            "peak_memory": peak_memory}
+
+
+def run_benchmarks(sizes: List[int], repeat: int, files: bool, seed: int = 0) -> List[dict]:
+    """
+    Run the benchmarks for each of the list sizes.
+
+    :param sizes: The list sizes in rows.
+    :param repeat: The number of timed runs of each benchmark.
+    :param files: If True, the file benchmarks are run as well.
+    :param seed: The seed of the list generator.
+    :return: The list of results.
+    """
+    results: List[dict] = []
+    for rows in sizes:
+        raw_list: pd.DataFrame = generate_peptide_list(rows=rows, protein=PROTEIN, seed=seed)
+        benchmarks: Dict[str, Callable[[], object]] = _create_memory_benchmarks(raw_list=raw_list)
+
+        with tempfile.TemporaryDirectory() as directory:
+            if files and rows <= EXCEL_MAX_ROWS:
+                set_peptide_list_cache_enabled(False)
+                benchmarks.update(_create_file_benchmarks(raw_list=raw_list, directory=pathlib.Path(directory)))
+
+            for name, function in benchmarks.items():
+                result: dict = {"benchmark": name, "rows": rows, **measure(function=function, repeat=repeat)}
+                print(f"{name:<45}{rows:>12,}{result['best']:>12.4f} s{result['peak_memory'] / 1024 ** 2:>12.1f} MiB")
+                results.append(result)
+
+        set_peptide_list_cache_enabled(True)
+
+    return results
+
+
+def compare_results(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """
+    Compare the results with a baseline.
+
+    :param results: The results.
+    :param baseline: The baseline results.
+    :param threshold: The ratio of the best times above which a benchmark is a regression.
+    :return: The list of regressions.
+    """
+    baseline_times: Dict[tuple, float] = {(result["benchmark"], result["rows"]): result["best"] for result in baseline}
+    regressions: List[str] = []
+    for result in results:
+        baseline_time: Optional[float] = baseline_times.get((result["benchmark"], result["rows"]))
+        if baseline_time is None or baseline_time <= 0:
+            continue
+        ratio: float = result["best"] / baseline_time
+        print(f"{result['benchmark']:<45}{result['rows']:>12,}{ratio:>10.2f}x")
+        if ratio > threshold:
+            regressions.append(f"{result['benchmark']} ({result['rows']:,} rows): {ratio:.2f}x slower")
+    return regressions
+
+
+def _get_metadata() -> dict:
+    """
+    Get the version information of the benchmark run.
+
+    :return: The dictionary with the metadata.
+    """
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_DIRECTORY, capture_output=True, text=True)
+    return {"commit": commit.stdout.strip() if commit.returncode == 0 else None,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the analysis.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="The list sizes in rows.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of timed runs of each benchmark.")
+    parser.add_argument("--files", action="store_true", help="Run the file benchmarks of the public functions.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the list generator.")
+    parser.add_argument("--output", type=pathlib.Path, help="The JSON results file. Default is "
+                                                            "'benchmarks/results/hot_paths-<commit>.json'.")
+    parser.add_argument("--compare", type=pathlib.Path, help="The JSON results file to compare with.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="The slowdown ratio which is reported as a regression.")
+    arguments = parser.parse_args()
+
+    metadata: dict = _get_metadata()
+    results: List[dict] = run_benchmarks(sizes=arguments.sizes, repeat=arguments.repeat, files=arguments.files,
+                                         seed=arguments.seed)
+
+    output_file: pathlib.Path = arguments.output if arguments.output is not None else \
+        REPOSITORY_DIRECTORY / "benchmarks" / "results" / f"hot_paths-{(metadata['commit'] or 'unknown')[:10]}.json"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    output_file.write_text(json.dumps({"metadata": metadata, "results": results}, indent=2))
+    print(f"Results saved in {output_file}")
+
+    if arguments.compare is not None:
+        baseline: List[dict] = json.loads(arguments.compare.read_text())["results"]
+        regressions: List[str] = compare_results(results=results, baseline=baseline, threshold=arguments.threshold)
+        if regressions:
+            sys.exit("Regressions:\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
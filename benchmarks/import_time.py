@@ -0,0 +1,63 @@
+"""
+Description: Benchmark the cold-start import time of the analysis package and guard the budget.
+
+The package is imported in fresh interpreters, and the benchmark fails if the best import time is above the budget or
+if a plotting library is imported before a plotting function is called.
+
+Usage: python benchmarks/import_time.py [--budget SECONDS] [--repeat N]
+"""
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+from typing import List
+
+REPOSITORY_DIRECTORY: pathlib.Path = pathlib.Path(__file__).resolve().parent.parent
+PLOTTING_MODULES: List[str] = ["matplotlib", "seaborn", "tqdm"]
+IMPORT_SCRIPT: str = f"""
+import json, sys, time
+start = time.perf_counter()
+import analysis_code
+duration = time.perf_counter() - start
+print(json.dumps({{"duration": duration, "loaded": [m for m in {PLOTTING_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import_time(repeat: int) -> dict:
+    """
+    Import the package in fresh interpreters.
+
+    :param repeat: The number of imports.
+    :return: The dictionary with the best and all import times and the loaded plotting modules.
+    """
+    durations: List[float] = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        output: str = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=REPOSITORY_DIRECTORY, check=True,
+                                     capture_output=True, text=True).stdout
+        result: dict = json.loads(output.strip().splitlines()[-1])
+        durations.append(result["duration"])
+        loaded = sorted(set(loaded) | set(result["loaded"]))
+
+    return {"best": min(durations), "durations": durations, "loaded_plotting_modules": loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold-start import time of 'analysis_code'.")
+    parser.add_argument("--budget", type=float, default=1.0, help="The import time budget in seconds.")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of imports.")
+    arguments = parser.parse_args()
+
+    result: dict = measure_import_time(repeat=arguments.repeat)
+    result["budget"] = arguments.budget
+    print(json.dumps(result, indent=2))
+
+    if result["loaded_plotting_modules"]:
+        sys.exit(f"Plotting modules imported at start-up: {', '.join(result['loaded_plotting_modules'])}")
+    if result["best"] > arguments.budget:
+        sys.exit(f"Import time {result['best']:.3f} s is above the budget of {arguments.budget:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
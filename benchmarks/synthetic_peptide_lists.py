@@ -0,0 +1,119 @@
+"""
+Description: Generate synthetic peptide lists from a protein sequence for the benchmarks.
+
+The lists have the same columns as the raw peptide lists ('from', 'to', 'seq', 'modifs' and '#'). The peptides are
+random subsequences of the mature protein, so the same peptides are found many times, and the modifications are only
+placed on residues which can carry them.
+
+Usage: python benchmarks/synthetic_peptide_lists.py OUTPUT_FILE [--rows N] [--seed SEED] [--protein NAME]
+"""
+import argparse
+import pathlib
+import sys
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from analysis_code.proteins import get_protein_sequence  # noqa: E402
+
+# The modification masses which can be found on each of the residues
+MODIFICATION_MASSES: Dict[str, List[str]] = {
+    "C": ["57.021", "-33.988", "15.995", "31.990", "47.985", "79.957"],
+    "M": ["15.995", "31.990"],
+    "W": ["15.995", "31.990"],
+    "H": ["15.995"],
+    "P": ["15.995"],
+    "N": ["0.984"],
+    "Q": ["0.984", "-17.027"],
+    "E": ["-18.011"],
+}
+MIN_PEPTIDE_LENGTH: int = 5
+MAX_PEPTIDE_LENGTH: int = 25
+# The probability of a peptide having 0, 1 or 2 modifications
+MODIFICATION_COUNT_PROBABILITIES: List[float] = [0.5, 0.35, 0.15]
+
+
+def generate_peptide_list(rows: int, protein: str = "CRT", seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a synthetic raw peptide list. The positions are in the mature protein numbering.
+
+    :param rows: The number of rows.
+    :param protein: The protein name in the protein registry.
+    :param seed: The seed of the random generator.
+    :return: The peptide list with the 'from', 'to', 'seq', 'modifs' and '#' columns.
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    sequence: str = get_protein_sequence(protein, mature=True)
+    residues: np.ndarray = np.frombuffer(sequence.encode(), dtype=np.uint8)
+
+    lengths: np.ndarray = rng.integers(MIN_PEPTIDE_LENGTH, MAX_PEPTIDE_LENGTH + 1, rows)
+    starts: np.ndarray = (rng.random(rows) * (len(sequence) - lengths + 1)).astype(np.int64) + 1
+    ends: np.ndarray = starts + lengths - 1
+
+    # Lookup tables from the residue code to the number of masses and the mass strings
+    mass_counts: np.ndarray = np.zeros(256, dtype=np.int64)
+    mass_strings: np.ndarray = np.full((256, max(len(masses) for masses in MODIFICATION_MASSES.values())), "",
+                                       dtype=object)
+    for residue, masses in MODIFICATION_MASSES.items():
+        mass_counts[ord(residue)] = len(masses)
+        mass_strings[ord(residue), :len(masses)] = masses
+
+    # Place each modification on a random residue of the peptide, and drop it if the residue can not be modified
+    modification_counts: np.ndarray = rng.choice(len(MODIFICATION_COUNT_PROBABILITIES), size=rows,
+                                                 p=MODIFICATION_COUNT_PROBABILITIES)
+    modifications: np.ndarray = np.full(rows, "", dtype=object)
+    previous_positions: np.ndarray = np.zeros(rows, dtype=np.int64)
+    for slot in range(len(MODIFICATION_COUNT_PROBABILITIES) - 1):
+        positions: np.ndarray = starts + (rng.random(rows) * lengths).astype(np.int64)
+        codes: np.ndarray = residues[positions - 1]
+        active: np.ndarray = (modification_counts > slot) & (mass_counts[codes] > 0) & \
+            (positions != previous_positions)
+        mass_indices: np.ndarray = (rng.random(rows) * np.maximum(mass_counts[codes], 1)).astype(np.int64)
+        modification: np.ndarray = positions.astype(str).astype(object) + "@" + mass_strings[codes, mass_indices]
+        # Keep the modifications sorted by position
+        after: np.ndarray = positions > previous_positions
+        modifications = np.where(~active, modifications,
+                                 np.where(modifications == "", modification,
+                                          np.where(after, modifications + " " + modification,
+                                                   modification + " " + modifications)))
+        previous_positions = np.where(active, positions, previous_positions)
+    modifications[modifications == ""] = "-"
+
+    return pd.DataFrame({"from": starts, "to": ends, "seq": [sequence[start - 1:end] for start, end in zip(starts, ends)],
+                         "modifs": modifications, "#": rng.geometric(0.3, rows)})
+
+
+def to_combined_format(peptide_list: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rename the columns of a raw peptide list to the columns of the combined peptide lists.
+
+    :param peptide_list: The raw peptide list.
+    :return: The peptide list with the 'Start', 'End', 'Sequence', 'Modification' and 'Spectra' columns.
+    """
+    return peptide_list.rename(columns={"from": "Start", "to": "End", "seq": "Sequence", "modifs": "Modification",
+                                        "#": "Spectra"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic peptide list.")
+    parser.add_argument("output_file", type=pathlib.Path, help="The output file (XLSX, CSV or Parquet).")
+    parser.add_argument("--rows", type=int, default=10000, help="The number of rows.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random generator.")
+    parser.add_argument("--protein", default="CRT", help="The protein name in the protein registry.")
+    arguments = parser.parse_args()
+
+    peptide_list: pd.DataFrame = generate_peptide_list(rows=arguments.rows, protein=arguments.protein,
+                                                       seed=arguments.seed)
+    if arguments.output_file.suffix == ".csv":
+        peptide_list.to_csv(arguments.output_file, index=False)
+    elif arguments.output_file.suffix == ".parquet":
+        peptide_list.to_parquet(arguments.output_file, index=False)
+    else:
+        peptide_list.to_excel(arguments.output_file, index=False)
+
+
+if __name__ == "__main__":
+    main()
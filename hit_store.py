@@ -0,0 +1,4 @@
+from analysis_code.hit_store import main
+
+if __name__ == '__main__':
+    main()
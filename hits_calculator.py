@@ -1,53 +1,56 @@
 import pathlib
-from typing import Dict
+from typing import Callable, Dict, Optional, Sequence, Union
 
 import pandas as pd
 
+from analysis_code import calculate_hit_statistics as calculate_group_hit_statistics, find_protein_name, \
+    open_result_sink, read_hit_lists
+from analysis_code.prefetch import DEFAULT_PREFETCH
 
-def calculate_hit_statistics(directory: pathlib.Path) -> pd.DataFrame:
-    """
-    Calculate hit statics
 
-    :param directory: The directory.
-    :return: The pandas data frame with the statistics.
+def calculate_hit_statistics(directories: Union[pathlib.Path, Sequence[pathlib.Path], Dict[str, pathlib.Path]],
+                             mature: bool = True, prefetch: int = DEFAULT_PREFETCH,
+                             condition_proteins: Union[Dict[str, str], Callable[[str], Optional[str]], None] = None) \
+        -> Dict[str, pd.DataFrame]:
     """
-    files: list[tuple[str, pathlib.Path]] = [(file.stem, directory / file) for file in directory.glob("*.xlsx")
-                                             if file.is_file()]
-
-    result_dict: dict = {}
-
-    for file_name, file_path in files:
-        data: pd.DataFrame = pd.read_excel(file_path, usecols=["seq", "#", "modifs"])
-
-        # Check C-terminal modification for trypsin digestions
-        if "tryp" in file_name:
-            continue
-            #o18_1 = data["modifs"].str.contains("@2.004")
-            #o18_2 = data["modifs"].str.contains("@4.009")
-            #data = data[o18_1 | o18_2]
-
-        result_dict[file_name] = _calculate_file_hit_statistics(hits_df=data)
+    Calculate hit statistics of each peptide list and each protein.
+
+    :param directories: The directory, the list of directories or the dictionary with the protein name and its
+        directory. Without a dictionary, the directory name is used as the protein name.
+    :param mature: If True, the coverage is calculated for the mature proteins.
+    :param prefetch: The number of lists read ahead on background threads.
+    :param condition_proteins: The dictionary or the function mapping a condition to its protein. If None, the protein
+        of the directory is used.
+    :return: The dictionary with the statistics of each condition ('Conditions') and each protein ('Proteins').
+    """
+    # Skip the trypsin digestions, which should be filtered on the C-terminal modifications
+    # (@2.004 or @4.009 in 'modifs')
+    hits: pd.DataFrame = read_hit_lists(directories=directories, exclude="tryp", prefetch=prefetch,
+                                        condition_proteins=condition_proteins)
 
-    return pd.DataFrame.from_dict(result_dict, orient="index")
+    return {"Conditions": calculate_group_hit_statistics(hits=hits, by=("Protein", "Condition"), mature=mature),
+            "Proteins": calculate_group_hit_statistics(hits=hits, by=("Protein",), mature=mature)}
 
 
-def _calculate_file_hit_statistics(hits_df: pd.DataFrame) -> dict:
+def get_condition_protein(condition: str) -> Optional[str]:
     """
-    Calculate the hit statistics for an single file.
+    Get the protein of a condition from its name. Fx. 'Nat_Crt_0' is CRT, 'Nat_lacto_0' is Lacto,
+    'Nat_LactoCrt_72_Crt' is CRT and 'Nat_LactoCrt_72_Bait' is Lacto (The bait protein).
 
-    :param hits_df: The file path to the hit file.
-    :return: The dictionary with the statistics.
+    :param condition: The condition name.
+    :return: The registered protein name, or None if the protein is unknown.
     """
-    result_dict: Dict[str, int] = {'TotalHits': 0, 'UniqueHits': 0, 'HitsOnlySeq': 0}
-
-    result_dict["TotalHits"] = sum(hits_df["#"])
-    result_dict["UniqueHits"] = len(hits_df.index)
-    result_dict["HitsOnlySeq"] = len(list(set(hits_df["seq"])))
-
-    return result_dict
+    parts: list[str] = condition.split("_")
+    if parts[-1] == "Bait" and len(parts) > 1:
+        # The bait is the protein incubated with CRT. Fx. 'LactoCrt' is Lacto.
+        return next((find_protein_name(part[:-len("Crt")]) for part in parts
+                     if part.endswith("Crt") and len(part) > len("Crt")), None)
+    if parts[-1] == "Crt":
+        return find_protein_name("Crt")
+    return next((protein for protein in map(find_protein_name, parts) if protein is not None), None)
 
 
-def main():
+def main(output_format: str = "xlsx"):
     pd.set_option('display.max_rows', None)
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', None)
@@ -57,9 +60,13 @@ def main():
         pathlib.Path(
             r"C:\Users\spec-makie17\Documents\Experiments\FigureGeneration\Bait_Take3\Lists_CBM")
 
-    df = calculate_hit_statistics(file_path)
-    print(df)
-    df.to_excel(file_path / "../HitsCBM.xlsx")
+    # The directory holds the lists of all the proteins, so each condition is mapped to its own protein
+    statistics: Dict[str, pd.DataFrame] = calculate_hit_statistics(file_path,
+                                                                   condition_proteins=get_condition_protein)
+    with open_result_sink(file_path / "../HitsCBM.xlsx", file_format=output_format) as sink:
+        for name, df in statistics.items():
+            print(df)
+            sink.write_table(df, name=name)
 
 
 if __name__ == "__main__":
@@ -1,25 +1,26 @@
 import pathlib
+from typing import Optional
 
 import pandas as pd
 
-from analysis_code import calculate_modification_percentages, combine_spectra_in_peptide_lists
+from analysis_code import DigestionSettings, calculate_modification_statistics, combine_spectra_in_peptide_lists, \
+    get_protein_sequence, open_result_sink, split_modification_statistics
 
 
-def perform_analysis(peptide_list_directory: pathlib.Path, sequence: str, modifications: list[tuple[str, str, float]]):
-    with pd.ExcelWriter(peptide_list_directory / f"../CRTModStats.xlsx") as writer:
+def perform_analysis(peptide_list_directory: pathlib.Path, sequence: str, modifications: list[tuple[str, str, float]],
+                     output_format: str = "xlsx", digestion: Optional[DigestionSettings] = None):
+    mod_stats: pd.DataFrame = calculate_modification_statistics(peptide_list_directory=peptide_list_directory,
+                                                                sequence=sequence, modifications=modifications,
+                                                                digestion=digestion)
+    mod_dfs: dict[str, pd.DataFrame] = split_modification_statistics(statistics=mod_stats, condition_order=["Nat_Crt_0", "Nat_lacto_0", "Nat_Ribo_0", "Nat_Crt_72", "RedAlk_Crt_72", "Nat_LactoCrt_72_Crt", "RedAlk_LactoCrt_72_Crt", "Nat_LactoCrt_72_Bait", "RedAlk_LactoCrt_72_Bait", "Nat_RiboCrt_72_Crt", "RedAlk_RiboCrt_72_Crt", "Nat_RiboCrt_72_Bait", "RedAlk_RiboCrt_72_Bait"])
+    with open_result_sink(peptide_list_directory / "../CRTModStats.xlsx", file_format=output_format) as sink:
         for mod_name, res, mod_mass in modifications:
             print("*" * 5, f"{mod_name} ({res}@{mod_mass})", "*" * 5)
-            mod_dict: dict = calculate_modification_percentages(peptide_list_directory=peptide_list_directory,
-                                                                sequence=sequence,
-                                                                residue_str=res,
-                                                                mod_mass=mod_mass)
-            mod_df: pd.DataFrame = pd.DataFrame.from_dict(mod_dict, orient="index")
-            mod_df = mod_df.reindex(["Nat_Crt_0", "Nat_lacto_0", "Nat_Ribo_0", "Nat_Crt_72", "RedAlk_Crt_72", "Nat_LactoCrt_72_Crt", "RedAlk_LactoCrt_72_Crt", "Nat_LactoCrt_72_Bait", "RedAlk_LactoCrt_72_Bait", "Nat_RiboCrt_72_Crt", "RedAlk_RiboCrt_72_Crt", "Nat_RiboCrt_72_Bait", "RedAlk_RiboCrt_72_Bait"])
+            mod_df: pd.DataFrame = mod_dfs[mod_name]
 
             print(mod_df)
             print()
-            mod_df.to_excel(writer, sheet_name=mod_name)
-            
+            sink.write_table(mod_df, name=mod_name)
 
 
 def main():
@@ -27,10 +28,10 @@ def main():
         r"C:\Users\spec-makie17\Documents\Experiments\FigureGeneration\Bait_Take3")
     raw_peptide_list_folder = pathlib.Path("Lists_CBM")
     peptide_list_folder = pathlib.Path("Lists_Combined_CBM")
-    bsa_sequence: str = "DTHKSEIAHRFKDLGEEHFKGLVLIAFSQYLQQCPFDEHVKLVNELTEFAKTCVADESHAGCEKSLHTLFGDELCKVASLRETYGDMADCCEKQEPERNECFLSHKDDSPDLPKLKPDPNTLCDEFKADEKKFWGKYLYEIARRHPYFYAPELLYYANKYNGVFQECCQAEDKGACLLPKIETMREKVLASSARQRLRCASIQKFGERALKAWSVARLSQKFPKAEFVEVTKLVTDLTKVHKECCHGDLLECADDRADLAKYICDNQDTISSKLKECCDKPLLEKSHCIAEVEKDAIPENLPPLTADFAEDKDVCKNYQEAKDAFLGSFLYEYSRRHPEYAVSVLLRLAKEYEATLEECCAKDDPHACYSTVFDKLKHLVDEPQNLIKQNCDQFEKLGEYGFQNALIVRYTRKVPQVSTPTLVEVSRSLGKVGTRCCTKPESERMPCTEDYLSLILNRLCVLHEKTPVSEKVTKCCTESLVNRRPCFSALTPDETYVPKAFDEKLFTFHADICTLPDTEKQIKKQTALVELLKHKPKATEEQLKTVMENFVAFVDKCCAADDKEACFAVEGPKLVVSTQTALA"
-    crt_sequence: str = "EPAVYFKEQFLDGDGWTSRWIESKHKSDFGKFVLSSGKFYGDEEKDKGLQTSQDARFYALSASFEPFSNKGQTLVVQFTVKHEQNIDCGGGYVKLFPNSLDQTDMHGDSEYNIMFGPDICGPGTKKVHVIFNYKGKNVLINKDIRCKDDEFTHLYTLIVRPDNTYEVKIDNSQVESGSLEDDWDFLPPKKIKDPDASKPEDWDERAKIDDPTDSKPEDWDKPEHIPDPDAKKPEDWDEEMDGEWEPPVIQNPEYKGEWKPRQIDNPDYKGTWIHPEIDNPEYSPDPSIYAYDNFGVLGLDLWQVKSGTIFDNFLITNDEAYAEEFGNETWGVTKAAEKQMKDKQDEEQRLKEEEEDKKRKEEEEAEDKEDDEDKDEDEEDEEDKEEDEEEDVPGQAKDEL"
-    lacto_sequence: str = "LIVTQTMKGLDIQKVAGTWYSLAMAASDISLLDAQSAPLRVYVEELKPTPEGDLEILLQKWENGECAQKKIIAEKTKIPAVFKIDALNENKVLVLDTDYKKYLLFCMENSAEPEQSLACQCLVRTPEVDDEALEKFDKALKALPMHIRLSFNPTQLEEQCHI"
-    ribo_sequence: str = "KETAAAKFERQHMDSSTSAASSSNYCNQMMKSRNLTKDRCKPVNTFVHESLADVQAVCSQKNVACKNGQTNCYQSYSTMSITDCRETGSSKYPNCAYKTTQANKHIIVACEGNPYVPVHFDASV"
+    bsa_sequence: str = get_protein_sequence("BSA")
+    crt_sequence: str = get_protein_sequence("CRT", mature=True)
+    lacto_sequence: str = get_protein_sequence("Lacto")
+    ribo_sequence: str = get_protein_sequence("Ribo")
     if False:
         list_dir = base_directory / raw_peptide_list_folder
         save_dir = base_directory / peptide_list_folder
@@ -1,90 +1,101 @@
-import functools
 import pathlib
+from typing import Dict, Optional
 
 import numpy as np
 import pandas as pd
 
-
-def read_filter_dataframes(file_path: pathlib.Path, portion: str) -> tuple[
-    pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    def read_filter_df(batch_name: str) -> pd.DataFrame:
-        df: pd.DataFrame = pd.read_excel(file_path, sheet_name=f"Batch {batch_name} - {portion}", index_col=0)
-        positions = df.index
-        df["Position"] = positions
-        position_integer = [int(str.replace(i, "M", "").replace("P", "").replace("H", "")) for i in positions]
-        df["PositionInt"] = position_integer
-        df = df.set_index("PositionInt")
-
-        df = df[df["TotalModSpectra"] > 1]
-        del df["TotalModSpectra"]
-        del df["ModifiedSpectra"]
-
-        df = df[["Position", "Percentage"]]
-        return df
-
-    batch25_df: pd.DataFrame = read_filter_df("2.5")
-    batch35_df: pd.DataFrame = read_filter_df("3.5")
-
-    batch1903_df: pd.DataFrame = read_filter_df("1903F")
-    batch1806_df: pd.DataFrame = read_filter_df("1806F")
-
-    return batch25_df, batch35_df, batch1903_df, batch1806_df
-
-
-def combine_dataframes(dfs: tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]):
-    new_columns = ["Position", "2.5", "3.5", "19/03F", "18/06F"]
-    df_left = functools.reduce(lambda left, right: pd.merge(left, right, how="left", on='Position'), dfs)
-    df_left.columns = new_columns
-    df_right = functools.reduce(lambda left, right: pd.merge(left, right, how="right", on='Position'), dfs)
-    df_right.columns = new_columns
-
-    combined_df = pd.merge(df_left, df_right, how="outer", on="Position")
-    combined_df = combined_df.set_index("Position")
-    combined_df["2.5"] = np.nan
-    combined_df["3.5"] = np.nan
-    combined_df["19/03F"] = np.nan
-    combined_df["18/06F"] = np.nan
-
-    combined_df = combined_df.fillna(0)
-
-    for _, row in combined_df.iterrows():
-        if row["2.5_x"] != 0:
-            row["2.5"] = row["2.5_x"]
-        elif row["2.5_y"] != 0:
-            row["2.5"] = row["2.5_y"]
-
-        if row["3.5_x"] != 0:
-            row["3.5"] = row["3.5_x"]
-        elif row["3.5_y"] != 0:
-            row["3.5"] = row["3.5_y"]
-
-        if row["19/03F_x"] != 0:
-            row["19/03F"] = row["19/03F_x"]
-        elif row["19/03F_y"] != 0:
-            row["19/03F"] = row["19/03F_y"]
-
-        if row["18/06F_x"] != 0:
-            row["18/06F"] = row["18/06F_x"]
-        elif row["18/06F_y"] != 0:
-            row["18/06F"] = row["18/06F_y"]
-
-    combined_df = combined_df.loc[:, combined_df.columns.isin(["2.5", "3.5", "19/03F", "18/06F"])]
-    combined_df.replace(0, np.nan, inplace=True)
-
-    combined_df = combined_df[combined_df.iloc[:, 0:3].notna().sum(axis=1) > 1]
-
-    return combined_df
-
-
-def main():
+from analysis_code import ResidueCountStore, get_protein_sequence, get_residue_position_array, \
+    get_signal_peptide_length, write_result
+
+# The column name and the sheet name of each batch
+BATCHES: Dict[str, str] = {"2.5": "2.5", "3.5": "3.5", "19/03F": "1903F", "18/06F": "1806F"}
+# The column name and the peptide list name (Without the portion) of each batch in a residue count store
+STORE_BATCHES: Dict[str, str] = {"2.5": "CRT25", "3.5": "CRT35", "19/03F": "CRT1903", "18/06F": "CRT1806"}
+
+
+def read_filter_dataframes(file_path: pathlib.Path, portion: str, batches: Dict[str, str] = BATCHES,
+                           min_spectra: int = 1) -> Dict[str, pd.Series]:
+    """
+    Read the percentages of the batches from the sheets of a workbook. The workbook is only opened once.
+
+    :param file_path: The workbook with a 'Batch <batch> - <portion>' sheet for each batch.
+    :param portion: The portion. Fx. 'Flowthrough'.
+    :param batches: The dictionary with the column name and the sheet name of each batch.
+    :param min_spectra: The positions with this number of total spectra covering the position (TotalModSpectra) or
+        less are removed.
+    :return: The dictionary with the column name and the percentages indexed by the position of each batch.
+    """
+    sheet_names: Dict[str, str] = {column: f"Batch {batch} - {portion}" for column, batch in batches.items()}
+    sheets: Dict[str, pd.DataFrame] = pd.read_excel(file_path, sheet_name=list(sheet_names.values()), index_col=0)
+
+    return {column: sheets[sheet_name].loc[sheets[sheet_name]["TotalModSpectra"] > min_spectra, "Percentage"]
+            for column, sheet_name in sheet_names.items()}
+
+
+def read_store_percentages(store: ResidueCountStore, portion: str, modification: str, residues: str,
+                           batches: Dict[str, str] = STORE_BATCHES, protein: str = "CRT",
+                           min_spectra: int = 1) -> Dict[str, pd.Series]:
+    """
+    Read the percentages of the batches from a residue count store instead of the workbook. The store must be filled
+    from the combined peptide lists (Mature numbering), and the percentages and position labels are the same as in the
+    workbook sheets written by 'position_plots'.
+
+    :param store: The residue count store.
+    :param portion: The portion. Fx. 'Flowthrough'.
+    :param modification: The modification name in the store.
+    :param residues: The modified residues as a string. Fx. 'C'.
+    :param batches: The dictionary with the column name and the peptide list name (<name>_<portion>) of each batch.
+    :param protein: The protein name.
+    :param min_spectra: The positions with this number of total spectra covering the position or less are removed.
+    :return: The dictionary with the column name and the percentages indexed by the position of each batch.
+    """
+    sequence: str = get_protein_sequence(protein, mature=True)
+    positions: np.ndarray = get_residue_position_array(protein, residues, mature=True)
+    labels: np.ndarray = np.array([f"{sequence[position - 1]}{position + get_signal_peptide_length(protein)}"
+                                   for position in positions], dtype=object)
+
+    dfs: Dict[str, pd.Series] = {}
+    for column, name in batches.items():
+        _, percentage_df, hit_count_df = store.get_condition_tables(condition=f"{name}_{portion}", positions=positions)
+        percentages: np.ndarray = percentage_df[modification].round(2).to_numpy()
+        selected: np.ndarray = (hit_count_df[0].to_numpy() > min_spectra) & (percentages != 0)
+        dfs[column] = pd.Series(percentages[selected], index=labels[selected], name="Percentage")
+    return dfs
+
+
+def combine_dataframes(dfs: Dict[str, pd.Series], min_batches: int = 2) -> pd.DataFrame:
+    """
+    Combine the percentages of the batches with an outer join on the position.
+
+    :param dfs: The dictionary with the column name and the percentages indexed by the position of each batch.
+    :param min_batches: The minimum number of batches with a percentage at a position.
+    :return: The data frame with a column per batch, sorted by the position number. Missing percentages are NaN.
+    """
+    combined_df: pd.DataFrame = pd.concat(dfs, axis=1, join="outer", sort=False)
+    combined_df.index.name = "Position"
+
+    # Sort by the position number without the residue letter. Fx. 'M123' is 123.
+    position_numbers: pd.Series = pd.Series(combined_df.index, index=combined_df.index).astype(str) \
+        .str.extract(r"(\d+)", expand=False).astype(float)
+    combined_df = combined_df.iloc[position_numbers.to_numpy().argsort(kind="stable")]
+
+    return combined_df[combined_df.notna().sum(axis=1) >= min_batches]
+
+
+def main(output_format: str = "xlsx", count_store_directory: Optional[pathlib.Path] = None):
     portion: str = "Flowthrough"
     file: pathlib.Path = pathlib.Path(
         r"C:\Users\spec-makie17\Documents\Experiments\220425_Batches_PH22006\Oxidations.xlsx")
-    dfs = read_filter_dataframes(file_path=file, portion=portion)
+    if count_store_directory is None:
+        dfs = read_filter_dataframes(file_path=file, portion=portion)
+    else:
+        # The counts of the combined peptide lists, Fx. filled with ResidueCountStore.add_peptide_lists
+        dfs = read_store_percentages(store=ResidueCountStore(count_store_directory), portion=portion,
+                                     modification="Dehydroalanine", residues="C")
     combined = combine_dataframes(dfs)
-    combined["Average"] = round(combined.mean(axis=1), 3)
+    combined["Average"] = combined.mean(axis=1).round(3)
 
-    combined.to_excel(file.parent / f"Cys_Combined_{portion}.xlsx")
+    write_result(combined, file.parent / f"Cys_Combined_{portion}.xlsx", file_format=output_format)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
+import pathlib
+from typing import Optional
+
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+from analysis_code import show_or_save_figure
+
 
 def main():
     data_take: pd.DataFrame = pd.read_excel(
@@ -10,7 +15,7 @@ def main():
     create_modification_plot_take3(data_take)
 
 
-def create_modification_plot(data: pd.DataFrame):
+def create_modification_plot(data: pd.DataFrame, output_directory: Optional[pathlib.Path] = None):
     axis = sns.barplot(data=data, x=data.index, y="Percentage")
     #axis = sns.barplot(data=data, x=data.index, y="Percentage", hue="Portion")
     # axis.set_title("Total oxidation of methionine, proline and histine after 72 hour incubation", fontsize=19)
@@ -28,10 +33,10 @@ def create_modification_plot(data: pd.DataFrame):
     plt.subplots_adjust(left=0.04, bottom=0.08, right=0.97, top=0.95)
     plt.tick_params(axis='both', which='major', labelsize=14)
     #plt.legend(loc="lower center", ncol=4, bbox_to_anchor=(0.5, -0.085), fontsize=13)
-    plt.show()
+    show_or_save_figure(figure=axis.figure, output_directory=output_directory, file_name="modification_plot")
 
 
-def create_modification_plot_take3(data: pd.DataFrame):
+def create_modification_plot_take3(data: pd.DataFrame, output_directory: Optional[pathlib.Path] = None):
     def create_subplots(df: pd.DataFrame, time: str, axis):
         print(df)
         sns.barplot(data=df, x=df.index, y="Percentage", hue="Condition", ax=axis)
@@ -57,7 +62,7 @@ def create_modification_plot_take3(data: pd.DataFrame):
     ax[1].legend(loc="lower center", ncol=4, bbox_to_anchor=(0.5, -0.2), fontsize=13)
     plt.subplots_adjust(left=0.04, bottom=0.08, right=0.97, top=0.95)
 
-    plt.show()
+    show_or_save_figure(figure=fig, output_directory=output_directory, file_name="modification_plot_take3")
 
 
 if __name__ == "__main__":
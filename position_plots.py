@@ -1,77 +1,88 @@
 import pathlib
-import re
-from collections import defaultdict
+from typing import Callable, Optional
 
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-
-def has_oxidation(mod_str: str, pos: int) -> bool:
-    if mod_str == "-":
-        return False
-
-    mod_list: list[str] = []
-
-    if ';' in mod_str:
-        for part in mod_str.split(';'):
-            mod_list.append(part)
-    else:
-        mod_list.append(mod_str)
-
-    return f"{pos}@{MASS_CHANGE}" in mod_list
-
-
-def create_dataframe(file_path: pathlib.Path) -> pd.DataFrame:
-    df: pd.DataFrame = pd.read_excel(file_path, index_col=0)
-
-    raw_pos_mod: defaultdict = defaultdict(lambda: {"Percentage": 0, "ModifiedSpectra": 0, "TotalModSpectra": 0})
-
-    for _, row in df.iterrows():
-        for pos in RESIDUE_POSITIONS:
-            if int(row["Start"]) <= int(pos) <= int(row["End"]):
-                raw_pos_mod[int(pos)]["TotalModSpectra"] += 1
-                if has_oxidation(mod_str=row["Modification"], pos=int(pos)):
-                    raw_pos_mod[int(pos)]["ModifiedSpectra"] += 1
-
-    for pos in raw_pos_mod:
-        if raw_pos_mod[int(pos)]["TotalModSpectra"] == 0:
-            raw_pos_mod[int(pos)]["Percentage"] = 0
-        else:
-            raw_pos_mod[int(pos)]["Percentage"] = round(
-                (raw_pos_mod[int(pos)]["ModifiedSpectra"] / raw_pos_mod[int(pos)]["TotalModSpectra"]) * 100, 2)
-
-    pos_mod: defaultdict = defaultdict(lambda: {"Percentage": 0, "ModifiedSpectra": 0, "TotalModSpectra": 0})
-
-    for pos in raw_pos_mod:
-        if raw_pos_mod[pos]["Percentage"] != 0:
-            new_id: str = f"{SEQUENCE[pos - 1]}{pos + 17}"
-            pos_mod[new_id] = raw_pos_mod[pos]
-
-    percentage_df: pd.DataFrame = pd.DataFrame.from_dict(pos_mod, orient='index')
-    return percentage_df
-
-
-def create_modification_plot(data: pd.DataFrame, condition: str):
+from analysis_code import HitStore, ModificationTable, add_confidence_intervals, calculate_residue_coverage, \
+    draw_error_bars, get_protein_sequence, get_residue_position_array, get_signal_peptide_length, open_result_sink, \
+    parse_modifications, read_peptide_list, render_figures, show_or_save_figure
+from analysis_code.confidence_intervals import DEFAULT_CI_METHOD, LOWER_COLUMN, UPPER_COLUMN
+
+
+def create_dataframe(file_path: pathlib.Path, residues: str, mass_change: str, protein: str = "CRT",
+                     confidence_interval: Optional[str] = DEFAULT_CI_METHOD) -> pd.DataFrame:
+    return _create_position_dataframe(peptide_list=read_peptide_list(file_path, index_col=0), residues=residues,
+                                      mass_change=mass_change, protein=protein,
+                                      confidence_interval=confidence_interval)
+
+
+def _create_position_dataframe(peptide_list: pd.DataFrame, residues: str, mass_change: str,
+                               protein: str = "CRT", confidence_interval: Optional[str] = None) -> pd.DataFrame:
+    sequence: str = get_protein_sequence(protein, mature=True)
+    positions: np.ndarray = get_residue_position_array(protein, residues, mature=True)
+    coverage: pd.DataFrame = calculate_residue_coverage(starts=peptide_list["Start"], ends=peptide_list["End"],
+                                                        length=len(sequence))
+    mod_table: ModificationTable = parse_modifications(peptide_list["Modification"])
+    mod_counts: np.ndarray = mod_table.count_per_position(mod_table.mass_mask(float(mass_change)),
+                                                          length=len(sequence))
+
+    raw_pos_mod: pd.DataFrame = pd.DataFrame(
+        {"ModifiedSpectra": mod_counts[positions].astype(int),
+         "TotalModSpectra": coverage["Hits"].reindex(positions, fill_value=0).to_numpy()}, index=positions)
+    return _create_percentage_dataframe(raw_pos_mod=raw_pos_mod, sequence=sequence, protein=protein,
+                                        confidence_interval=confidence_interval)
+
+
+def create_store_dataframe(hit_store: HitStore, condition: str, residues: str, mass_change: str,
+                           protein: str = "CRT", experiment: Optional[str] = None,
+                           confidence_interval: Optional[str] = DEFAULT_CI_METHOD) -> pd.DataFrame:
+    sequence: str = get_protein_sequence(protein, mature=True)
+    raw_pos_mod: pd.DataFrame = hit_store.position_statistics(
+        condition=condition, positions=get_residue_position_array(protein, residues, mature=True).tolist(),
+        mass=float(mass_change), experiment=experiment)
+    return _create_percentage_dataframe(raw_pos_mod=raw_pos_mod, sequence=sequence, protein=protein,
+                                        confidence_interval=confidence_interval)
+
+
+def _create_percentage_dataframe(raw_pos_mod: pd.DataFrame, sequence: str, protein: str,
+                                 confidence_interval: Optional[str]) -> pd.DataFrame:
+    raw_pos_mod["Percentage"] = np.where(raw_pos_mod["TotalModSpectra"] == 0, 0, np.round(
+        (raw_pos_mod["ModifiedSpectra"] / raw_pos_mod["TotalModSpectra"].replace(0, 1)) * 100, 2))
+
+    percentage_df: pd.DataFrame = raw_pos_mod[raw_pos_mod["Percentage"] != 0]
+    percentage_df.index = [f"{sequence[pos - 1]}{pos + get_signal_peptide_length(protein)}"
+                           for pos in percentage_df.index]
+    percentage_df = percentage_df[["Percentage", "ModifiedSpectra", "TotalModSpectra"]]
+    if confidence_interval is None:
+        return percentage_df
+    return add_confidence_intervals(percentage_df, method=confidence_interval)[
+        ["Percentage", LOWER_COLUMN, UPPER_COLUMN, "ModifiedSpectra", "TotalModSpectra"]]
+
+
+def create_modification_plot(data: pd.DataFrame, condition: str, output_directory: Optional[pathlib.Path] = None):
     axis = sns.barplot(data=data, x=data.index, y="Percentage", color="tab:blue")
 
     #axis.set_title(f"Oxidation of methionine, proline, and histidine per position - {condition}", fontsize=19)
     axis.set_title(f"Dehydroalanine conversion of cysteine per position - {condition}", fontsize=19)
     axis.set_xlabel("Position", fontsize=17)
     axis.set_ylabel("Percentage\n(Modified hit count/Modifiable hit count)", fontsize=17)
+    label_heights: np.ndarray = draw_error_bars(axes=axis, data=data)
     for idx, p in enumerate(axis.patches):
         axis.annotate(
             f"{p.get_height()} %\n({int(data.iloc[idx]['ModifiedSpectra'])}/{int(data.iloc[idx]['TotalModSpectra'])})",
-            (p.get_x() + p.get_width() / 2., p.get_height()),
-            ha='center', va='center', fontsize=17, color='black', xytext=(0, 11),
+            (p.get_x() + p.get_width() / 2., label_heights[idx]),
+            ha='center', va='bottom', fontsize=17, color='black', xytext=(0, 3),
             textcoords='offset points')
 
     plt.subplots_adjust(left=0.04, bottom=0.08, right=0.97, top=0.95)
     plt.tick_params(axis='both', which='major', labelsize=14)
-    plt.show()
+    show_or_save_figure(figure=axis.figure, output_directory=output_directory, file_name=condition)
 
 
-def main():
+def main(figure_directory: Optional[pathlib.Path] = None, workers: Optional[int] = None, output_format: str = "xlsx"):
     file_directory: pathlib.Path = pathlib.Path(
         r"C:\Users\spec-makie17\Documents\Experiments\220425_Batches_PH22006\PeptideLists_Combined")
 
@@ -89,24 +100,29 @@ def main():
         ("Batch 18/06F - Flowthrough", pathlib.Path("CRT1806_Flowthrough.xlsx"))
     ]
 
-    with pd.ExcelWriter(file_directory / f"../Oxidations.xlsx") as writer:
+    # The figures are shown one at a time, or rendered concurrently to files if a figure directory is given
+    figure_jobs: list[tuple[str, Callable, dict]] = []
+    with open_result_sink(file_directory / "../Oxidations.xlsx", file_format=output_format) as sink:
         for cond, file in files:
-            df: pd.DataFrame = create_dataframe(file_path=file_directory / file)
+            df: pd.DataFrame = create_dataframe(file_path=file_directory / file, residues=RESIDUES,
+                                                 mass_change=MASS_CHANGE)
             if len(df) < 1:
                 continue
-            df.to_excel(writer, cond.replace("/", ""))
-            create_modification_plot(df, cond)
+            sink.write_table(df, name=cond.replace("/", ""))
+            if figure_directory is None:
+                create_modification_plot(df, cond)
+            else:
+                figure_jobs.append((cond, create_modification_plot,
+                                    {"data": df, "condition": cond, "output_directory": figure_directory}))
+
+    if figure_jobs:
+        render_figures(figure_jobs=figure_jobs, workers=workers)
 
 
 if __name__ == "__main__":
-    SEQUENCE: str = "EPAVYFKEQFLDGDGWTSRWIESKHKSDFGKFVLSSGKFYGDEEKDKGLQTSQDARFYALSASFEPFSNKGQTLVVQFTVKHEQNIDCGGGYVKLFP" + \
-                    "NSLDQTDMHGDSEYNIMFGPDICGPGTKKVHVIFNYKGKNVLINKDIRCKDDEFTHLYTLIVRPDNTYEVKIDNSQVESGSLEDDWDFLPPKKIKDP" + \
-                    "DASKPEDWDERAKIDDPTDSKPEDWDKPEHIPDPDAKKPEDWDEEMDGEWEPPVIQNPEYKGEWKPRQIDNPDYKGTWIHPEIDNPEYSPDPSIYAY" + \
-                    "DNFGVLGLDLWQVKSGTIFDNFLITNDEAYAEEFGNETWGVTKAAEKQMKDKQDEEQRLKEEEEDKKRKEEEEAEDKEDDEDKDEDEEDEEDKEEDEEEDVPGQAKDEL"
     #RESIDUES: str = "MPH"
     RESIDUES: str = "C"
     #MASS_CHANGE: str = "15.995"
     MASS_CHANGE: str = "-87.986"
-    RESIDUE_POSITIONS = [match.start() + 1 for match in re.finditer(f"[{RESIDUES}]", SEQUENCE)]
-    print(RESIDUE_POSITIONS)
+    print(list(get_residue_position_array("CRT", RESIDUES, mature=True)))
     main()
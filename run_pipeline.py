@@ -0,0 +1,4 @@
+from analysis_code.pipeline import main
+
+if __name__ == '__main__':
+    main()